@@ -0,0 +1,196 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import pytest
+import numpy as np
+import dask.array as da
+import xarray as xr
+from textory import statistics
+from textory.cache import LRUCache, diff_cache, neighbour_diff, result_cache
+from textory.textures import directional_variogram, variogram, variogram_estimators, window_statistic
+
+
+@pytest.fixture
+def init_np_arrays():
+    """Inits two random np arrays"""
+    np.random.seed(42)
+
+    n = 50
+
+    a1 = np.random.random((n, n)) * 157
+    a2 = np.random.random((n, n)) * 237
+
+    return a1.astype(np.float32), a2.astype(np.float32)
+
+
+def test_lru_cache():
+    """Tests eviction of least recently used values by size."""
+    cache = LRUCache(max_bytes=3 * 800)
+
+    for i in range(3):
+        cache.put(i, np.zeros(100))
+    assert cache.nbytes == 2400
+
+    #access makes 0 the most recently used value
+    assert cache.get(0) is not None
+    cache.put(3, np.zeros(100))
+
+    assert 1 not in cache
+    assert all(k in cache for k in [0, 2, 3])
+    assert cache.nbytes == 2400
+
+    #too large values are not stored
+    cache.put(4, np.zeros(1000))
+    assert 4 not in cache
+    assert len(cache) == 3
+
+
+def test_diff_cache(init_np_arrays):
+    """Tests reuse of difference fields across window sizes and geometries."""
+    a, _ = init_np_arrays
+
+    targets = [variogram(a, lag=2, win_size=7), variogram(a, lag=2, win_size=15, win_geom="round"),
+               variogram(a, lag=[1, 2], win_size=5)]
+
+    with diff_cache() as cache:
+        res = [variogram(a, lag=2, win_size=7), variogram(a.copy(), lag=2, win_size=15, win_geom="round"),
+               variogram(a, lag=[1, 2], win_size=5)]
+
+        assert cache.misses == 2
+        assert cache.hits == 2
+        assert len(cache) == 2
+
+    for r, t in zip(res, targets):
+        assert np.array_equal(r, t, equal_nan=True)
+
+    #estimators are cached separately
+    with diff_cache() as cache:
+        variogram_estimators(a, lag=[1, 3], win_size=5)
+        neighbour_diff(a, lag=1, func=("nd_variogram", "nd_madogram", "nd_rodogram"))
+        assert cache.hits == 1
+
+    #directional differences are cached per set of directions
+    target = directional_variogram(a, lag=2, win_size=7)
+    with diff_cache() as cache:
+        res = directional_variogram(a, lag=2, win_size=7)
+        directional_variogram(a, lag=2, win_size=9, win_geom="round")
+        directional_variogram(a, lag=2, win_size=7, directions=[0, 90])
+        variogram(a, lag=2, win_size=7)
+        assert cache.hits == 1
+        assert cache.misses == 3
+    assert np.array_equal(res, target, equal_nan=True)
+
+    #dask arrays bypass the cache and keep the fused graph
+    x = da.from_array(a, chunks=(25, 25))
+    with diff_cache() as cache:
+        r7 = variogram(x, lag=2, win_size=7)
+        r15 = variogram(x, lag=2, win_size=15, win_geom="round")
+        assert len(cache) == 0
+        assert len(r7.dask) == len(variogram(x, lag=2, win_size=7).dask)
+
+    assert np.allclose(r7, variogram(x, lag=2, win_size=7))
+    assert np.allclose(r15, variogram(x, lag=2, win_size=15, win_geom="round"))
+
+
+def test_result_cache(init_np_arrays):
+    """Tests the in memory tier of the result cache."""
+    a, _ = init_np_arrays
+    target = variogram(a, lag=2, win_size=7)
+
+    with result_cache() as cache:
+        res1 = variogram(a, lag=2, win_size=7)
+        res2 = variogram(a.copy(), 2, win_size=7)
+        res3 = variogram(a, lag=2, win_size=9)
+
+        assert res2 is res1
+        assert not res1.flags.writeable
+        assert cache.hits == 1
+        assert cache.misses == 2
+
+        #names are still created for xarray input
+        xa = xr.DataArray(a, dims=("y", "x"))
+        res = variogram(xa, lag=2, win_size=7)
+        assert res.name == "variogram_Input array_2_7_square"
+        assert cache.hits == 2
+
+        assert statistics.variogram(a, lag=1) == statistics.variogram(a, lag=1)
+        assert cache.hits == 3
+
+    assert np.array_equal(res1, target)
+    assert not np.array_equal(res3, target)
+
+
+def test_result_cache_key(init_np_arrays, monkeypatch):
+    """Tests the key and size of cached results."""
+    import textory
+    from concurrent.futures import ThreadPoolExecutor
+
+    a, _ = init_np_arrays
+
+    with result_cache() as cache, ThreadPoolExecutor(2) as pool, ThreadPoolExecutor(2) as other:
+        #execution only arguments are not part of the key
+        res = variogram(a, lag=2, n_jobs=2, executor=pool)
+        assert variogram(a, lag=2, n_jobs=2, executor=other) is res
+        assert variogram(a, lag=2, backend="numpy") is res
+        assert cache.hits == 2
+
+        #dictionaries count with all their values
+        est = variogram_estimators(a, lag=2)
+        assert cache.nbytes == res.nbytes + sum(v.nbytes for v in est.values())
+
+        #results of other versions are not used
+        monkeypatch.setattr(textory, "__version__", "0.0.0", raising=False)
+        variogram(a, lag=2)
+        assert cache.misses == 3
+
+    #dask results are persisted
+    x = da.from_array(a, chunks=(25, 25))
+    with result_cache() as cache:
+        res = variogram(x, lag=2)
+        assert len(res.dask) == 4
+        assert cache.nbytes == res.nbytes
+
+
+def test_result_cache_directory(init_np_arrays, tmp_path):
+    """Tests the directory tier of the result cache."""
+    a, _ = init_np_arrays
+    x = da.from_array(a, chunks=(25, 25))
+
+    targets = [window_statistic(a, stat="nanstd", win_size=5), variogram_estimators(x, lag=[1, 2]),
+               variogram(x, lag=1)]
+
+    with result_cache(directory=str(tmp_path)):
+        window_statistic(a, stat="nanstd", win_size=5)
+        variogram_estimators(x, lag=[1, 2])
+        res = variogram(x, lag=1)
+        assert isinstance(res, da.core.Array)
+
+    assert len(list(tmp_path.iterdir())) == 3
+
+    #later runs read the results from the directory
+    with result_cache(directory=str(tmp_path)) as cache:
+        res = [window_statistic(a, stat="nanstd", win_size=5), variogram_estimators(x, lag=[1, 2]),
+               variogram(x, lag=1)]
+        assert cache.disk_hits == 3
+
+    assert np.allclose(res[0], targets[0], equal_nan=True)
+    for k, v in res[1].items():
+        assert isinstance(v, da.core.Array)
+        assert np.allclose(v, targets[1][k])
+    assert res[2].chunks == x.chunks
+    assert np.allclose(res[2], targets[2])
+
+    cache.clear(directory=True)
+    assert len(list(tmp_path.iterdir())) == 0
+
+
+def test_result_cache_processes(init_np_arrays, tmp_path):
+    """Tests that strips calculated in worker processes are not cached separately."""
+    a, _ = init_np_arrays
+
+    with result_cache(directory=str(tmp_path)) as cache:
+        res = variogram(a, lag=1, win_size=5, n_jobs=3, executor="processes")
+        assert len(cache) == 1
+
+    assert len(list(tmp_path.iterdir())) == 1
+    assert np.allclose(res, variogram(a, lag=1, win_size=5))
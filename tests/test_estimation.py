@@ -0,0 +1,114 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import tracemalloc
+
+import pytest
+import numpy as np
+import dask.array as da
+from textory import textures
+from textory.estimation import estimate
+
+
+@pytest.fixture
+def init_np_arrays():
+    """Inits two random np arrays"""
+    np.random.seed(42)
+
+    n = 200
+
+    a1 = np.random.random((n, n)) * 157
+    a2 = np.random.random((n, n)) * 237
+
+    return a1.astype(np.float32), a2.astype(np.float32)
+
+
+def _measured_peak(fun, *arrays, **kwargs):
+    """Peak memory of the inputs and the calculation."""
+    #compiled backends (numba) allocate while compiling on the first call
+    fun(*arrays, **kwargs)
+
+    tracemalloc.start()
+    try:
+        fun(*arrays, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return peak + sum(a.nbytes for a in arrays)
+
+
+@pytest.mark.parametrize("texture,kwargs", [
+    ("variogram", {"lag": 2, "win_size": 7}),
+    ("variogram", {"lag": [1, 2], "win_size": [5, 9], "win_geom": "round"}),
+    ("variogram_estimators", {"lag": 1, "win_size": 5}),
+    ("cross_variogram", {"lag": 1, "win_size": 5}),
+    ("tpi", {"win_size": 7}),
+    ("window_statistic", {"stat": "nanmedian", "win_size": 5}),
+    ("window_statistic", {"stat": ["nanmean", "nanstd", "nanmax"], "win_size": 5}),
+])
+def test_estimate_peak_memory(init_np_arrays, texture, kwargs):
+    """Tests estimated peak memory against the traced peak memory of numpy arrays."""
+    arrays = init_np_arrays if texture == "cross_variogram" else init_np_arrays[:1]
+
+    measured = _measured_peak(getattr(textures, texture), *arrays, **kwargs)
+    est = estimate(texture, arrays[0].shape, arrays[0].dtype, **kwargs)
+
+    assert measured <= est["peak_memory"] <= 2.5 * measured
+    assert est["tasks"] == 0
+    assert est["input_bytes"] == sum(a.nbytes for a in arrays)
+
+
+@pytest.mark.parametrize("texture,kwargs", [
+    ("variogram", {"lag": 2, "win_size": 7}),
+    ("variogram_estimators", {"lag": [1, 2], "win_size": 5}),
+    ("pseudo_cross_variogram", {"lag": 1, "win_size": 5}),
+    ("tpi", {"win_size": 9, "win_geom": "round"}),
+    ("window_statistic", {"stat": ["nanmean", "nanmax"], "win_size": 5}),
+])
+def test_estimate_tasks(texture, kwargs):
+    """Tests task count and chunks against the graph of dask arrays."""
+    shape, chunks = (200, 300), (50, 100)
+    num_inputs = 2 if texture == "pseudo_cross_variogram" else 1
+    arrays = [da.zeros(shape, dtype=np.float32, chunks=chunks) for _ in range(num_inputs)]
+
+    res = getattr(textures, texture)(*arrays, **kwargs)
+    results = list(res.values()) if isinstance(res, dict) else [res]
+    est = estimate(texture, shape, np.float32, chunks=chunks, **kwargs)
+
+    keys = set()
+    for r in results:
+        keys.update(r.__dask_graph__().keys())
+
+    assert est["tasks"] == len(keys)
+    assert est["chunks"] == results[0].chunks[-2:]
+    assert est["result_bytes"] == sum(r.nbytes for r in results)
+
+
+def test_estimate_memory_budget():
+    """Tests that the estimated peak memory per task follows the memory budget."""
+    shape, chunks = (2000, 2000), (1000, 1000)
+
+    est = estimate("variogram", shape, chunks=chunks, lag=2, win_size=21)
+    est_budget = estimate("variogram", shape, chunks=chunks, lag=2, win_size=21, memory_budget="10MB")
+
+    assert est_budget["peak_memory"] <= 10e6 < est["peak_memory"]
+    assert est_budget["tasks"] > est["tasks"]
+    assert est_budget["result_bytes"] == est["result_bytes"] == 4 * 2000 * 2000
+
+
+def test_estimate_intermediate_bytes():
+    """Tests the components of the peak memory besides the inputs."""
+    shape = (1000, 1000)
+
+    est = estimate("variogram", shape, lag=[1, 2], win_size=15, method="sat")
+    assert set(est["intermediate_bytes"]) == {"difference_field", "window_sums", "scratch"}
+    assert est["intermediate_bytes"]["difference_field"] == 2 * 4 * 1000 * 1000
+    assert est["input_bytes"] + sum(est["intermediate_bytes"].values()) == est["peak_memory"]
+
+    #no difference field and no window sum scratch for the direct method
+    est_direct = estimate("variogram", shape, lag=[1, 2], win_size=15, method="direct")
+    assert set(est_direct["intermediate_bytes"]) == {"window_sums"}
+
+    est_stat = estimate("window_statistic", shape, stat=["nanmean", "nanmax"], chunks=(500, 500))
+    assert set(est_stat["intermediate_bytes"]) == {"results", "summed_area_tables", "extremum_buffers"}
@@ -79,3 +79,117 @@ def test_pseudo_cross_variogram(init_np_arrays):
     res = tmp / 40000
 
     assert pseudo_cross_variogram(a, b, lag=1) == res
+
+
+def test_variogram_chunked(init_np_arrays, tmp_path):
+    """Tests the chunk wise reductions of dask arrays and memmaps against numpy arrays."""
+    import dask.array as da
+
+    a, b = init_np_arrays
+    a[10, 10] = np.nan
+
+    path = str(tmp_path / "a.npy")
+    np.save(path, a)
+    m = np.load(path, mmap_mode="r")
+
+    for lag in [1, 3]:
+        target = variogram(a, lag=lag)
+        for chunks in [(25, 25), (17, 23), (2, 50)]:
+            res = variogram(da.from_array(a, chunks=chunks), lag=lag)
+            assert np.isclose(res.compute(), target)
+        assert np.isclose(variogram(m, lag=lag, memory_budget=2000), target)
+
+        target = pseudo_cross_variogram(a, b, lag=lag)
+        res = pseudo_cross_variogram(da.from_array(a, chunks=(17, 23)), da.from_array(b, chunks=(17, 23)), lag=lag)
+        assert np.isclose(res.compute(), target)
+
+
+def test_variogram_curve(init_np_arrays):
+    """Tests the variogram curve against single lags."""
+    import dask.array as da
+    from textory.statistics import variogram_curve, madogram_curve, cross_variogram_curve
+
+    a, b = init_np_arrays
+    a[10, 10] = np.nan
+
+    res = variogram_curve(a, lags=[1, 2, 5])
+    assert list(res["lags"]) == [1, 2, 5]
+    assert np.allclose(res["values"], [variogram(a, lag=lg) for lg in [1, 2, 5]])
+    #all pairs at lag 1 except the ones of the NaN pixel and its neighbours
+    assert res["counts"][0] == (48 * 48 * 8 + 4 * 48 * 5 + 4 * 3) - 9 * 8
+
+    res_dask = variogram_curve(da.from_array(a, chunks=(17, 23)), lags=[1, 2, 5])
+    assert np.allclose(res_dask["values"].compute(), res["values"])
+    assert np.array_equal(res_dask["counts"].compute(), res["counts"])
+
+    res = madogram_curve(a, lags=range(1, 4))
+    assert res["values"].shape == (3,)
+    res = cross_variogram_curve(a, b, lags=range(1, 4))
+    assert np.allclose(res["values"],
+                       cross_variogram_curve(da.from_array(a, chunks=20), da.from_array(b, chunks=20),
+                                             lags=range(1, 4))["values"].compute())
+
+
+def test_approx_variogram(init_np_arrays):
+    """Tests the sampled variogram against the exact one."""
+    import dask.array as da
+    from textory.statistics import approx_variogram
+
+    a, _ = init_np_arrays
+
+    target = variogram(a, lag=2)
+    res = approx_variogram(a, lag=2, num_samples=20000, seed=0)
+    assert res["num_samples"] == 20000
+    assert abs(res["value"] - target) < 4 * res["stderr"]
+
+    #dask arrays are only read in the sampled blocks and their halo
+    class Reads(object):
+        def __init__(self, a):
+            self.a, self.shape, self.dtype, self.ndim, self.reads = a, a.shape, a.dtype, a.ndim, 0
+
+        def __getitem__(self, key):
+            self.reads += 1
+            return self.a[key]
+
+    reads = Reads(a)
+    x = da.from_array(reads, chunks=(10, 10), asarray=False)
+    res_dask = approx_variogram(x, lag=2, num_samples=20000, seed=0, num_blocks=2)
+    assert 0 < reads.reads <= 2 * 9
+    assert res_dask["num_samples"] == 20000
+    assert approx_variogram(x, lag=2, num_samples=20000, seed=0, num_blocks=2) == res_dask
+
+    res_dask = approx_variogram(da.from_array(a, chunks=(10, 10)), lag=2, num_samples=20000, seed=0, num_blocks=50)
+    assert abs(res_dask["value"] - target) < 4 * res_dask["stderr"]
+
+    res = approx_variogram(a, lag=2, num_samples=1000, rtol=0.01, seed=0)
+    assert res["stderr"] <= 0.01 * res["value"]
+    assert res["num_samples"] % 1000 == 0
+
+
+def test_directional_variogram(init_np_arrays):
+    """Tests the global directional variogram."""
+    import dask.array as da
+    from textory.statistics import directional_variogram
+
+    a, _ = init_np_arrays
+    a = np.cumsum(a, axis=0)
+
+    res = directional_variogram(a, lag=1)
+    assert res.shape == (4,)
+    #the columns are random walks, so the variogram along them (direction 90) is the smallest
+    assert res[2] < res[0]
+    assert np.isclose(res.mean(), variogram(a, lag=1))
+    assert np.allclose(directional_variogram(da.from_array(a, chunks=(17, 23)), lag=1).compute(), res)
+
+
+def test_variogram_batch(init_np_arrays):
+    """Tests that each array of a (time, y, x) stack gets the variogram of the 2-D array."""
+    import dask.array as da
+
+    a, b = init_np_arrays
+    stack = np.stack([a, b])
+
+    res = variogram(stack, lag=2)
+    assert res.shape == (2,)
+    assert np.allclose(res, [variogram(a, lag=2), variogram(b, lag=2)])
+    assert np.allclose(variogram(da.from_array(stack, chunks=(1, 17, 23)), lag=2).compute(), res)
@@ -6,7 +6,9 @@ import numpy as np
 import dask.array as da
 import xarray as xr
 import decorator
-from textory.textures import variogram, rodogram, madogram, pseudo_cross_variogram, window_statistic, tpi
+import skimage as ski
+from textory.textures import (variogram, rodogram, madogram, pseudo_cross_variogram, cross_variogram,
+                              window_statistic, tpi, variogram_estimators)
 
 @pytest.fixture
 def init_np_arrays():
@@ -174,6 +176,91 @@ def test_rodogram_default_values_center(init_np_arrays):
     assert rodogram(a, lag=1, win_size=win_size, win_geom="square")[check_pixel_index, check_pixel_index] == res[check_pixel_index, check_pixel_index]
 
 
+def test_multi_lag(init_np_arrays):
+    """Tests that a list of lags gives the same results as single lags."""
+    a, b = init_np_arrays
+    lags = [1, 2, 3]
+
+    for fun in [variogram, madogram, rodogram]:
+        res = fun(a, lag=lags, win_size=7)
+        assert res.shape == (3, 50, 50)
+        for i, lag in enumerate(lags):
+            assert np.allclose(res[i], fun(a, lag=lag, win_size=7))
+
+    res = cross_variogram(a, b, lag=lags, win_size=7, win_geom="round")
+    for i, lag in enumerate(lags):
+        assert np.allclose(res[i], cross_variogram(a, b, lag=lag, win_size=7, win_geom="round"))
+
+    #dask
+    res = variogram(da.from_array(a, chunks=(20, 20)), lag=lags, win_size=7)
+    for i, lag in enumerate(lags):
+        assert np.allclose(res[i], variogram(da.from_array(a, chunks=(20, 20)), lag=lag, win_size=7))
+
+    #xarray
+    xa = xr.DataArray(a, dims=["y", "x"], attrs={"name": "a"})
+    res = variogram(xa, lag=lags, win_size=7)
+    assert res.dims == ("lag", "y", "x")
+    assert list(res.lag.values) == lags
+    assert res.name == "variogram_a_1-2-3_7_square"
+    assert np.allclose(res.sel(lag=2), variogram(a, lag=2, win_size=7))
+
+
+def test_multi_window(init_np_arrays):
+    """Tests that a list of window sizes gives the same results as single windows."""
+    a, _ = init_np_arrays
+    win_sizes = [3, 5, 9]
+
+    for win_geom in ["square", "round"]:
+        res = madogram(a, lag=1, win_size=win_sizes, win_geom=win_geom)
+        assert res.shape == (3, 50, 50)
+        for i, win_size in enumerate(win_sizes):
+            assert np.allclose(res[i], madogram(a, lag=1, win_size=win_size, win_geom=win_geom))
+
+        res = tpi(a, win_size=win_sizes, win_geom=win_geom)
+        for i, win_size in enumerate(win_sizes):
+            assert np.allclose(res[i], tpi(a, win_size=win_size, win_geom=win_geom))
+
+    #lags and windows
+    res = variogram(a, lag=[1, 2], win_size=win_sizes)
+    assert res.shape == (2, 3, 50, 50)
+    assert np.allclose(res[1, 2], variogram(a, lag=2, win_size=9))
+
+    #dask
+    res = variogram(da.from_array(a, chunks=(20, 20)), lag=[1, 2], win_size=win_sizes)
+    assert np.allclose(res[1, 2], variogram(da.from_array(a, chunks=(20, 20)), lag=2, win_size=9))
+
+    #xarray
+    xa = xr.DataArray(a, dims=["y", "x"], attrs={"name": "a"})
+    res = variogram(xa, lag=[1, 2], win_size=win_sizes)
+    assert res.dims == ("lag", "win_size", "y", "x")
+    assert list(res.win_size.values) == win_sizes
+
+
+def test_variogram_estimators(init_np_arrays):
+    """Tests that the fused estimators give the same results as the single textures."""
+    a, _ = init_np_arrays
+    single = {"variogram": variogram, "madogram": madogram, "rodogram": rodogram}
+
+    res = variogram_estimators(a, lag=2, win_size=7)
+    assert list(res.keys()) == ["variogram", "madogram", "rodogram"]
+    for name, fun in single.items():
+        assert np.allclose(res[name], fun(a, lag=2, win_size=7))
+
+    res = variogram_estimators(a, lag=[1, 2], win_size=9, win_geom="round", estimators=["rodogram", "variogram"])
+    assert res["variogram"].shape == (2, 50, 50)
+    assert np.allclose(res["rodogram"], rodogram(a, lag=[1, 2], win_size=9, win_geom="round"))
+
+    #dask
+    res = variogram_estimators(da.from_array(a, chunks=(20, 20)), lag=2, win_size=7)
+    for name, fun in single.items():
+        assert np.allclose(res[name], fun(da.from_array(a, chunks=(20, 20)), lag=2, win_size=7))
+
+    #xarray
+    xa = xr.DataArray(a, dims=["y", "x"], attrs={"name": "a"})
+    res = variogram_estimators(xa, lag=2, win_size=7)
+    assert res["madogram"].name == madogram(xa, lag=2, win_size=7).name
+
+
 def test_window_statistic_std(init_np_arrays):
     """Tests the window statistic for standard deviation."""
     a, _ = init_np_arrays
@@ -196,6 +283,176 @@ def test_window_statistic_std(init_np_arrays):
 
 
 
+def test_window_statistic_moments(init_np_arrays):
+    """Tests the statistics calculated from moving window sums against numpy on windowed views."""
+    a, _ = init_np_arrays
+    a[20:23, 30] = np.nan
+    a[0:5, 0:5] = np.nan
+
+    win_size = 7
+    pad = win_size // 2
+    padded = np.pad(a, pad, mode="constant", constant_values=np.nan)
+    windows = ski.util.view_as_windows(padded, (win_size, win_size))
+
+    targets = {"nanmean": np.nanmean(windows, axis=(2, 3)),
+               "nanstd": np.nanstd(windows, axis=(2, 3)),
+               "nanvar": np.nanvar(windows, axis=(2, 3)),
+               "nansum": np.nansum(windows, axis=(2, 3)),
+               "count": np.sum(~np.isnan(windows), axis=(2, 3))}
+
+    for stat, target in targets.items():
+        res = window_statistic(a, stat=stat, win_size=win_size)
+        assert np.allclose(res, target, equal_nan=True, rtol=1e-4)
+
+        #dask
+        res = window_statistic(da.from_array(a, chunks=(20, 20)), stat=stat, win_size=win_size)
+        assert np.allclose(res, target, equal_nan=True, rtol=1e-4)
+
+    res = window_statistic(a, stat="nanstd", win_size=win_size, ddof=1)
+    assert np.allclose(res, np.nanstd(windows, axis=(2, 3), ddof=1), equal_nan=True, rtol=1e-4)
+
+
+def test_window_statistic_extrema(init_np_arrays):
+    """Tests the running extrema against numpy on windowed views."""
+    a, _ = init_np_arrays
+    a[20:23, 30] = np.nan
+    a[0:5, 0:5] = np.nan
+
+    for win_size in [3, 7, 51]:
+        pad = win_size // 2
+        windows = ski.util.view_as_windows(np.pad(a, pad, mode="constant", constant_values=np.nan),
+                                           (win_size, win_size))
+
+        for stat in ["nanmax", "nanmin"]:
+            target = getattr(np, stat)(windows, axis=(2, 3))
+
+            res = window_statistic(a, stat=stat, win_size=win_size)
+            assert res.dtype == a.dtype
+            assert np.array_equal(res, target, equal_nan=True)
+
+            #dask
+            res = window_statistic(da.from_array(a, chunks=(25, 25)), stat=stat, win_size=win_size)
+            assert np.array_equal(res, target, equal_nan=True)
+
+    #integer input
+    b = (a[25:, 35:] * 10).astype(np.int16)
+    assert np.array_equal(window_statistic(b, stat="nanmax", win_size=5)[2:-2, 2:-2],
+                          ski.util.view_as_windows(b, (5, 5)).max(axis=(2, 3)))
+
+
+def test_window_statistic_quantiles(init_np_arrays):
+    """Tests the sliding window quantiles against numpy on windowed views."""
+    a, _ = init_np_arrays
+    a[20:23, 30] = np.nan
+    a[0:5, 0:5] = np.nan
+
+    for win_size in [3, 9]:
+        pad = win_size // 2
+        windows = ski.util.view_as_windows(np.pad(a, pad, mode="constant", constant_values=np.nan),
+                                           (win_size, win_size))
+
+        for stat, kwargs, q in [("nanmedian", {}, 50), ("nanpercentile", {"q": 90}, 90),
+                                ("nanquantile", {"q": 0.15}, 15)]:
+            target = np.nanpercentile(windows, q, axis=(2, 3))
+
+            res = window_statistic(a, stat=stat, win_size=win_size, **kwargs)
+            assert res.dtype == a.dtype
+            assert np.allclose(res, target, equal_nan=True)
+
+            #dask
+            res = window_statistic(da.from_array(a, chunks=(25, 25)), stat=stat, win_size=win_size, **kwargs)
+            assert np.allclose(res, target, equal_nan=True)
+
+    #integer input with small value range (histogram) and large value range
+    for factor in [0.1, 100]:
+        b = (a[25:, 35:] * factor).astype(np.int32)
+        target = np.percentile(ski.util.view_as_windows(b, (5, 5)), 30, axis=(2, 3))
+        res = window_statistic(b, stat="nanpercentile", win_size=5, q=30)
+        assert np.allclose(res[2:-2, 2:-2], target)
+
+    #floating point input with few distinct values and NaN (histogram)
+    c = np.round(a / 10)
+    windows = ski.util.view_as_windows(np.pad(c, 4, mode="constant", constant_values=np.nan), (9, 9))
+    res = window_statistic(c, stat="nanpercentile", win_size=9, q=30)
+    assert res.dtype == c.dtype
+    assert np.allclose(res, np.nanpercentile(windows, 30, axis=(2, 3)), equal_nan=True)
+
+    #percentile is forwarded and named for xarray input
+    xa = xr.DataArray(a, dims=("y", "x"))
+    res = window_statistic(xa, stat="nanpercentile", win_size=3, q=90)
+    assert res.name == "window_statistic_Input array_nanpercentile90_3"
+    assert np.allclose(res, np.nanpercentile(
+        ski.util.view_as_windows(np.pad(a, 1, mode="constant", constant_values=np.nan), (3, 3)),
+        90, axis=(2, 3)), equal_nan=True)
+
+
+def test_window_statistic_multi_stat(init_np_arrays):
+    """Tests several statistics in one pass against single statistics."""
+    a, _ = init_np_arrays
+    a[20:23, 30] = np.nan
+
+    stats = ["nanmean", "nanstd", "nanmax", "count", "nanpercentile", "nanmin"]
+    target = np.stack([window_statistic(a, stat=s, win_size=7, **({"q": 80} if s == "nanpercentile" else {}))
+                       for s in stats])
+
+    res = window_statistic(a, stat=stats, win_size=7, q=80)
+    assert res.shape == (len(stats),) + a.shape
+    assert np.allclose(res, target, equal_nan=True)
+
+    #dask
+    res = window_statistic(da.from_array(a, chunks=(25, 25)), stat=stats, win_size=7, q=80)
+    assert res.chunks[0] == (len(stats),)
+    assert np.allclose(res, target, equal_nan=True)
+
+    #dataset with one variable per statistic for xarray input
+    res = window_statistic(xr.DataArray(a, dims=("y", "x")), stat=stats, win_size=7, q=80)
+    assert isinstance(res, xr.Dataset)
+    assert list(res.data_vars) == ["window_statistic_Input array_{}_7".format(s) for s in
+                                   ["nanmean", "nanstd", "nanmax", "count", "nanpercentile80", "nanmin"]]
+    assert res["window_statistic_Input array_nanstd_7"].attrs["statistic"] == "nanstd"
+    assert np.allclose(res["window_statistic_Input array_nanstd_7"], target[1], equal_nan=True)
+
+
+def test_dask_fused_graph(init_np_arrays):
+    """Tests the fused dask graph against the separate difference and window sum stages."""
+    from textory.util import _dask_neighbour_diff_squared, window_sum
+
+    a, _ = init_np_arrays
+    a[10, 10] = np.nan
+
+    for chunks in [(25, 25), (17, 23)]:
+        x = da.from_array(a, chunks=chunks)
+        for lag, win_size, win_geom in [(1, 5, "square"), (2, 7, "round"), ([1, 3], [3, 9], "square")]:
+            diff = _dask_neighbour_diff_squared(x, lag=lag)
+            target = window_sum(diff, lag=lag, win_size=win_size, win_geom=win_geom)
+
+            res = variogram(x, lag=lag, win_size=win_size, win_geom=win_geom)
+            assert len(res.__dask_graph__()) < len(target.__dask_graph__())
+            assert np.allclose(res, target, equal_nan=True)
+
+
+@pytest.mark.parametrize("fun", [variogram, madogram, rodogram, pseudo_cross_variogram, cross_variogram])
+def test_direct_method(init_np_arrays, fun):
+    """Tests the direct kernel against the window sums of the full difference array."""
+    a, b = init_np_arrays
+    a[10, 10] = np.nan
+    args = (a, b) if "cross" in fun.__name__ else (a,)
+
+    for lag, win_size, win_geom in [(1, 5, "square"), (2, 7, "round"), ([1, 3], [3, 9], "square")]:
+        target = fun(*args, lag=lag, win_size=win_size, win_geom=win_geom)
+
+        res = fun(*args, lag=lag, win_size=win_size, win_geom=win_geom, method="direct")
+        assert res.shape == target.shape
+        assert np.allclose(res, target, rtol=1e-4, equal_nan=True)
+
+        res = fun(*[da.from_array(x, chunks=(17, 23)) for x in args], lag=lag, win_size=win_size,
+                  win_geom=win_geom, method="direct")
+        assert np.allclose(res, target, rtol=1e-4, equal_nan=True)
+
+    res = variogram_estimators(a, lag=2, win_size=7, method="direct")
+    assert np.allclose(res["rodogram"], rodogram(a, lag=2, win_size=7), rtol=1e-4, equal_nan=True)
+
+
 def test_tpi_default_values_center(init_np_arrays):
     a, _ = init_np_arrays
     tmp = a[23:28, 23:28].copy()
@@ -205,3 +462,102 @@ def test_tpi_default_values_center(init_np_arrays):
     res = tpi(a)
     print(target - a[25,25])
     assert np.allclose(res[25, 25], (target - a[25, 25]))
+
+
+def test_directional_variogram(init_np_arrays):
+    """Tests that the directions add up to the isotropic variogram."""
+    from textory.textures import directional_variogram
+    from textory.util import direction_offsets
+
+    a, _ = init_np_arrays
+    a = np.cumsum(a, axis=1)
+
+    res = directional_variogram(a, lag=2, win_size=7)
+    assert res.shape == (4, 50, 50)
+    #the rows are random walks, so the variogram along them (direction 0) is the smallest
+    assert np.all(res[0].mean() < res[1:].mean(axis=(1, 2)))
+
+    weights = np.array([len(g) for g in direction_offsets(2)])
+    assert np.allclose(np.tensordot(weights, res, axes=1) / weights.sum(), variogram(a, lag=2, win_size=7))
+
+    res_dask = directional_variogram(da.from_array(a, chunks=(17, 23)), lag=[1, 2], win_size=7,
+                                     directions=[0, 90])
+    assert res_dask.shape == (2, 2, 50, 50)
+    #dask reflects the array at its edges, so only the interior is the same
+    target = directional_variogram(a, lag=2, win_size=7, directions=[0, 90])
+    assert np.allclose(res_dask[1, :, 5:-5, 5:-5], target[:, 5:-5, 5:-5])
+
+    xa = xr.DataArray(a, dims=["y", "x"], attrs={"name": "a"})
+    assert list(directional_variogram(xa, lag=2).directions) == [0, 45, 90, 135]
+
+
+@pytest.mark.parametrize("win_geom", ["square", "round"])
+def test_directional_variogram_direct(init_np_arrays, win_geom):
+    """Tests that the direct method gives the directional variograms of the window sums."""
+    from textory.textures import directional_variogram
+
+    a, _ = init_np_arrays
+
+    res = directional_variogram(a, lag=[1, 2], win_size=[5, 7], win_geom=win_geom, method="direct")
+    target = directional_variogram(a, lag=[1, 2], win_size=[5, 7], win_geom=win_geom, method="convolve")
+    assert res.shape == (2, 2, 4, 50, 50)
+    assert np.allclose(res, target)
+
+    res_dask = directional_variogram(da.from_array(a, chunks=(17, 23)), lag=2, win_size=7, win_geom=win_geom,
+                                     method="direct", directions=[0, 90])
+    target = directional_variogram(a, lag=2, win_size=7, win_geom=win_geom, method="convolve", directions=[0, 90])
+    assert np.allclose(res_dask, target)
+
+
+@pytest.mark.parametrize("method", ["auto", "direct"])
+def test_batch_dimensions(init_np_arrays, method):
+    """Tests that each array of a (time, y, x) stack gets the texture of the 2-D array."""
+    a, b = init_np_arrays
+    stack = np.stack([a, b, a * b])
+
+    res = variogram(stack, lag=[1, 2], win_size=[5, 7], method=method)
+    assert res.shape == (2, 2, 3, 50, 50)
+    for t in range(3):
+        assert np.allclose(res[:, :, t], variogram(stack[t], lag=[1, 2], win_size=[5, 7], method=method))
+
+    res = variogram_estimators(stack, lag=2, method=method)
+    for est, values in res.items():
+        assert np.allclose(values[1], variogram_estimators(b, lag=2, method=method)[est])
+
+    res_dask = variogram(da.from_array(stack, chunks=(1, 17, 23)), lag=2, win_size=7, method=method)
+    #dask reflects the array at its edges, so only the interior is the same
+    assert np.allclose(res_dask[:, 5:-5, 5:-5], variogram(stack, lag=2, win_size=7)[:, 5:-5, 5:-5])
+
+    assert np.allclose(window_statistic(stack, stat="nanmedian")[2], window_statistic(a * b, stat="nanmedian"))
+
+    xa = xr.DataArray(stack, dims=["time", "y", "x"], attrs={"name": "a"})
+    assert variogram(xa, lag=[1, 2]).dims == ("lag", "time", "y", "x")
+
+
+@pytest.mark.parametrize("stat", ["nanmean", "count", "nanstd", "nanmedian", "nanmin",
+                                  ["nanmean", "count", "nanmax"]])
+def test_window_statistic_int_dask(stat):
+    """Tests the edges of window statistics of integer dask arrays against numpy arrays."""
+    np.random.seed(42)
+    a = np.random.randint(20, 100, (50, 50)).astype(np.int32)
+
+    target = window_statistic(a, stat=stat, win_size=5)
+    res = window_statistic(da.from_array(a, chunks=(17, 23)), stat=stat, win_size=5)
+
+    assert res.dtype == target.dtype
+    assert np.allclose(res, target)
+
+
+@pytest.mark.parametrize("stat", ["nanmedian", "nanmax", "nanprod", ["nanmean", "nanprod"]])
+def test_window_statistic_batch(init_np_arrays, stat):
+    """Tests window statistics of (time, y, x) stacks for numpy and chunked dask arrays."""
+    a, b = init_np_arrays
+    stack = np.stack([a, b, a * b])
+
+    res = window_statistic(stack, stat=stat, win_size=5)
+    for t in range(3):
+        assert np.allclose(res[..., t, :, :], window_statistic(stack[t], stat=stat, win_size=5), equal_nan=True)
+
+    #the halo is only added to the spatial axes
+    res_dask = window_statistic(da.from_array(stack, chunks=(1, 17, 23)), stat=stat, win_size=5)
+    assert np.allclose(res_dask, res, equal_nan=True)
@@ -0,0 +1,145 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+
+import pytest
+import numpy as np
+import dask.array as da
+from textory import textures
+from textory.tiling import strip_texture
+from textory.util import _strips
+
+
+@pytest.fixture
+def init_np_arrays():
+    """Inits two random np arrays"""
+    np.random.seed(42)
+
+    n = 50
+
+    a1 = np.random.random((n, n + 7)) * 157
+    a2 = np.random.random((n, n + 7)) * 237
+
+    return a1.astype(np.float32), a2.astype(np.float32)
+
+
+def test_strips():
+    """Tests rows of the strips extended by the halo."""
+    strips = list(_strips(10, 4, 2))
+
+    assert strips == [(0, 6, 0, 4), (2, 10, 4, 8), (6, 10, 8, 10)]
+
+
+@pytest.mark.parametrize("texture,kwargs", [
+    ("variogram", {"lag": 2, "win_size": 7}),
+    ("madogram", {"lag": [1, 3], "win_size": [3, 9], "win_geom": "round"}),
+    ("cross_variogram", {"lag": 1, "win_size": 5}),
+    ("tpi", {"win_size": 7}),
+    ("window_statistic", {"stat": ["nanmean", "nanmedian"], "win_size": 5}),
+])
+def test_strip_texture(init_np_arrays, texture, kwargs):
+    """Tests strip wise calculation against the whole array."""
+    a1, a2 = init_np_arrays
+    arrays = [a1, a2] if texture == "cross_variogram" else [a1]
+
+    expected = getattr(textures, texture)(*arrays, **kwargs)
+    res = strip_texture(texture, *arrays, strip_rows=6, **kwargs)
+
+    assert res.shape == expected.shape
+    assert np.allclose(res, expected, equal_nan=True)
+
+
+def test_strip_texture_memmap(init_np_arrays, tmp_path):
+    """Tests reading and writing memmaps and the memory budget."""
+    a1, _ = init_np_arrays
+    path = str(tmp_path / "x.npy")
+    np.save(path, a1)
+
+    expected = textures.variogram(a1, lag=2, win_size=5)
+
+    #budget for a strip of 10 rows including the halo
+    budget = 10 * a1.shape[1] * 64
+    res = strip_texture("variogram", path, out=str(tmp_path / "v.npy"), memory_budget=budget, lag=2, win_size=5)
+
+    assert isinstance(res, np.memmap)
+    assert np.allclose(np.load(str(tmp_path / "v.npy")), expected)
+
+    out = {"variogram": np.zeros_like(a1), "madogram": np.zeros_like(a1)}
+    strip_texture("variogram_estimators", np.load(path, mmap_mode="r"), out=out, strip_rows=8,
+                  estimators=["variogram", "madogram"])
+    expected = textures.variogram_estimators(a1, estimators=["variogram", "madogram"])
+
+    for k in out:
+        assert np.allclose(out[k], expected[k])
+
+
+@pytest.mark.parametrize("texture,kwargs", [
+    ("variogram", {"lag": [1, 2], "win_size": 7}),
+    ("pseudo_cross_variogram", {"lag": 2, "win_size": 9, "win_geom": "round"}),
+    ("variogram_estimators", {"lag": 1, "win_size": 5}),
+    ("tpi", {"win_size": [3, 7]}),
+    ("window_statistic", {"stat": "nanpercentile", "win_size": 5, "q": 90}),
+])
+def test_tile_parallel(init_np_arrays, texture, kwargs):
+    """Tests parallel calculation in strips on threads and processes against the serial calculation."""
+    a1, a2 = init_np_arrays
+    arrays = [a1, a2] if "cross" in texture else [a1]
+    fun = getattr(textures, texture)
+
+    expected = fun(*arrays, **kwargs)
+    res = fun(*arrays, n_jobs=4, **kwargs)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        res_executor = fun(*arrays, executor=executor, **kwargs)
+
+    res_processes = fun(*arrays, n_jobs=2, executor="processes", **kwargs)
+
+    #named pools are created once and reused
+    from textory.util import _shared_pool
+    assert _shared_pool("processes", 2) is _shared_pool("processes", 2)
+
+    for r in [res, res_executor, res_processes]:
+        if isinstance(expected, dict):
+            assert all(np.allclose(r[k], expected[k]) for k in expected)
+        else:
+            assert r.shape == expected.shape
+            assert np.allclose(r, expected, equal_nan=True)
+
+
+def test_shutdown_pools(init_np_arrays, monkeypatch):
+    """Tests the bound on the shared pools and shutting them down."""
+    from textory import util
+
+    a1, _ = init_np_arrays
+    monkeypatch.setattr(util, "MAX_POOLS", 2)
+    util.shutdown_pools()
+
+    pools = [util._shared_pool("threads", n) for n in [1, 2, 3]]
+    #the least recently used pool is shut down
+    assert list(util._POOLS.values()) == pools[1:]
+    with pytest.raises(RuntimeError):
+        pools[0].submit(abs, 1)
+
+    res = textures.variogram(a1, n_jobs=2, executor="processes")
+    assert len(util._POOLS) == 2
+
+    util.shutdown_pools()
+    assert len(util._POOLS) == 0
+    for pool in pools[1:]:
+        with pytest.raises(RuntimeError):
+            pool.submit(abs, 1)
+
+    #later calls start new pools
+    assert np.allclose(textures.variogram(a1, n_jobs=2, executor="processes"), res)
+
+
+def test_tile_parallel_dask(init_np_arrays):
+    """Tests that dask arrays are passed on unchanged."""
+    a1, _ = init_np_arrays
+    x = da.from_array(a1, chunks=(25, 25))
+
+    res = textures.variogram(x, n_jobs=4)
+
+    assert isinstance(res, da.core.Array)
+    assert np.allclose(res.compute(), textures.variogram(x).compute())
@@ -4,8 +4,10 @@
 import pytest
 import numpy as np
 import xarray as xr
+import dask.array as da
+from scipy.ndimage import convolve
 from textory.util import neighbour_diff_squared, num_neighbours, neighbour_count, create_kernel,\
-convolution, xr_wrapper
+convolution, xr_wrapper, box_sum, integral_image
 
 @pytest.fixture
 def init_np_arrays():
@@ -171,6 +173,94 @@ def test_convolution(init_np_arrays):
     assert res[25,25] == np.sum(a[24:27, 24:27] / 9)
 
 
+def test_integral_image(init_np_arrays):
+    a, _ = init_np_arrays
+
+    sat = integral_image(a)
+
+    assert sat.shape == (51, 51)
+    assert np.allclose(sat[-1, -1], np.sum(a, dtype=np.float64))
+    assert np.allclose(sat[11, 21], np.sum(a[:11, :21], dtype=np.float64))
+
+
+def test_box_sum(init_np_arrays):
+    a, _ = init_np_arrays
+    a[10, 10] = np.nan
+
+    for win_size in [3, 5, 31]:
+        target = convolve(a, np.ones((win_size, win_size)), mode="constant", cval=0.0)
+
+        res = box_sum(a, win_size=win_size)
+        assert res.dtype == a.dtype
+        assert np.allclose(res, target, equal_nan=True)
+
+        #dask
+        res = box_sum(da.from_array(a, chunks=(20, 20)), win_size=win_size)
+        assert np.allclose(res, target, equal_nan=True)
+
+
+def test_box_sum_multi_window(init_np_arrays):
+    a, _ = init_np_arrays
+
+    res = box_sum(a, win_size=[3, 7, 11])
+    assert res.shape == (3, 50, 50)
+    assert np.allclose(res[1], box_sum(a, win_size=7))
+
+    res = box_sum(da.from_array(a, chunks=(20, 20)), win_size=[3, 7, 11])
+    assert np.allclose(res[2], box_sum(a, win_size=11))
+
+
+def test_convolution_methods(init_np_arrays):
+    a, _ = init_np_arrays
+
+    res_sat = convolution(a, win_size=7, method="sat")
+    res_conv = convolution(a, win_size=7, method="convolve")
+    assert np.allclose(res_sat, res_conv)
+
+    with pytest.raises(ValueError):
+        convolution(a, win_size=7, win_geom="round", method="sat")
+
+
+def test_convolution_fft(init_np_arrays):
+    a, _ = init_np_arrays
+    a[30, 12] = np.nan
+
+    for win_geom in ["square", "round"]:
+        target = convolution(a, win_size=11, win_geom=win_geom, method="convolve")
+
+        res = convolution(a, win_size=11, win_geom=win_geom, method="fft")
+        assert res.dtype == target.dtype
+        assert np.allclose(res, target, equal_nan=True)
+
+        #dask
+        res = convolution(da.from_array(a, chunks=(20, 20)), win_size=11, win_geom=win_geom, method="fft")
+        assert np.allclose(res, target, equal_nan=True)
+
+    #integer input
+    b = (a[:20, :20] * 0).astype(np.int32) + np.arange(20, dtype=np.int32)
+    custom_kernel = create_kernel(n=9, geom="round")
+    assert np.array_equal(convolution(b, kernel=custom_kernel, method="fft"),
+                          convolution(b, kernel=custom_kernel, method="convolve"))
+
+
+def test_convolution_fft_nonnegative():
+    """Tests that FFT window sums of float32 differences around a flat region are not negative."""
+    from textory.textures import variogram, rodogram
+
+    np.random.seed(0)
+    a = (np.random.random((200, 200)) * 1000).astype(np.float32)
+    a[50:150, 50:150] = 7
+
+    for func in [variogram, rodogram]:
+        for win_geom in ["square", "round"]:
+            res = func(a, lag=1, win_size=15, win_geom=win_geom, method="fft")
+            target = func(a, lag=1, win_size=15, win_geom=win_geom, method="convolve")
+            assert res.dtype == np.float32
+            assert res.min() >= 0
+            assert np.allclose(res, target, rtol=1e-5, atol=1e-3)
+            assert np.allclose(res[70:130, 70:130], 0, atol=1e-6)
+
+
 def test_xr_wrapper(init_np_arrays):
     
     a, b = init_np_arrays
@@ -221,3 +311,109 @@ def test_xr_wrapper(init_np_arrays):
     assert res.attrs["window_size"] == 5
     assert res.attrs["first_attr"] == "test_1"
     assert res.attrs["second_attr"] == "test_2"
+
+
+def test_budget_rechunk():
+    """Tests rechunking of dask arrays to a memory budget per task."""
+    import dask
+    from textory.util import _budget_rechunk
+    from textory.textures import variogram, window_statistic
+
+    np.random.seed(42)
+    a = np.random.random((200, 200)).astype(np.float32)
+    x = da.from_array(a, chunks=(200, 200))
+
+    #no budget or enough budget leaves the chunks alone
+    assert _budget_rechunk(x, depth=5, bytes_per_element=8) is x
+    assert _budget_rechunk(x, depth=5, bytes_per_element=8, memory_budget="1GB") is x
+
+    res = _budget_rechunk(x, depth=5, bytes_per_element=8, memory_budget=10**5)
+    assert (max(res.chunks[0]) + 10) * (max(res.chunks[1]) + 10) * 8 <= 10**5
+    assert max(res.chunks[0]) - min(res.chunks[0]) <= 1
+
+    target = variogram(x, lag=2, win_size=15)
+    res = variogram(x, lag=2, win_size=15, memory_budget="1MB")
+    assert res.numblocks != target.numblocks
+    assert np.allclose(res, target)
+
+    with dask.config.set({"textory.memory_budget": "200kB"}):
+        res = window_statistic(x, stat="nanmax", win_size=7)
+    assert res.numblocks != (1, 1)
+    assert np.allclose(res, window_statistic(a, stat="nanmax", win_size=7), equal_nan=True)
+
+
+@pytest.mark.parametrize("func", ["nd_variogram", "nd_madogram", "nd_rodogram", "nd_cross_variogram"])
+def test_neighbour_diff_backends(init_np_arrays, func):
+    from textory import util
+    from textory.backends import BACKENDS
+
+    a, b = init_np_arrays
+
+    rows, cols = a.shape
+    method = getattr(util, func)
+    expected = np.zeros((2,) + a.shape, dtype=a.dtype)
+    for i, l in enumerate([1, 2]):
+        for y_off, x_off in util.ring_offsets(l):
+            view_in, view_out = util.view(y_off, x_off, rows, cols)
+            if func == "nd_cross_variogram":
+                expected[i][view_out] += method(a[view_out], b[view_in], a[view_in], b[view_out])
+            else:
+                expected[i][view_out] += method(a[view_out], b[view_in])
+
+    for backend in BACKENDS:
+        res = neighbour_diff_squared(a, b, lag=[1, 2], func=func, backend=backend)
+        assert np.allclose(res, expected, rtol=1e-5)
+
+        #integer inputs give float results
+        res = neighbour_diff_squared(a.astype(np.int64), b.astype(np.int64), lag=1, func=func, backend=backend)
+        assert res.dtype == np.float64
+
+
+def test_neighbour_diff_estimators_backends(init_np_arrays):
+    from textory.backends import BACKENDS
+    from textory.util import neighbour_diff_estimators
+
+    a, _ = init_np_arrays
+    funcs = ["nd_rodogram", "nd_variogram"]
+
+    expected = np.stack([neighbour_diff_squared(a, lag=[1, 2], func=f, backend="numpy") for f in funcs])
+    for backend in BACKENDS:
+        res = neighbour_diff_estimators(a, lag=[1, 2], funcs=funcs, backend=backend)
+        assert np.allclose(res, expected, rtol=1e-5)
+
+        res = neighbour_diff_estimators(a.astype(np.int64), lag=1, funcs=funcs, backend=backend)
+        assert res.dtype == np.float64
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16])
+def test_backends_unsigned(dtype):
+    """Tests that all backends take the differences of unsigned integers without wraparound."""
+    from textory.backends import BACKENDS
+    from textory.util import neighbour_diff_estimators
+
+    np.random.seed(42)
+    a = (np.random.randint(0, 80, (30, 40)) * 3).astype(dtype)
+    b = np.random.randint(0, 80, (30, 40)).astype(dtype)
+    funcs = ["nd_variogram", "nd_madogram", "nd_rodogram"]
+
+    expected = {f: neighbour_diff_squared(a.astype(np.float64), lag=[1, 2], func=f, backend="numpy")
+                for f in funcs}
+    expected_cross = neighbour_diff_squared(a.astype(np.float64), b.astype(np.float64), lag=1,
+                                            func="nd_cross_variogram", backend="numpy")
+
+    for backend in BACKENDS:
+        for f in funcs:
+            assert np.allclose(neighbour_diff_squared(a, lag=[1, 2], func=f, backend=backend), expected[f])
+        res = neighbour_diff_estimators(a, lag=[1, 2], funcs=funcs, backend=backend)
+        assert np.allclose(res, np.stack([expected[f] for f in funcs]))
+        res = neighbour_diff_squared(a, b, lag=1, func="nd_cross_variogram", backend=backend)
+        assert np.allclose(res, expected_cross)
+
+
+def test_backend_fallback():
+    from textory.backends import backend_name, BACKENDS
+
+    assert backend_name("auto") in BACKENDS
+    assert backend_name("numpy") == "numpy"
+    with pytest.warns(UserWarning):
+        assert backend_name("not_a_backend") == "numpy"
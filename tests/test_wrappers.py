@@ -0,0 +1,99 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import pytest
+import numpy as np
+import dask.array as da
+import xarray as xr
+import textory.textures as txt
+from textory.wrappers import plan_textures, textures_for_xr_dataset
+
+
+@pytest.fixture
+def init_xr_dataset():
+    """Inits dataset with three random dask arrays"""
+    np.random.seed(42)
+
+    n = 50
+
+    ds = xr.Dataset()
+    for name, factor in [("IR_039", 157), ("IR_108", 237), ("WV_062", 89)]:
+        data = (np.random.random((n, n)) * factor).astype(np.float32)
+        ds[name] = xr.DataArray(da.from_array(data, chunks=(25, 25)), dims=("y", "x"), attrs={"name": name})
+
+    return ds
+
+
+TEXTURES = {("variogram", 2, 7, "square"): ["IR_039", "IR_108"],
+            ("variogram", 1, 5, "square"): ["IR_039"],
+            ("madogram", 3, 5, "square"): ["IR_039"],
+            ("rodogram", 1, 5, "round"): ["IR_039"],
+            ("cross_variogram", 1, 5, "round"): [("WV_062", "IR_108")],
+            ("cross_variogram", 2, 5, "round"): [("WV_062", "IR_108")],
+            ("window_statistic", "nanmean", 5): ["IR_039"],
+            ("window_statistic", "nanmax", 5): ["IR_039"],
+            ("tpi", 1, 5, "square"): ["IR_108"]}
+
+
+def test_plan_textures():
+    """Tests grouping of textures sharing work."""
+    plan = plan_textures(TEXTURES)
+
+    group = plan[("variogram_estimators", "IR_039", "square", 2, (7,))]
+    assert group["names"] == {"variogram"}
+    assert len(group["requests"]) == 1
+
+    group = plan[("cross_variogram", ("WV_062", "IR_108"), "round", 1, 5)]
+    assert group["lags"] == {1}
+
+    group = plan[("window_statistic", "IR_039", 5)]
+    assert group["names"] == {"nanmean", "nanmax"}
+
+    assert len(plan) == 9
+
+    #only estimators with the same window sizes are calculated together
+    plan = plan_textures({("variogram", 2, 5, "square"): ["a"], ("variogram", 2, 7, "square"): ["a"],
+                          ("madogram", 2, 5, "square"): ["a"], ("madogram", 2, 7, "square"): ["a"],
+                          ("rodogram", 2, 5, "square"): ["a"]})
+
+    group = plan[("variogram_estimators", "a", "square", 2, (5, 7))]
+    assert group["names"] == {"variogram", "madogram"}
+    assert group["win_sizes"] == {5, 7}
+    assert len(group["requests"]) == 4
+    assert plan[("variogram_estimators", "a", "square", 2, (5,))]["names"] == {"rodogram"}
+    assert len(plan) == 2
+
+
+def test_textures_for_xr_dataset(init_xr_dataset):
+    """Tests planned textures against separate texture calls."""
+    ds = init_xr_dataset
+
+    res = textures_for_xr_dataset(ds, TEXTURES, append=False)
+
+    for tex, bands in TEXTURES.items():
+        fun = getattr(txt, tex[0])
+        for b in bands:
+            if tex[0] == "window_statistic":
+                target = fun(ds[b], stat=tex[1], win_size=tex[2])
+            elif tex[0] == "cross_variogram":
+                target = fun(ds[b[0]], ds[b[1]], lag=tex[1], win_size=tex[2], win_geom=tex[3])
+            else:
+                target = fun(ds[b], lag=tex[1], win_size=tex[2], win_geom=tex[3])
+
+            assert target.name in res
+            assert res[target.name].attrs == target.attrs
+            np.testing.assert_allclose(res[target.name], target, rtol=1e-5, atol=1e-5)
+
+    assert len(res.data_vars) == 10
+
+
+@pytest.mark.parametrize("executor", ["threads", "processes"])
+def test_textures_for_xr_dataset_parallel(init_xr_dataset, executor):
+    """Tests parallel calculation of numpy input against the serial calculation."""
+    ds = init_xr_dataset.compute()
+
+    expected = textures_for_xr_dataset(ds, TEXTURES, append=False)
+    res = textures_for_xr_dataset(ds, TEXTURES, append=False, n_jobs=2, executor=executor)
+
+    for name in expected.data_vars:
+        np.testing.assert_allclose(res[name], expected[name], rtol=1e-5, atol=1e-5)
@@ -6,5 +6,8 @@ except DistributionNotFound:
     pass
 
 
-from textory import textures, statistics
+from textory import backends, cache, textures, statistics, tiling
 from textory.wrappers import textures_for_scene
+from textory.estimation import estimate
+
+__all__ = ["backends", "cache", "textures", "statistics", "tiling", "textures_for_scene", "estimate"]
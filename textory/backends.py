@@ -0,0 +1,259 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Compute backends of the innermost steps of the variogram family
+
+The differences between each pixel and its neighbours
+(:func:`~textory.util.neighbour_diff_squared`) are accumulated by a kernel for
+each innermost step ("nd_variogram", "nd_madogram", "nd_rodogram" and
+"nd_cross_variogram"). The "nd_estimators" kernel accumulates several of the
+variogram, madogram and rodogram from one difference per neighbour
+(:func:`~textory.util.neighbour_diff_estimators`). All kernels add the result for
+one neighbour offset straight into the output array. Available backends are
+
+- "numba" (if installed): one compiled fused loop,
+- "numexpr" (if installed): one multithreaded expression evaluated into the output,
+- "numpy": numpy operations writing into a scratch array and the output.
+
+The backend is selected with the `backend` keyword argument of the textures or the
+"textory.backend" dask config, "auto" (default) takes the first available backend of
+:data:`BACKEND_PREFERENCE`. Requested backends which are not installed fall back to
+"numpy" with a warning. The backend used is stored in the "backend" attribute of
+:class:`xarray.DataArray` results.
+
+.. code-block:: python
+
+    import dask
+    import textory as tx
+
+    with dask.config.set({"textory.backend": "numexpr"}):
+        res = tx.textures.variogram(x, lag=2, win_size=7)
+
+Further backends can be added with :func:`register_backend`.
+"""
+import warnings
+
+import dask
+import numpy as np
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+#kernels of all registered backends
+BACKENDS = {}
+#order in which "auto" selects the backend
+BACKEND_PREFERENCE = ["numba", "numexpr", "numpy"]
+
+
+def register_backend(name, kernels):
+    """
+    Register a compute backend.
+
+    Parameters
+    ----------
+    name : str
+        Name of the backend.
+    kernels : dict
+        Names of the innermost steps (e.g. "nd_variogram") as keys and kernels as values.
+        A kernel is called as ``kernel(out, x, y, work)`` (``kernel(out, x1, y2, x2, y1, work)``
+        for "nd_cross_variogram") and adds the result of the innermost step to `out` in place.
+        `work` are scratch arrays of the shape and dtype of `out` stacked along a new first
+        axis (two for "nd_cross_variogram", one otherwise) the kernel may use.
+        The inputs may be (unsigned) integer arrays while `out` is always a float array, so
+        the differences have to be taken in a float dtype.
+
+        The optional "nd_estimators" kernel is called as ``kernel(out, x, y, work, index)``
+        with the estimators stacked along the first axis of `out`, two scratch arrays in
+        `work` and the rows of `out` of the variogram, madogram and rodogram in `index`
+        (-1 for estimators which are not calculated). Backends without it use the one
+        of the numpy backend.
+    """
+    BACKENDS[name] = kernels
+
+
+def backend_name(backend=None):
+    """
+    Name of the backend used for `backend`.
+
+    Parameters
+    ----------
+    backend : str, optional
+        Requested backend, defaults to the "textory.backend" dask config or "auto".
+
+    Returns
+    -------
+    str
+    """
+    if backend is None:
+        backend = dask.config.get("textory.backend", "auto")
+
+    if backend == "auto":
+        return next(b for b in BACKEND_PREFERENCE if b in BACKENDS)
+
+    if backend not in BACKENDS:
+        warnings.warn("Backend {} is not available, using numpy.".format(backend))
+        return "numpy"
+
+    return backend
+
+
+def get_kernel(func, backend=None):
+    """
+    Kernel of an innermost step, None if the backend has none for it.
+
+    Parameters
+    ----------
+    func : str
+        Name of the innermost step, e.g. "nd_variogram".
+    backend : str, optional
+        See :func:`backend_name`.
+    """
+    return BACKENDS[backend_name(backend)].get(func)
+
+
+def _np_variogram(out, x, y, work):
+    w = np.subtract(x, y, out=work[0], dtype=work[0].dtype)
+    np.square(w, out=w)
+    np.add(out, w, out=out)
+
+
+def _np_madogram(out, x, y, work):
+    w = np.subtract(x, y, out=work[0], dtype=work[0].dtype)
+    np.abs(w, out=w)
+    np.add(out, w, out=out)
+
+
+def _np_rodogram(out, x, y, work):
+    w = np.subtract(x, y, out=work[0], dtype=work[0].dtype)
+    np.abs(w, out=w)
+    np.sqrt(w, out=w)
+    np.add(out, w, out=out)
+
+
+def _np_cross_variogram(out, x1, y2, x2, y1, work):
+    w = np.subtract(x1, x2, out=work[0], dtype=work[0].dtype)
+    np.multiply(w, np.subtract(y1, y2, out=work[1], dtype=work[1].dtype), out=w)
+    np.add(out, w, out=out)
+
+
+def _np_estimators(out, x, y, work, index):
+    vario, mad, rod = index
+    w = np.subtract(x, y, out=work[0], dtype=work[0].dtype)
+    if vario >= 0:
+        np.add(out[vario], np.square(w, out=work[1]), out=out[vario])
+    if mad >= 0 or rod >= 0:
+        np.abs(w, out=w)
+        if mad >= 0:
+            np.add(out[mad], w, out=out[mad])
+        if rod >= 0:
+            np.add(out[rod], np.sqrt(w, out=work[1]), out=out[rod])
+
+
+register_backend("numpy", {"nd_variogram": _np_variogram,
+                           "nd_madogram": _np_madogram,
+                           "nd_rodogram": _np_rodogram,
+                           "nd_cross_variogram": _np_cross_variogram,
+                           "nd_estimators": _np_estimators})
+
+
+def _numexpr_kernel(expression):
+    """
+    Kernel evaluating `expression` of the output and the inputs into the output.
+    """
+    def kernel(out, *args):
+        names = ["x1", "y2", "x2", "y1"] if len(args) == 5 else ["x", "y"]
+        local_dict = dict(zip(names, args), out=out)
+        numexpr.evaluate(expression, local_dict=local_dict, out=out, casting="same_kind")
+
+    return kernel
+
+
+def _numexpr_estimators(out, x, y, work, index):
+    #the absolute difference is evaluated once and read by all estimators
+    w = work[0]
+    numexpr.evaluate("abs(x - y)", local_dict={"x": x, "y": y}, out=w, casting="same_kind")
+    for row, expression in zip(index, ["out + w**2", "out + w", "out + sqrt(w)"]):
+        if row >= 0:
+            numexpr.evaluate(expression, local_dict={"out": out[row], "w": w}, out=out[row], casting="same_kind")
+
+
+if numexpr is not None:
+    register_backend("numexpr", {"nd_variogram": _numexpr_kernel("out + (x - y)**2"),
+                                 "nd_madogram": _numexpr_kernel("out + abs(x - y)"),
+                                 "nd_rodogram": _numexpr_kernel("out + sqrt(abs(x - y))"),
+                                 "nd_cross_variogram": _numexpr_kernel("out + (x1 - x2) * (y1 - y2)"),
+                                 "nd_estimators": _numexpr_estimators})
+
+
+if numba is not None:
+    def _nb_variogram(out, x, y, work):
+        for i in range(out.shape[0]):
+            for j in range(out.shape[1]):
+                d = float(x[i, j]) - float(y[i, j])
+                out[i, j] += d * d
+
+    def _nb_madogram(out, x, y, work):
+        for i in range(out.shape[0]):
+            for j in range(out.shape[1]):
+                out[i, j] += abs(float(x[i, j]) - float(y[i, j]))
+
+    def _nb_rodogram(out, x, y, work):
+        for i in range(out.shape[0]):
+            for j in range(out.shape[1]):
+                out[i, j] += np.sqrt(abs(float(x[i, j]) - float(y[i, j])))
+
+    def _nb_cross_variogram(out, x1, y2, x2, y1, work):
+        for i in range(out.shape[0]):
+            for j in range(out.shape[1]):
+                out[i, j] += (float(x1[i, j]) - float(x2[i, j])) * (float(y1[i, j]) - float(y2[i, j]))
+
+    def _nb_estimators(out, x, y, work, index):
+        vario, mad, rod = index[0], index[1], index[2]
+        for i in range(x.shape[0]):
+            for j in range(x.shape[1]):
+                d = float(x[i, j]) - float(y[i, j])
+                if vario >= 0:
+                    out[vario, i, j] += d * d
+                a = abs(d)
+                if mad >= 0:
+                    out[mad, i, j] += a
+                if rod >= 0:
+                    out[rod, i, j] += np.sqrt(a)
+
+    def _nb_kernel(func, stacked=False):
+        """
+        Kernel of a compiled 2-D numba loop looping over the leading (batch) axes of the arrays.
+
+        The loops are serial, textures run in parallel over dask blocks or `n_jobs` strips.
+        The numba threading layers are not all safe for calls from several threads or
+        in forked processes. `stacked` kernels ("nd_estimators") have the estimators
+        stacked in front of the output.
+        """
+        compiled = numba.njit(cache=True)(func)
+
+        def kernel(out, *args):
+            if args[0].ndim == 2:
+                return compiled(out, *args)
+
+            for i in np.ndindex(args[0].shape[:-2]):
+                if stacked:
+                    x, y, work, index = args
+                    compiled(out[(slice(None),) + i], x[i], y[i], work[(slice(None),) + i], index)
+                else:
+                    *arrays, work = args
+                    compiled(out[i], *[a[i] for a in arrays], work[(slice(None),) + i])
+
+        return kernel
+
+    register_backend("numba", {"nd_variogram": _nb_kernel(_nb_variogram),
+                               "nd_madogram": _nb_kernel(_nb_madogram),
+                               "nd_rodogram": _nb_kernel(_nb_rodogram),
+                               "nd_cross_variogram": _nb_kernel(_nb_cross_variogram),
+                               "nd_estimators": _nb_kernel(_nb_estimators, stacked=True)})
@@ -0,0 +1,533 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Caches for intermediate results
+
+Difference fields
+-----------------
+
+Textures with the same input, lag and estimator but different window sizes or
+geometries share the differences between each pixel and its neighbours. Inside a
+:func:`diff_cache` context these difference fields are calculated once and read
+from a cache afterwards. Inputs are identified by their dask token
+(:func:`dask.base.tokenize`), which for numpy arrays is a hash of the data.
+
+.. code-block:: python
+
+    import textory as tx
+
+    with tx.cache.diff_cache(max_bytes=2**30):
+        v7 = tx.textures.variogram(x, lag=2, win_size=7)
+        v15 = tx.textures.variogram(x, lag=2, win_size=15, win_geom="round")
+
+The cache keeps the least recently used difference fields until they take more
+than `max_bytes`. Dask arrays bypass the cache, their textures calculate the
+differences and window sums in one fused task per block and a lazy difference
+field would only add tasks to the graph.
+
+Results
+-------
+
+Inside a :func:`result_cache` context the results of all functions in
+:mod:`textory.textures` and :mod:`textory.statistics` are cached, keyed by the hash
+(or dask token) of the inputs, all parameters and the textory version. Parameters which
+only change how a result is calculated (`n_jobs`, `executor`, `backend` and `memory_budget`)
+are not part of the key. Repeated calls return the cached result instead of calculating it again.
+
+.. code-block:: python
+
+    with tx.cache.result_cache(max_bytes=2**30, directory="/tmp/textory_cache"):
+        v = tx.textures.variogram(x, lag=2, win_size=7)
+
+The least recently used results are kept in memory until they take more than
+`max_bytes`. Dask results are persisted when they are stored, so they are computed
+only once. If a `directory` is given all results are also written there as ``.npy``
+(``.npz`` for dictionaries of results) files and read from there when they are not in
+memory, also by later runs. Dask results are then computed when they are stored and
+returned as dask arrays reading from the file. Cached numpy results are read-only.
+"""
+import collections
+import contextlib
+import functools
+import inspect
+import os
+import threading
+import uuid
+
+import dask
+import dask.array as da
+import decorator
+import numpy as np
+from dask.base import tokenize
+
+import textory
+
+from .util import (_as_lags, _dask_neighbour_diff_squared, _halo_map_blocks,
+                   _stacked_estimator_diff, neighbour_diff_directional, neighbour_diff_squared)
+
+
+class LRUCache(object):
+    """
+    Least recently used cache bounded by the number of bytes of its values.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Maximum number of bytes of all values in the cache, defaults to 256 MiB.
+        Values larger than that are not stored.
+
+    The cache can be used from several threads (e.g. textures calculated with `n_jobs`).
+    """
+
+    def __init__(self, max_bytes=2**28):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._sizes = {}
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """
+        Get value of key and mark it as most recently used.
+        """
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self._data.move_to_end(key)
+
+            return self._data[key]
+
+    def put(self, key, value):
+        """
+        Store value under key and evict the least recently used values if the cache is full.
+        """
+        nbytes = _nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            self.pop(key)
+
+            self._data[key] = value
+            self._sizes[key] = nbytes
+            self.nbytes += nbytes
+
+            while self.nbytes > self.max_bytes:
+                self.pop(next(iter(self._data)))
+
+    def pop(self, key):
+        """
+        Remove key from the cache.
+        """
+        with self._lock:
+            if key in self._data:
+                del self._data[key]
+                self.nbytes -= self._sizes.pop(key)
+
+    def clear(self):
+        """
+        Remove all values from the cache.
+        """
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.nbytes = 0
+
+
+def _nbytes(value):
+    """
+    Memory held by a value (the sum of its values for dictionaries), dask arrays count as computed.
+    """
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+
+    return getattr(value, "nbytes", 0)
+
+
+#difference field cache used by the textures, None if caching is not active
+_DIFF_CACHE = None
+
+
+@contextlib.contextmanager
+def diff_cache(max_bytes=2**28):
+    """
+    Context manager activating the difference field cache.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Maximum number of bytes of all cached difference fields, defaults to 256 MiB.
+
+    Yields
+    ------
+    LRUCache
+        The active cache.
+    """
+    global _DIFF_CACHE
+
+    previous = _DIFF_CACHE
+    _DIFF_CACHE = LRUCache(max_bytes=max_bytes)
+    try:
+        yield _DIFF_CACHE
+    finally:
+        _DIFF_CACHE = previous
+
+
+def diff_cache_active():
+    """
+    Tell if the difference field cache is active.
+    """
+    return _DIFF_CACHE is not None
+
+
+def _diff_field(x, y=None, lag=1, func="nd_variogram", backend=None, directions=None):
+    """
+    Calculate the difference field for numpy or dask arrays.
+    """
+    if directions is not None:
+        pdiff = functools.partial(neighbour_diff_directional, lag=lag, directions=directions, func=func,
+                                  backend=backend)
+        if isinstance(x, da.core.Array):
+            lags = _as_lags(lag)
+            new_axes = (len(lags), len(directions)) if np.ndim(lag) > 0 else (len(directions),)
+            dtype = x.dtype if np.issubdtype(x.dtype, np.floating) else np.float64
+            return _halo_map_blocks(pdiff, x, depth=max(lags), boundary="reflect", new_axes=new_axes,
+                                    dtype=dtype)
+        return pdiff(x)
+
+    if not isinstance(func, tuple):
+        if isinstance(x, da.core.Array):
+            return _dask_neighbour_diff_squared(x, y, lag=lag, func=func, backend=backend)
+        return neighbour_diff_squared(x, y, lag=lag, func=func, backend=backend)
+
+    pdiff = functools.partial(_stacked_estimator_diff, lag=lag, funcs=func, backend=backend)
+
+    if isinstance(x, da.core.Array):
+        lags = _as_lags(lag)
+        new_axes = (len(lags), len(func)) if np.ndim(lag) > 0 else (len(func),)
+        dtype = x.dtype if np.issubdtype(x.dtype, np.floating) else np.float64
+        return _halo_map_blocks(pdiff, x, depth=max(lags), boundary="reflect", new_axes=new_axes, dtype=dtype)
+
+    return pdiff(x)
+
+
+def neighbour_diff(x, y=None, lag=1, func="nd_variogram", backend=None, directions=None):
+    """
+    Calculate the neighbour differences of the textures using the difference field cache.
+
+    Without active cache (see :func:`diff_cache`) or for dask arrays the differences are
+    just calculated. Otherwise the difference field of each lag is read from the cache or
+    calculated and stored in the cache.
+
+    Parameters
+    ----------
+    x : array like
+    y : array like, optional
+        Defaults to None
+    lag : int or list of int, optional
+        If a list of lags is given the difference fields are stacked along a new first axis.
+    func : str or tuple of str
+        Innermost step of the texture (see :func:`~textory.util.neighbour_diff_squared`),
+        or a tuple of them for the estimators of :func:`~textory.textures.variogram_estimators`
+        which are stacked after the lag axis (if any).
+    backend : str, optional
+        Compute backend, see :mod:`textory.backends`.
+    directions : list of float, optional
+        Differences of each direction for :func:`~textory.textures.directional_variogram`
+        (see :func:`~textory.util.neighbour_diff_directional`), stacked after the lag axis (if any).
+
+    Returns
+    -------
+    array like
+    """
+    cache = _DIFF_CACHE
+
+    if cache is None or isinstance(x, da.core.Array):
+        return _diff_field(x, y, lag=lag, func=func, backend=backend, directions=directions)
+
+    token = tokenize(x, y)
+    if directions is not None:
+        directions = tuple(directions)
+
+    fields = []
+    for lg in _as_lags(lag):
+        key = ("neighbour_diff", token, lg, func, directions)
+        field = cache.get(key)
+        if field is None:
+            field = _diff_field(x, y, lag=lg, func=func, backend=backend, directions=directions)
+            cache.put(key, field)
+        fields.append(field)
+
+    if np.ndim(lag) == 0:
+        return fields[0]
+
+    return _stack(fields)
+
+
+def _stack(fields):
+    """
+    Stack numpy or dask arrays along a new first axis.
+    """
+    if isinstance(fields[0], da.core.Array):
+        return da.stack(fields)
+
+    return np.stack(fields)
+
+
+class ResultCache(LRUCache):
+    """
+    Least recently used cache of results bounded by bytes with an optional directory tier.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Maximum number of bytes of the results kept in memory, defaults to 256 MiB.
+    directory : str, optional
+        Directory where all results are written to and read from if they are
+        not in memory. By default results are only kept in memory.
+    """
+
+    def __init__(self, max_bytes=2**28, directory=None):
+        super(ResultCache, self).__init__(max_bytes=max_bytes)
+        self.directory = directory
+        self.disk_hits = 0
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, "{}{}".format(key, ext))
+
+    def get(self, key, default=None, chunks=None):
+        """
+        Get result of key from memory or the directory.
+
+        Parameters
+        ----------
+        key : str
+        default : optional
+            Returned if the result is not in the cache.
+        chunks : tuple, optional
+            Chunks of the spatial axes of the input if results are dask arrays.
+        """
+        value = super(ResultCache, self).get(key)
+        if value is not None or self.directory is None:
+            return default if value is None else value
+
+        for ext in [".npy", ".npz"]:
+            path = self._path(key, ext)
+            if os.path.exists(path):
+                value = _load(path, chunks)
+                self.disk_hits += 1
+                super(ResultCache, self).put(key, value)
+                return value
+
+        return default
+
+    def put(self, key, value):
+        """
+        Store result under key.
+
+        Returns
+        -------
+        The result to hand out, for dask results stored in the directory a dask
+        array reading from the file.
+        """
+        _set_read_only(value)
+
+        if self.directory is not None:
+            chunks = _spatial_chunks(value)
+            ext = ".npz" if isinstance(value, dict) else ".npy"
+            path = self._path(key, ext)
+
+            #write to temporary file first so other runs never read incomplete files
+            tmp = self._path("{}-{}".format(key, uuid.uuid4().hex), ext)
+            _save(tmp, value)
+            os.replace(tmp, path)
+
+            if chunks is not None:
+                value = _load(path, chunks)
+        elif _spatial_chunks(value) is not None and _nbytes(value) <= self.max_bytes:
+            value = _persist(value)
+
+        super(ResultCache, self).put(key, value)
+
+        return value
+
+    def clear(self, directory=False):
+        """
+        Remove all results from memory and, if `directory` is `True`, from the directory.
+        """
+        super(ResultCache, self).clear()
+
+        if directory and self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith((".npy", ".npz")):
+                    os.remove(os.path.join(self.directory, name))
+
+
+def _set_read_only(value):
+    """
+    Make cached numpy results read-only so they can be handed out several times.
+    """
+    values = value.values() if isinstance(value, dict) else [value]
+    for v in values:
+        if isinstance(v, np.ndarray):
+            v.flags.writeable = False
+
+
+def _spatial_chunks(value):
+    """
+    Chunks of the last two axes of dask results, None for numpy results.
+    """
+    values = list(value.values()) if isinstance(value, dict) else [value]
+    if isinstance(values[0], da.core.Array) and values[0].ndim >= 2:
+        return values[0].chunks[-2:]
+    if isinstance(values[0], da.core.Array):
+        return ()
+
+    return None
+
+
+def _persist(value):
+    """
+    Persist dask results (or dictionaries of them) so the cached result is computed only once.
+    """
+    if isinstance(value, dict):
+        return dict(zip(value, dask.persist(*value.values())))
+
+    return value.persist()
+
+
+def _save(path, value):
+    """
+    Write result to a npy (array) or npz (dictionary of arrays) file computing dask results.
+    """
+    if isinstance(value, dict):
+        names = list(value)
+        arrays = da.compute(*[value[n] for n in names])
+        with open(path, "wb") as f:
+            np.savez(f, **dict(zip(names, arrays)))
+    elif isinstance(value, da.core.Array):
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=value.dtype, shape=value.shape)
+        da.store(value, out)
+        out.flush()
+        del out
+    else:
+        with open(path, "wb") as f:
+            np.save(f, np.asarray(value))
+
+
+def _as_result(array, chunks):
+    """
+    Numpy result (scalar for 0-d arrays) or dask array reading from it if `chunks` are given.
+    """
+    if chunks is None:
+        array = np.array(array)
+        array.flags.writeable = False
+        return array[()] if array.ndim == 0 else array
+
+    if array.ndim >= 2 and array.shape[-2:] == tuple(sum(c) for c in chunks):
+        return da.from_array(array, chunks=tuple((n,) for n in array.shape[:-2]) + tuple(chunks))
+
+    return da.from_array(array, chunks=array.shape)
+
+
+def _load(path, chunks=None):
+    """
+    Read result written by :func:`_save`.
+    """
+    if path.endswith(".npz"):
+        with np.load(path) as f:
+            return {k: _as_result(f[k], chunks) for k in f.files}
+
+    array = np.load(path, mmap_mode="r" if chunks is not None else None)
+
+    return _as_result(array, chunks)
+
+
+#result cache used by the textures and statistics, None if caching is not active
+_RESULT_CACHE = None
+
+
+@contextlib.contextmanager
+def result_cache(max_bytes=2**28, directory=None):
+    """
+    Context manager activating the result cache.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Maximum number of bytes of the results kept in memory, defaults to 256 MiB.
+    directory : str, optional
+        Directory for the on disk tier of the cache.
+
+    Yields
+    ------
+    ResultCache
+        The active cache.
+    """
+    global _RESULT_CACHE
+
+    previous = _RESULT_CACHE
+    _RESULT_CACHE = ResultCache(max_bytes=max_bytes, directory=directory)
+    try:
+        yield _RESULT_CACHE
+    finally:
+        _RESULT_CACHE = previous
+
+
+#keyword arguments which change how but not what is calculated
+EXECUTION_KWARGS = ("n_jobs", "executor", "backend", "memory_budget")
+
+
+def _result_key(fun, args, kwargs):
+    """
+    Dask token of the function, its arguments without `EXECUTION_KWARGS` and the textory version.
+    """
+    bound = inspect.signature(fun).bind(*args, **kwargs)
+    bound.apply_defaults()
+
+    params = {}
+    for name, value in bound.arguments.items():
+        if bound.signature.parameters[name].kind == inspect.Parameter.VAR_KEYWORD:
+            params.update(value)
+        else:
+            params[name] = value
+
+    params = {k: v for k, v in params.items() if k not in EXECUTION_KWARGS}
+
+    return tokenize(fun.__module__, fun.__name__, params, getattr(textory, "__version__", None))
+
+
+@decorator.decorator
+def cached_result(fun, *args, **kwargs):
+    """Decorator caching results of functions taking numpy or dask arrays in the active result cache.
+
+    The key is the dask token of the function name, all arguments except the ones
+    which only change how the result is calculated (see `EXECUTION_KWARGS`) and the
+    textory version. For numpy arrays the token is a hash of the data.
+    """
+    cache = _RESULT_CACHE
+    if cache is None:
+        return fun(*args, **kwargs)
+
+    key = _result_key(fun, args, kwargs)
+    chunks = args[0].chunks[-2:] if isinstance(args[0], da.core.Array) else None
+
+    res = cache.get(key, chunks=chunks)
+    if res is None:
+        res = cache.put(key, fun(*args, **kwargs))
+
+    return res
@@ -0,0 +1,168 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Estimation of the resources textures need
+
+With :func:`estimate` the peak memory, the size of the inputs and results and
+the number of dask tasks of a texture can be estimated before calculating it,
+e.g. to check if a job fits on a worker.
+
+.. code-block:: python
+
+    import textory as tx
+
+    est = tx.estimate("variogram", shape=(10000, 10000), dtype="float32",
+                      chunks=(2000, 2000), lag=2, win_size=15)
+    est["peak_memory"], est["tasks"]
+
+The task count is taken from the graph the texture builds for an empty dask
+array, so it follows the actual algorithm (including rechunking to a memory
+budget). The peak memory is calculated with the same memory model as the
+memory budget of the textures.
+"""
+import inspect
+
+import dask.array as da
+import numpy as np
+
+from . import textures as txt
+from .util import _as_lags, _as_win_sizes, _stat_terms, _window_texture_terms
+
+#textures of two input arrays
+CROSS_TEXTURES = ["cross_variogram", "pseudo_cross_variogram"]
+
+
+def estimate(texture, shape, dtype="float32", chunks=None, lag=1, win_size=5, win_geom="square", method="auto",
+             stat="nanmean", estimators=("variogram", "madogram", "rodogram"), directions=(0, 45, 90, 135),
+             memory_budget=None):
+    """
+    Estimate peak memory, array sizes and number of dask tasks of a texture.
+
+    Parameters
+    ----------
+    texture : str
+        Name of the texture in :mod:`textory.textures`.
+    shape : tuple of int
+        Shape of the input array(s).
+    dtype : np.dtype or str, optional
+        Data type of the input array(s), defaults to float32.
+    chunks : tuple, optional
+        Chunks of dask input arrays. By default the estimate is made for numpy arrays.
+    lag : int or list of int, optional
+    win_size : int or list of int, optional
+    win_geom : {"square", "round"}
+    method : {"auto", "sat", "fft", "convolve", "direct"}
+    stat : str or list of str, optional
+        Statistic(s) of :func:`~textory.textures.window_statistic`.
+    estimators : list of str, optional
+        Estimators of :func:`~textory.textures.variogram_estimators`.
+    directions : list of float, optional
+        Directions of :func:`~textory.textures.directional_variogram`.
+    memory_budget : int or str, optional
+        Memory budget per task of the texture, defaults to the "textory.memory_budget" dask config.
+
+    Returns
+    -------
+    dict
+        "peak_memory"
+            Estimated peak memory in bytes of one task (of the whole calculation for numpy arrays).
+        "input_bytes"
+            Size of the input array(s) in bytes.
+        "result_bytes"
+            Size of the result(s) in bytes.
+        "intermediate_bytes"
+            Components of the peak memory besides the inputs in bytes (on the same scale as
+            "peak_memory"), e.g. "difference_field", "window_sums" and the "scratch" arrays of
+            the window sum method for the textures of the variogram family.
+        "tasks"
+            Number of tasks of the dask graph, 0 for numpy arrays.
+        "chunks"
+            Chunks of the spatial axes of the result, None for numpy arrays.
+    """
+    dtype = np.dtype(dtype)
+    itemsize = dtype.itemsize
+    size = int(np.prod(shape))
+    out_itemsize = itemsize if np.issubdtype(dtype, np.floating) else 8
+
+    model = _texture_model(texture, itemsize, lag=lag, win_size=win_size, win_geom=win_geom, method=method,
+                           stat=stat, estimators=estimators, directions=directions)
+    num_inputs, depth, terms, num_results, params = model
+    bytes_per_element = sum(terms.values())
+    intermediate = {name: nbytes for name, nbytes in terms.items() if name != "inputs"}
+
+    res = {"input_bytes": num_inputs * size * itemsize,
+           "result_bytes": num_results * size * out_itemsize}
+
+    if chunks is None:
+        res.update({"peak_memory": int(size * bytes_per_element), "tasks": 0, "chunks": None,
+                    "intermediate_bytes": {name: int(size * nbytes) for name, nbytes in intermediate.items()}})
+        return res
+
+    #build the graph of the undecorated texture for empty arrays
+    fun = inspect.unwrap(getattr(txt, texture))
+    arrays = [da.empty(shape, dtype=dtype, chunks=chunks) for _ in range(num_inputs)]
+    out = fun(*arrays, memory_budget=memory_budget, **params)
+
+    results = list(out.values()) if isinstance(out, dict) else [out]
+    keys = set()
+    for r in results:
+        keys.update(r.__dask_graph__().keys())
+
+    out_chunks = results[0].chunks[-2:]
+    lead = int(np.prod([max(c) for c in arrays[0].chunks[:-2]]))
+    block = (max(out_chunks[0]) + 2 * depth) * (max(out_chunks[1]) + 2 * depth)
+
+    res.update({"peak_memory": int(lead * block * bytes_per_element), "tasks": len(keys), "chunks": out_chunks,
+                "intermediate_bytes": {name: int(lead * block * nbytes) for name, nbytes in intermediate.items()}})
+
+    return res
+
+
+def _texture_model(texture, itemsize, lag=1, win_size=5, win_geom="square", method="auto", stat="nanmean",
+                   estimators=("variogram", "madogram", "rodogram"), directions=(0, 45, 90, 135)):
+    """
+    Memory model of a texture.
+
+    Returns
+    -------
+    tuple
+        Number of input arrays, halo depth, estimated peak memory per element by component
+        (a dict, see :func:`~textory.util._window_texture_terms`), number of results per element
+        and the parameters to call the texture with.
+    """
+    num_inputs = 2 if texture in CROSS_TEXTURES else 1
+
+    if texture == "window_statistic":
+        stats = list(np.atleast_1d(stat))
+        depth = int(win_size // 2)
+        terms = _stat_terms(stats, win_size, itemsize)
+        num_results = len(stats)
+        params = {"stat": stat if np.ndim(stat) == 0 else stats, "win_size": win_size}
+    elif texture == "tpi":
+        win_sizes = _as_win_sizes(win_size)
+        depth = int(max(win_sizes) // 2)
+        #square windows always use the summed-area table
+        tpi_method = "sat" if win_geom == "square" and method == "auto" else method
+        terms = _window_texture_terms(itemsize, 1, 1, len(win_sizes), method=tpi_method, win_geom=win_geom,
+                                      win_size=max(win_sizes))
+        num_results = len(win_sizes)
+        params = {"win_size": win_size, "win_geom": win_geom, "method": method}
+    else:
+        lags = _as_lags(lag)
+        win_sizes = _as_win_sizes(win_size)
+        num_est = 1
+        if texture == "variogram_estimators":
+            num_est = len(estimators)
+        elif texture == "directional_variogram":
+            num_est = len(directions)
+        depth = max(lags) + int(max(win_sizes) // 2)
+        terms = _window_texture_terms(itemsize, num_inputs, len(lags) * num_est, len(win_sizes), method=method,
+                                      win_geom=win_geom, win_size=max(win_sizes))
+        num_results = len(lags) * len(win_sizes) * num_est
+        params = {"lag": lag, "win_size": win_size, "win_geom": win_geom, "method": method}
+        if texture == "variogram_estimators":
+            params["estimators"] = estimators
+        elif texture == "directional_variogram":
+            params["directions"] = directions
+
+    return num_inputs, depth, terms, num_results, params
@@ -1,41 +1,233 @@
 #! /usr/bin/python
 # -*- coding: utf-8 -*-
+import functools
+
 import numpy as np
 import dask.array as da
 
-from .util import num_neighbours, neighbour_diff_squared, _dask_neighbour_diff_squared
+from . import util
+from .cache import cached_result
+from .util import (_as_lags, _block_edges, _budget_rechunk, _memory_budget, _spatial_axes, _strips,
+                   direction_offsets, num_neighbours, ring_offsets)
 
 #TODO
 # - add stats for rodogram, madogram, cross variogram
 
+#memory for the strips of memmaps if there is no memory budget
+STRIP_MEMORY_BUDGET = 2**28
+
+
+def _pair_sums(arr1, arr2=None, lags=(1,), func="nd_variogram", inner=None, directions=None):
+    """
+    Sum of the innermost steps of all pixel pairs at the specified lags whose first
+    pixel lies in the `inner` region of the arrays and the number of valid pairs.
+
+    As for :func:`~textory.util.neighbour_diff_squared` the steps are summed for each
+    pixel first, pixels with non finite sums are left out. Besides the inputs only
+    arrays of the size of the region are needed.
+
+    Parameters
+    ----------
+    arr1 : np.array
+    arr2 : np.array, optional
+    lags : list of int, optional
+    func : {nd_variogram, nd_madogram, nd_rodogram, nd_cross_variogram}
+    inner : tuple of int, optional
+        First and last (exclusive) row and column of the region. Defaults to the whole array.
+    directions : list of float, optional
+        Sum the pairs of each direction separately (see :func:`~textory.util.direction_offsets`).
+
+    Returns
+    -------
+    np.array
+        Sum and number of pairs (last axis) for each lag and direction (a single one
+        without `directions`), after the leading (batch) axes of the arrays.
+    """
+    method = getattr(util, func)
+
+    if arr2 is None:
+        arr2 = arr1
+
+    lead = arr1.shape[:-2]
+    rows, cols = arr1.shape[-2:]
+    r0, r1, c0, c1 = inner if inner is not None else (0, rows, 0, cols)
+
+    num_groups = 1 if directions is None else len(directions)
+    res = np.zeros(lead + (len(lags), num_groups, 2), dtype=np.float64)
+    acc = np.empty(lead + (r1 - r0, c1 - c0), dtype=arr1.dtype)
+    pairs = np.empty(acc.shape, dtype=np.int64)
+    for i, lag in enumerate(lags):
+        groups = [ring_offsets(lag)] if directions is None else direction_offsets(lag, directions)
+        for g, group in enumerate(groups):
+            res[..., i, g, :] = _group_pair_sums(arr1, arr2, group, method, func, (r0, r1, c0, c1), acc, pairs)
+
+    return res
+
+
+def _group_pair_sums(arr1, arr2, offsets, method, func, inner, acc, pairs):
+    """
+    Sum and number of valid pairs of :func:`_pair_sums` for one group of neighbour offsets.
+    """
+    rows, cols = arr1.shape[-2:]
+    r0, r1, c0, c1 = inner
+
+    acc[...] = 0
+    pairs[...] = 0
+    for y_off, x_off in offsets:
+        #first pixels whose partner lies in the arrays
+        y0, y1 = max(r0, -y_off), min(r1, rows - y_off)
+        x0, x1 = max(c0, -x_off), min(c1, cols - x_off)
+        if y0 >= y1 or x0 >= x1:
+            continue
+
+        first = np.s_[..., y0:y1, x0:x1]
+        second = np.s_[..., y0 + y_off:y1 + y_off, x0 + x_off:x1 + x_off]
+        if func == "nd_cross_variogram":
+            d = method(arr1[first], arr2[second], arr1[second], arr2[first])
+        else:
+            d = method(arr1[first], arr2[second])
+
+        region = np.s_[..., y0 - r0:y1 - r0, x0 - c0:x1 - c0]
+        acc[region] += d
+        pairs[region] += 1
+
+    valid = np.isfinite(acc)
+
+    return np.stack([np.nansum(acc, axis=(-2, -1)), np.sum(np.where(valid, pairs, 0), axis=(-2, -1))], axis=-1)
+
+
+def _block_pair_sums(*blocks, lags=(1,), func="nd_variogram", directions=None, block_info=None):
+    """
+    :func:`_pair_sums` of the pairs whose first pixel lies in a block extended by a halo.
+
+    The halo is only there if the block does not lie on that edge of the array.
+    """
+    top, bottom, left, right = _block_edges(block_info)
+    rows, cols = blocks[0].shape[-2:]
+    depth = max(lags)
+    inner = (0 if top else depth, rows if bottom else rows - depth,
+             0 if left else depth, cols if right else cols - depth)
+
+    res = _pair_sums(*blocks, lags=lags, func=func, inner=inner, directions=directions)
+
+    #one element along the block axes of the spatial axes
+    return res[..., np.newaxis, np.newaxis, :, :, :]
+
+
+def _dask_pair_sums(x, y=None, lags=(1,), func="nd_variogram", directions=None, memory_budget=None):
+    """
+    :func:`_pair_sums` of dask arrays as a tree reduction of the sums of each block.
+
+    Each block is extended by the largest lag from its neighbours and read once for all
+    lags, so the pairs across block borders are counted exactly once and pairs leaving
+    the array are not counted.
+    """
+    arrays = [x] if y is None else [x, y]
+    lag = max(lags)
+
+    x = _budget_rechunk(x, depth=lag, bytes_per_element=x.dtype.itemsize * len(arrays) + 24,
+                        memory_budget=memory_budget)
+    if any(min(c) < lag for c in x.chunks[-2:]):
+        x = x.rechunk(x.chunks[:-2] + tuple(da.overlap.ensure_minimum_chunksize(lag, c) for c in x.chunks[-2:]))
+    arrays = [x] + [a.rechunk(x.chunks) for a in arrays[1:]]
+
+    ndim = x.ndim
+    arrays = [da.overlap.overlap(a, depth=_spatial_axes(ndim, lag), boundary=_spatial_axes(ndim, "none"))
+              for a in arrays]
+
+    #the batch axes keep their chunks, the spatial axes get one element per block
+    num_groups = 1 if directions is None else len(directions)
+    spatial = tuple((1,) * len(c) for c in x.chunks[-2:])
+    chunks = x.chunks[:-2] + spatial + ((len(lags),), (num_groups,), (2,))
+    psums = functools.partial(_block_pair_sums, lags=lags, func=func, directions=directions)
+    parts = da.map_blocks(psums, *arrays, chunks=chunks, new_axis=[ndim, ndim + 1, ndim + 2], dtype=np.float64)
+
+    return parts.sum(axis=(ndim - 2, ndim - 1))
+
+
+def _strip_pair_sums(x, y=None, lags=(1,), func="nd_variogram", directions=None, memory_budget=None):
+    """
+    :func:`_pair_sums` of (memory mapped) numpy arrays read in horizontal strips.
+
+    Each strip is read once for all lags.
+    """
+    arrays = [x] if y is None else [x, y]
+    lag = max(lags)
+    rows, cols = x.shape[-2:]
+
+    budget = _memory_budget(memory_budget) or STRIP_MEMORY_BUDGET
+    bytes_per_element = x.dtype.itemsize * len(arrays) + 24
+    strip_rows = max(int(budget // (bytes_per_element * cols * np.prod(x.shape[:-2]))) - 2 * lag, 1)
+
+    res = 0
+    for read_start, read_stop, start, stop in _strips(rows, strip_rows, lag):
+        strips = [np.asarray(a[..., read_start:read_stop, :]) for a in arrays]
+        inner = (start - read_start, stop - read_start, 0, cols)
+        res = res + _pair_sums(*strips, lags=lags, func=func, inner=inner, directions=directions)
+
+    return res
+
+
+def _diff_sums(x, y=None, lag=1, func="nd_variogram", directions=None, memory_budget=None):
+    """
+    Sum over all pixels of the innermost steps of the pairs at the specified lag(s)
+    and the number of valid pairs.
+
+    Dask arrays are reduced block by block and memory mapped arrays strip by strip,
+    so the differences of the whole array are never held in memory.
 
-def variogram(x, lag=1):
+    Returns
+    -------
+    tuple
+        Sum and number of valid pairs, arrays over the lags if `lag` is a list
+        followed by the directions if `directions` are given.
+    """
+    lags = _as_lags(lag)
+
+    if isinstance(x, da.core.Array):
+        res = _dask_pair_sums(x, y, lags=lags, func=func, directions=directions, memory_budget=memory_budget)
+    elif isinstance(x, np.memmap):
+        res = _strip_pair_sums(x, y, lags=lags, func=func, directions=directions, memory_budget=memory_budget)
+    else:
+        res = _pair_sums(x, y, lags=lags, func=func, directions=directions)
+
+    if np.ndim(lag) == 0:
+        res = res[..., 0, :, :]
+    if directions is None:
+        res = res[..., 0, :]
+
+    return res[..., 0], res[..., 1]
+
+
+@cached_result
+def variogram(x, lag=1, memory_budget=None):
     """
     Calculate variogram with specified lag for array.
 
+    Dask arrays are reduced chunk by chunk and :class:`numpy.memmap` inputs
+    strip by strip, so the differences of the whole array are never built.
+
     Parameters
     ----------
     x : array like
         Input array
     lag : int
         Lag distance for variogram, defaults to 1.
+    memory_budget : int or str, optional
+        Memory per task for dask arrays and per strip for memmaps, defaults to the
+        "textory.memory_budget" dask config.
 
     Returns
     -------
     float
         Variogram
     """
-    if isinstance(x, da.core.Array):
-        diff = _dask_neighbour_diff_squared(x, lag=lag, func="nd_variogram")
-    else:
-        diff = neighbour_diff_squared(x, lag=lag, func="nd_variogram")
-
-    res = np.nansum(diff)
+    res, _ = _diff_sums(x, lag=lag, func="nd_variogram", memory_budget=memory_budget)
 
     #calculate 1/2N part of variogram
     neighbours = num_neighbours(lag)
 
-    cols, rows = x.shape
+    cols, rows = x.shape[-2:]
     num_pix = cols * rows
 
     factor = 2 * num_pix * neighbours
@@ -43,34 +235,162 @@ def variogram(x, lag=1):
     return res / factor
 
 
-def pseudo_cross_variogram(x, y, lag=1):
+@cached_result
+def pseudo_cross_variogram(x, y, lag=1, memory_budget=None):
     """
     Calculate pseudo-variogram with specified lag for
     the two arrays.
 
+    Like :func:`variogram` dask arrays and memmaps are reduced in pieces.
+
     Parameters
     ----------
     x, y : array like
         Input arrays
     lag : int
         Lag distance for variogram, defaults to 1.
+    memory_budget : int or str, optional
+        See :func:`variogram`.
 
     Returns
     -------
     float
         Pseudo-variogram between the two arrays
     """
-    if isinstance(x, da.core.Array):
-        diff = _dask_neighbour_diff_squared(x, y, lag=lag, func="nd_variogram")
-    else:
-        diff = neighbour_diff_squared(x, y, lag=lag, func="nd_variogram")
-
-    res = np.nansum(diff)
+    res, _ = _diff_sums(x, y, lag=lag, func="nd_variogram", memory_budget=memory_budget)
 
     #calculate 1/2N part of variogram
     neighbours = num_neighbours(lag)
 
-    cols, rows = x.shape
+    cols, rows = x.shape[-2:]
+    num_pix = cols * rows
+
+    factor = 2 * num_pix * neighbours
+
+    return res / factor
+
+
+def _curve(x, y=None, lags=range(1, 50), func="nd_variogram", memory_budget=None):
+    """
+    Empirical curve of a variogram estimator over `lags` from one pass over the data.
+    """
+    lags = np.array(_as_lags(list(lags)))
+    res, count = _diff_sums(x, y, lag=list(lags), func=func, memory_budget=memory_budget)
+
+    #calculate 1/2N part of variogram
+    neighbours = np.array([num_neighbours(lg) for lg in lags])
+
+    cols, rows = x.shape[-2:]
+    num_pix = cols * rows
+
+    factor = 2 * num_pix * neighbours
+
+    return {"lags": lags, "values": res / factor, "counts": count}
+
+
+@cached_result
+def variogram_curve(x, lags=range(1, 50), memory_budget=None):
+    """
+    Calculate the empirical variogram of an array for many lags at once.
+
+    Gives the same values as calling :func:`variogram` for each lag, but each
+    chunk (dask arrays) or strip (memmaps) is read only once for all lags and
+    all lags are calculated in one dask reduction.
+
+    Parameters
+    ----------
+    x : array like
+        Input array
+    lags : list of int, optional
+        Lag distances, defaults to 1 to 49.
+    memory_budget : int or str, optional
+        See :func:`variogram`.
+
+    Returns
+    -------
+    dict
+        "lags", the variogram "values" and the number of valid pixel pairs ("counts")
+        for each lag. For dask arrays values and counts are lazy dask arrays of the
+        same reduction.
+    """
+    return _curve(x, lags=lags, func="nd_variogram", memory_budget=memory_budget)
+
+
+@cached_result
+def madogram_curve(x, lags=range(1, 50), memory_budget=None):
+    """
+    Calculate the empirical madogram of an array for many lags at once.
+
+    Parameters
+    ----------
+    x : array like
+        Input array
+    lags : list of int, optional
+        Lag distances, defaults to 1 to 49.
+    memory_budget : int or str, optional
+        See :func:`variogram`.
+
+    Returns
+    -------
+    dict
+        See :func:`variogram_curve`.
+    """
+    return _curve(x, lags=lags, func="nd_madogram", memory_budget=memory_budget)
+
+
+@cached_result
+def cross_variogram_curve(x, y, lags=range(1, 50), memory_budget=None):
+    """
+    Calculate the empirical cross-variogram of two arrays for many lags at once.
+
+    Parameters
+    ----------
+    x, y : array like
+        Input arrays
+    lags : list of int, optional
+        Lag distances, defaults to 1 to 49.
+    memory_budget : int or str, optional
+        See :func:`variogram`.
+
+    Returns
+    -------
+    dict
+        See :func:`variogram_curve`.
+    """
+    return _curve(x, y, lags=lags, func="nd_cross_variogram", memory_budget=memory_budget)
+
+
+@cached_result
+def directional_variogram(x, lag=1, directions=(0, 45, 90, 135), memory_budget=None):
+    """
+    Calculate the variogram with specified lag for array separately for several directions.
+
+    The neighbours at the lag are split by direction (see :func:`~textory.util.direction_offsets`)
+    and all directions are summed in the same pass over the data.
+
+    Parameters
+    ----------
+    x : array like
+        Input array
+    lag : int
+        Lag distance for variogram, defaults to 1.
+    directions : list of float
+        Directions in degrees counter-clockwise from the x axis, defaults to 0, 45, 90 and 135.
+    memory_budget : int or str, optional
+        See :func:`variogram`.
+
+    Returns
+    -------
+    array like
+        Variogram for each direction.
+    """
+    directions = list(directions)
+    res, _ = _diff_sums(x, lag=lag, func="nd_variogram", directions=directions, memory_budget=memory_budget)
+
+    #calculate 1/2N part of variogram for the neighbours in each direction
+    neighbours = np.array([len(g) for g in direction_offsets(lag, directions)])
+
+    cols, rows = x.shape[-2:]
     num_pix = cols * rows
 
     factor = 2 * num_pix * neighbours
@@ -78,6 +398,120 @@ def pseudo_cross_variogram(x, y, lag=1):
     return res / factor
 
 
+def _sample_blocks(x, num_blocks, rng):
+    """
+    Row and column ranges of `num_blocks` blocks of a dask array drawn with replacement and
+    with probabilities proportional to their size.
+    """
+    starts = [np.cumsum((0,) + c) for c in x.chunks]
+    sizes = np.outer(np.diff(starts[0]), np.diff(starts[1])).ravel()
+
+    picks = rng.choice(len(sizes), num_blocks, p=sizes / sizes.sum())
+    iy, ix = np.unravel_index(picks, x.numblocks)
+
+    return starts[0][iy], starts[0][iy + 1], starts[1][ix], starts[1][ix + 1]
+
+
+def _sample_pairs(x, lag, num_samples, rng, num_blocks=10):
+    """
+    Innermost steps of the variogram of `num_samples` random pixels with a random neighbour at lag `lag`.
+
+    Numpy arrays (and memmaps) are sampled pixel by pixel, the result has one column.
+    For dask arrays `num_blocks` blocks are drawn first and the pixels are drawn inside
+    them, each row of the result holds the samples of one block. Neighbours outside of
+    the array and pairs with non finite values give zero.
+    """
+    rows, cols = x.shape
+    offsets = np.array(ring_offsets(lag))
+
+    if isinstance(x, da.core.Array):
+        per_block = max(1, num_samples // num_blocks)
+        y_start, y_end, x_start, x_end = _sample_blocks(x, num_blocks, rng)
+        y0 = rng.integers(y_start[:, None], y_end[:, None], (num_blocks, per_block))
+        x0 = rng.integers(x_start[:, None], x_end[:, None], (num_blocks, per_block))
+    else:
+        y0 = rng.integers(0, rows, (num_samples, 1))
+        x0 = rng.integers(0, cols, (num_samples, 1))
+
+    off = offsets[rng.integers(0, len(offsets), y0.shape)]
+    y1 = y0 + off[..., 0]
+    x1 = x0 + off[..., 1]
+
+    inside = (y1 >= 0) & (y1 < rows) & (x1 >= 0) & (x1 < cols)
+
+    #pixels and neighbours in one selection so every block (and its halo) is read once
+    y_idx = np.concatenate([y0[inside], y1[inside]])
+    x_idx = np.concatenate([x0[inside], x1[inside]])
+    if isinstance(x, da.core.Array):
+        values = x.vindex[y_idx, x_idx].compute()
+    else:
+        values = x[y_idx, x_idx]
+    first, second = np.split(np.asarray(values, dtype=np.float64), 2)
+
+    res = np.zeros(y0.shape, dtype=np.float64)
+    d = util.nd_variogram(first, second)
+    res[inside] = np.where(np.isfinite(d), d, 0)
+
+    return res
+
+
+def approx_variogram(x, lag=1, num_samples=10000, rtol=None, max_samples=10**7, seed=None, num_blocks=10):
+    """
+    Estimate the variogram with specified lag for array from randomly sampled pixel pairs.
+
+    Each sample is a random pixel and one of its neighbours at lag distance `lag`
+    picked at random, so the estimate converges to :func:`variogram` (neighbours
+    outside of the array and pairs with non finite values count as zero). For numpy
+    arrays and memmaps only the sampled pixels are read. For dask arrays `num_blocks`
+    blocks are drawn with probabilities proportional to their size and the pixels are
+    sampled inside them, so only these blocks and the neighbours within `lag` of them
+    are read. The standard error then follows from the spread of the block means
+    (two stage cluster sampling). This makes quick looks at very large arrays possible.
+
+    Parameters
+    ----------
+    x : array like
+        Input array
+    lag : int
+        Lag distance for variogram, defaults to 1.
+    num_samples : int, optional
+        Number of pixel pairs, defaults to 10000. With `rtol` the number of pairs
+        sampled per round.
+    rtol : float, optional
+        If given, pairs are sampled until the standard error relative to the
+        estimate is below `rtol` or `max_samples` pairs are sampled.
+    max_samples : int, optional
+        Largest number of pairs to sample with `rtol`.
+    seed : int or np.random.Generator, optional
+        Seed of the random numbers, the same seed gives the same estimate.
+    num_blocks : int, optional
+        Number of blocks of dask arrays sampled per round, defaults to 10.
+
+    Returns
+    -------
+    dict
+        The estimated variogram ("value"), its standard error ("stderr") and the
+        number of sampled pairs ("num_samples").
+    """
+    rng = np.random.default_rng(seed)
+
+    #mean of the samples of each pixel (numpy) or block (dask), both are drawn
+    #with probabilities proportional to their size, so the estimate is their mean
+    means = np.zeros(0)
+    n = 0
+    while True:
+        samples = _sample_pairs(x, lag, min(num_samples, max_samples - n), rng, num_blocks=num_blocks)
+        means = np.concatenate([means, samples.mean(axis=1)])
+        n += samples.size
+
+        value = means.mean() / 2
+        stderr = means.std(ddof=1) / np.sqrt(len(means)) / 2 if len(means) > 1 else np.inf
+
+        if rtol is None or n >= max_samples or stderr <= rtol * abs(value):
+            break
+
+    return {"value": value, "stderr": stderr, "num_samples": n}
+
 #def variogram_diff_old(band1, band2, lag=None, window=None):
     #band2 = np.pad(band2, ((1,1),(1,1)), mode="edge")
 
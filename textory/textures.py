@@ -5,13 +5,19 @@ import functools
 import dask.array as da
 import numpy as np
 
-from .util import (_dask_neighbour_diff_squared, _win_view_stat, convolution,
-                   create_kernel, neighbour_diff_squared, window_sum,
-                   xr_wrapper)
+from .backends import backend_name
+from .cache import cached_result, neighbour_diff
+from .util import (EXTREMUM_STATS, _broadcast_factor, _budget_rechunk, _dask_window_texture,
+                   _halo_map_blocks, _spatial_axes, _stacked_estimator_diff, _stat_bytes,
+                   _win_view_stat, _win_view_stats, box_sum, tile_parallel,
+                   convolution, create_kernel, direct_window_texture, neighbour_diff_directional,
+                   neighbour_diff_squared, window_sum, xr_wrapper)
 
 
 @xr_wrapper
-def variogram(x, lag=1, win_size=5, win_geom="square", **kwargs):
+@cached_result
+@tile_parallel
+def variogram(x, lag=1, win_size=5, win_geom="square", method="auto", **kwargs):
     """
     Calculate moveing window variogram with specified
     lag for array.
@@ -20,30 +26,55 @@ def variogram(x, lag=1, win_size=5, win_geom="square", **kwargs):
     ----------
     x : array like
         Input array
-    lag : int
-        Lag distance for variogram, defaults to 1.
-    win_size : int, optional
+    lag : int or list of int
+        Lag distance for variogram, defaults to 1. If a list of lags is given
+        the results for all lags are computed in one pass and stacked along
+        a new first dimension ("lag" dimension for :class:`xarray.DataArray` input).
+    win_size : int or list of int, optional
         Length of one side of window. Window will be of size window*window.
+        If a list of window sizes is given the results are stacked along a new
+        dimension after the lag dimension ("win_size" dimension for
+        :class:`xarray.DataArray` input). For square windows all window sizes
+        are read from the same summed-area table.
     win_geom : {"square", "round"}
         Geometry of the kernel. Defaults to square.
+    method : {"auto", "sat", "fft", "convolve", "direct"}
+        Algorithm for the window sums, see :func:`~textory.util.convolution`.
+        "direct" sums the differences over the windows row by row without the full
+        difference array, see :func:`~textory.util.direct_window_texture`. Defaults to "auto".
+    kwargs : optional
+        `memory_budget` (int or str) limits the memory per task for dask arrays
+        (defaults to the "textory.memory_budget" dask config). `n_jobs` (int, -1 for
+        all cores) or `executor` (:class:`concurrent.futures.Executor`) calculate numpy
+        arrays in strips in parallel, see :func:`~textory.util.tile_parallel`. `backend`
+        (str) selects the compute backend of the neighbour differences, see :mod:`textory.backends`.
 
     Returns
     -------
     array like
         Array where each element is the variogram of the window around the element
     """
-    if isinstance(x, da.core.Array):
-        diff = _dask_neighbour_diff_squared(x, lag=lag, func="nd_variogram")
+    backend = backend_name(kwargs.get("backend"))
+
+    if method == "direct":
+        res = direct_window_texture(x, lag=lag, win_size=win_size, win_geom=win_geom, func="nd_variogram",
+                                    backend=backend, memory_budget=kwargs.get("memory_budget"))
+    elif isinstance(x, da.core.Array):
+        pdiff = functools.partial(neighbour_diff_squared, lag=lag, func="nd_variogram", backend=backend)
+        res = _dask_window_texture(pdiff, x, lag=lag, win_size=win_size, win_geom=win_geom, method=method,
+                                   memory_budget=kwargs.get("memory_budget"))
     else:
-        diff = neighbour_diff_squared(x, lag=lag, func="nd_variogram")
-
-    res = window_sum(diff, lag=lag, win_size=win_size, win_geom=win_geom)
+        diff = neighbour_diff(x, lag=lag, func="nd_variogram", backend=backend)
+        res = window_sum(diff, lag=lag, win_size=win_size, win_geom=win_geom, method=method,
+                         memory_budget=kwargs.get("memory_budget"))
 
     return res
 
 
 @xr_wrapper
-def pseudo_cross_variogram(x, y, lag=1, win_size=5, win_geom="square", **kwargs):
+@cached_result
+@tile_parallel
+def pseudo_cross_variogram(x, y, lag=1, win_size=5, win_geom="square", method="auto", **kwargs):
     """
     Calculate moveing window pseudo-variogram with specified
     lag for the two arrays.
@@ -52,12 +83,28 @@ def pseudo_cross_variogram(x, y, lag=1, win_size=5, win_geom="square", **kwargs)
     ----------
     x, y : array like
         Input array
-    lag : int
-        Lag distance for variogram, defaults to 1.
-    win_size : int, optional
+    lag : int or list of int
+        Lag distance for variogram, defaults to 1. If a list of lags is given
+        the results for all lags are computed in one pass and stacked along
+        a new first dimension ("lag" dimension for :class:`xarray.DataArray` input).
+    win_size : int or list of int, optional
         Length of one side of window. Window will be of size window*window.
+        If a list of window sizes is given the results are stacked along a new
+        dimension after the lag dimension ("win_size" dimension for
+        :class:`xarray.DataArray` input). For square windows all window sizes
+        are read from the same summed-area table.
     win_geom : {"square", "round"}
         Geometry of the kernel. Defaults to square.
+    method : {"auto", "sat", "fft", "convolve", "direct"}
+        Algorithm for the window sums, see :func:`~textory.util.convolution`.
+        "direct" sums the differences over the windows row by row without the full
+        difference array, see :func:`~textory.util.direct_window_texture`. Defaults to "auto".
+    kwargs : optional
+        `memory_budget` (int or str) limits the memory per task for dask arrays
+        (defaults to the "textory.memory_budget" dask config). `n_jobs` (int, -1 for
+        all cores) or `executor` (:class:`concurrent.futures.Executor`) calculate numpy
+        arrays in strips in parallel, see :func:`~textory.util.tile_parallel`. `backend`
+        (str) selects the compute backend of the neighbour differences, see :mod:`textory.backends`.
 
     Returns
     -------
@@ -65,18 +112,27 @@ def pseudo_cross_variogram(x, y, lag=1, win_size=5, win_geom="square", **kwargs)
         Array where each element is the pseudo-variogram
         between the two arrays of the window around the element.
     """
-    if isinstance(x, da.core.Array):
-        diff = _dask_neighbour_diff_squared(x, y, lag, func="nd_variogram")
+    backend = backend_name(kwargs.get("backend"))
+
+    if method == "direct":
+        res = direct_window_texture(x, y, lag=lag, win_size=win_size, win_geom=win_geom, func="nd_variogram",
+                                    backend=backend, memory_budget=kwargs.get("memory_budget"))
+    elif isinstance(x, da.core.Array):
+        pdiff = functools.partial(neighbour_diff_squared, lag=lag, func="nd_variogram", backend=backend)
+        res = _dask_window_texture(pdiff, x, y, lag=lag, win_size=win_size, win_geom=win_geom, method=method,
+                                   memory_budget=kwargs.get("memory_budget"))
     else:
-        diff = neighbour_diff_squared(x, y, lag, func="nd_variogram")
-
-    res = window_sum(diff, lag=lag, win_size=win_size, win_geom=win_geom)
+        diff = neighbour_diff(x, y, lag=lag, func="nd_variogram", backend=backend)
+        res = window_sum(diff, lag=lag, win_size=win_size, win_geom=win_geom, method=method,
+                         memory_budget=kwargs.get("memory_budget"))
 
     return res
 
 
 @xr_wrapper
-def cross_variogram(x, y, lag=1, win_size=5, win_geom="square", **kwargs):
+@cached_result
+@tile_parallel
+def cross_variogram(x, y, lag=1, win_size=5, win_geom="square", method="auto", **kwargs):
     """
     Calculate moveing window pseudo-variogram with specified
     lag for the two arrays.
@@ -85,12 +141,28 @@ def cross_variogram(x, y, lag=1, win_size=5, win_geom="square", **kwargs):
     ----------
     x, y : array like
         Input array
-    lag : int
-        Lag distance for variogram, defaults to 1.
-    win_size : int, optional
+    lag : int or list of int
+        Lag distance for variogram, defaults to 1. If a list of lags is given
+        the results for all lags are computed in one pass and stacked along
+        a new first dimension ("lag" dimension for :class:`xarray.DataArray` input).
+    win_size : int or list of int, optional
         Length of one side of window. Window will be of size window*window.
+        If a list of window sizes is given the results are stacked along a new
+        dimension after the lag dimension ("win_size" dimension for
+        :class:`xarray.DataArray` input). For square windows all window sizes
+        are read from the same summed-area table.
     win_geom : {"square", "round"}
         Geometry of the kernel. Defaults to square.
+    method : {"auto", "sat", "fft", "convolve", "direct"}
+        Algorithm for the window sums, see :func:`~textory.util.convolution`.
+        "direct" sums the differences over the windows row by row without the full
+        difference array, see :func:`~textory.util.direct_window_texture`. Defaults to "auto".
+    kwargs : optional
+        `memory_budget` (int or str) limits the memory per task for dask arrays
+        (defaults to the "textory.memory_budget" dask config). `n_jobs` (int, -1 for
+        all cores) or `executor` (:class:`concurrent.futures.Executor`) calculate numpy
+        arrays in strips in parallel, see :func:`~textory.util.tile_parallel`. `backend`
+        (str) selects the compute backend of the neighbour differences, see :mod:`textory.backends`.
 
     Returns
     -------
@@ -98,18 +170,27 @@ def cross_variogram(x, y, lag=1, win_size=5, win_geom="square", **kwargs):
         Array where each element is the pseudo-variogram
         between the two arrays of the window around the element.
     """
-    if isinstance(x, da.core.Array):
-        diff = _dask_neighbour_diff_squared(x, y, lag, func="nd_cross_variogram")
+    backend = backend_name(kwargs.get("backend"))
+
+    if method == "direct":
+        res = direct_window_texture(x, y, lag=lag, win_size=win_size, win_geom=win_geom, func="nd_cross_variogram",
+                                    backend=backend, memory_budget=kwargs.get("memory_budget"))
+    elif isinstance(x, da.core.Array):
+        pdiff = functools.partial(neighbour_diff_squared, lag=lag, func="nd_cross_variogram", backend=backend)
+        res = _dask_window_texture(pdiff, x, y, lag=lag, win_size=win_size, win_geom=win_geom, method=method,
+                                   memory_budget=kwargs.get("memory_budget"))
     else:
-        diff = neighbour_diff_squared(x, y, lag, func="nd_cross_variogram")
-
-    res = window_sum(diff, lag=lag, win_size=win_size, win_geom=win_geom)
+        diff = neighbour_diff(x, y, lag=lag, func="nd_cross_variogram", backend=backend)
+        res = window_sum(diff, lag=lag, win_size=win_size, win_geom=win_geom, method=method,
+                         memory_budget=kwargs.get("memory_budget"))
 
     return res
 
 
 @xr_wrapper
-def madogram(x, lag=1, win_size=5, win_geom="square", **kwargs):
+@cached_result
+@tile_parallel
+def madogram(x, lag=1, win_size=5, win_geom="square", method="auto", **kwargs):
     """
     Calculate moveing window madogram with specified
     lag for array.
@@ -118,30 +199,55 @@ def madogram(x, lag=1, win_size=5, win_geom="square", **kwargs):
     ----------
     x : array like
         Input array
-    lag : int
-        Lag distance for variogram, defaults to 1.
-    win_size : int, optional
+    lag : int or list of int
+        Lag distance for variogram, defaults to 1. If a list of lags is given
+        the results for all lags are computed in one pass and stacked along
+        a new first dimension ("lag" dimension for :class:`xarray.DataArray` input).
+    win_size : int or list of int, optional
         Length of one side of window. Window will be of size window*window.
+        If a list of window sizes is given the results are stacked along a new
+        dimension after the lag dimension ("win_size" dimension for
+        :class:`xarray.DataArray` input). For square windows all window sizes
+        are read from the same summed-area table.
     win_geom : {"square", "round"}
         Geometry of the kernel. Defaults to square.
+    method : {"auto", "sat", "fft", "convolve", "direct"}
+        Algorithm for the window sums, see :func:`~textory.util.convolution`.
+        "direct" sums the differences over the windows row by row without the full
+        difference array, see :func:`~textory.util.direct_window_texture`. Defaults to "auto".
+    kwargs : optional
+        `memory_budget` (int or str) limits the memory per task for dask arrays
+        (defaults to the "textory.memory_budget" dask config). `n_jobs` (int, -1 for
+        all cores) or `executor` (:class:`concurrent.futures.Executor`) calculate numpy
+        arrays in strips in parallel, see :func:`~textory.util.tile_parallel`. `backend`
+        (str) selects the compute backend of the neighbour differences, see :mod:`textory.backends`.
 
     Returns
     -------
     array like
         Array where each element is the madogram of the window around the element
     """
-    if isinstance(x, da.core.Array):
-        diff = _dask_neighbour_diff_squared(x, lag=lag, func="nd_madogram")
+    backend = backend_name(kwargs.get("backend"))
+
+    if method == "direct":
+        res = direct_window_texture(x, lag=lag, win_size=win_size, win_geom=win_geom, func="nd_madogram",
+                                    backend=backend, memory_budget=kwargs.get("memory_budget"))
+    elif isinstance(x, da.core.Array):
+        pdiff = functools.partial(neighbour_diff_squared, lag=lag, func="nd_madogram", backend=backend)
+        res = _dask_window_texture(pdiff, x, lag=lag, win_size=win_size, win_geom=win_geom, method=method,
+                                   memory_budget=kwargs.get("memory_budget"))
     else:
-        diff = neighbour_diff_squared(x, lag=lag, func="nd_madogram")
-
-    res = window_sum(diff, lag=lag, win_size=win_size, win_geom=win_geom)
+        diff = neighbour_diff(x, lag=lag, func="nd_madogram", backend=backend)
+        res = window_sum(diff, lag=lag, win_size=win_size, win_geom=win_geom, method=method,
+                         memory_budget=kwargs.get("memory_budget"))
 
     return res
 
 
 @xr_wrapper
-def rodogram(x, lag=1, win_size=5, win_geom="square", **kwargs):
+@cached_result
+@tile_parallel
+def rodogram(x, lag=1, win_size=5, win_geom="square", method="auto", **kwargs):
     """
     Calculate moveing window rodogram with specified
     lag for array.
@@ -150,29 +256,179 @@ def rodogram(x, lag=1, win_size=5, win_geom="square", **kwargs):
     ----------
     x : array like
         Input array
-    lag : int
-        Lag distance for variogram, defaults to 1.
-    win_size : int, optional
+    lag : int or list of int
+        Lag distance for variogram, defaults to 1. If a list of lags is given
+        the results for all lags are computed in one pass and stacked along
+        a new first dimension ("lag" dimension for :class:`xarray.DataArray` input).
+    win_size : int or list of int, optional
         Length of one side of window. Window will be of size window*window.
+        If a list of window sizes is given the results are stacked along a new
+        dimension after the lag dimension ("win_size" dimension for
+        :class:`xarray.DataArray` input). For square windows all window sizes
+        are read from the same summed-area table.
     win_geom : {"square", "round"}
         Geometry of the kernel. Defaults to square.
+    method : {"auto", "sat", "fft", "convolve", "direct"}
+        Algorithm for the window sums, see :func:`~textory.util.convolution`.
+        "direct" sums the differences over the windows row by row without the full
+        difference array, see :func:`~textory.util.direct_window_texture`. Defaults to "auto".
+    kwargs : optional
+        `memory_budget` (int or str) limits the memory per task for dask arrays
+        (defaults to the "textory.memory_budget" dask config). `n_jobs` (int, -1 for
+        all cores) or `executor` (:class:`concurrent.futures.Executor`) calculate numpy
+        arrays in strips in parallel, see :func:`~textory.util.tile_parallel`. `backend`
+        (str) selects the compute backend of the neighbour differences, see :mod:`textory.backends`.
 
     Returns
     -------
     array like
         Array where each element is the madogram of the window around the element
     """
-    if isinstance(x, da.core.Array):
-        diff = _dask_neighbour_diff_squared(x, lag=lag, func="nd_rodogram")
+    backend = backend_name(kwargs.get("backend"))
+
+    if method == "direct":
+        res = direct_window_texture(x, lag=lag, win_size=win_size, win_geom=win_geom, func="nd_rodogram",
+                                    backend=backend, memory_budget=kwargs.get("memory_budget"))
+    elif isinstance(x, da.core.Array):
+        pdiff = functools.partial(neighbour_diff_squared, lag=lag, func="nd_rodogram", backend=backend)
+        res = _dask_window_texture(pdiff, x, lag=lag, win_size=win_size, win_geom=win_geom, method=method,
+                                   memory_budget=kwargs.get("memory_budget"))
     else:
-        diff = neighbour_diff_squared(x, lag=lag, func="nd_rodogram")
+        diff = neighbour_diff(x, lag=lag, func="nd_rodogram", backend=backend)
+        res = window_sum(diff, lag=lag, win_size=win_size, win_geom=win_geom, method=method,
+                         memory_budget=kwargs.get("memory_budget"))
+
+    return res
+
+
+@xr_wrapper
+@cached_result
+@tile_parallel
+def variogram_estimators(x, lag=1, win_size=5, win_geom="square", method="auto",
+                         estimators=("variogram", "madogram", "rodogram"), **kwargs):
+    """
+    Calculate moveing window variogram, madogram and rodogram with specified
+    lag for array in one pass.
+
+    The difference between each pixel and its neighbours is calculated only once
+    and fed to all requested estimators, which is faster than calling
+    :func:`variogram`, :func:`madogram` and :func:`rodogram` one after the other.
+
+    Parameters
+    ----------
+    x : array like
+        Input array
+    lag : int or list of int
+        Lag distance for variogram, defaults to 1.
+    win_size : int or list of int, optional
+        Length of one side of window. Window will be of size window*window.
+        If a list of window sizes is given the results are stacked along a new
+        dimension after the lag dimension ("win_size" dimension for
+        :class:`xarray.DataArray` input). For square windows all window sizes
+        are read from the same summed-area table.
+    win_geom : {"square", "round"}
+        Geometry of the kernel. Defaults to square.
+    method : {"auto", "sat", "fft", "convolve", "direct"}
+        Algorithm for the window sums, see :func:`~textory.util.convolution`.
+        "direct" sums the differences over the windows row by row without the full
+        difference array, see :func:`~textory.util.direct_window_texture`. Defaults to "auto".
+    kwargs : optional
+        `memory_budget` (int or str) limits the memory per task for dask arrays
+        (defaults to the "textory.memory_budget" dask config). `n_jobs` (int, -1 for
+        all cores) or `executor` (:class:`concurrent.futures.Executor`) calculate numpy
+        arrays in strips in parallel, see :func:`~textory.util.tile_parallel`. `backend`
+        (str) selects the compute backend of the neighbour differences, see :mod:`textory.backends`.
+    estimators : list of {"variogram", "madogram", "rodogram"}
+        Estimators to calculate. Defaults to all three.
 
-    res = window_sum(diff, lag=lag, win_size=win_size, win_geom=win_geom)
+    Returns
+    -------
+    dict
+        Dictionary with the estimator names as keys and the same arrays the
+        single textures return as values.
+    """
+    funcs = ["nd_" + e for e in estimators]
+
+    backend = backend_name(kwargs.get("backend"))
+
+    if method == "direct":
+        res = direct_window_texture(x, lag=lag, win_size=win_size, win_geom=win_geom, func=tuple(funcs),
+                                    backend=backend, memory_budget=kwargs.get("memory_budget"))
+    elif isinstance(x, da.core.Array):
+        pdiff = functools.partial(_stacked_estimator_diff, lag=lag, funcs=funcs, backend=backend)
+        res = _dask_window_texture(pdiff, x, lag=lag, win_size=win_size, win_geom=win_geom, method=method,
+                                   diff_axes=(len(funcs),), memory_budget=kwargs.get("memory_budget"))
+    else:
+        diff = neighbour_diff(x, lag=lag, func=tuple(funcs), backend=backend)
+        res = window_sum(diff, lag=lag, win_size=win_size, win_geom=win_geom, method=method,
+                         memory_budget=kwargs.get("memory_budget"))
+
+    #the estimators follow the lag and window size axes
+    axis = int(np.ndim(lag) > 0) + int(np.ndim(win_size) > 0)
+
+    return {e: res[(slice(None),) * axis + (i,)] for i, e in enumerate(estimators)}
+
+
+@xr_wrapper
+@cached_result
+@tile_parallel
+def directional_variogram(x, lag=1, win_size=5, win_geom="square", method="auto", directions=(0, 45, 90, 135),
+                          **kwargs):
+    """
+    Calculate moveing window variograms with specified lag for array separately for several directions.
+
+    The neighbours at the lag are split by direction (see :func:`~textory.util.direction_offsets`)
+    and all directions are accumulated in the same sweep over the neighbours. For numpy arrays
+    the differences are read from the difference field cache, see :func:`~textory.cache.diff_cache`.
+
+    Parameters
+    ----------
+    x : array like
+        Input array
+    lag : int or list of int
+        Lag distance for variogram, defaults to 1. See :func:`variogram`.
+    win_size : int or list of int, optional
+        Length of one side of window. See :func:`variogram`.
+    win_geom : {"square", "round"}
+        Geometry of the kernel. Defaults to square.
+    method : {"auto", "sat", "fft", "convolve", "direct"}
+        Algorithm for the window sums, see :func:`~textory.util.convolution`.
+        "direct" sums the differences of all directions over the windows row by row without
+        the full difference array, see :func:`~textory.util.direct_window_texture`. Defaults to "auto".
+    directions : list of float
+        Directions in degrees counter-clockwise from the x axis, defaults to 0, 45, 90 and 135.
+    kwargs : optional
+        `memory_budget`, `n_jobs`, `executor` and `backend`, see :func:`variogram`.
+
+    Returns
+    -------
+    array like
+        Variograms of the directions stacked along a new axis after the lag and window size
+        axes (if any) and in front of the batch and spatial axes ("directions" dimension for
+        :class:`xarray.DataArray` input).
+    """
+    directions = list(directions)
+    backend = backend_name(kwargs.get("backend"))
+
+    if method == "direct":
+        res = direct_window_texture(x, lag=lag, win_size=win_size, win_geom=win_geom, func="nd_variogram",
+                                    backend=backend, memory_budget=kwargs.get("memory_budget"),
+                                    directions=directions)
+    elif isinstance(x, da.core.Array):
+        pdiff = functools.partial(neighbour_diff_directional, lag=lag, directions=directions, backend=backend)
+        res = _dask_window_texture(pdiff, x, lag=lag, win_size=win_size, win_geom=win_geom, method=method,
+                                   diff_axes=(len(directions),), memory_budget=kwargs.get("memory_budget"))
+    else:
+        diff = neighbour_diff(x, lag=lag, func="nd_variogram", backend=backend, directions=directions)
+        res = window_sum(diff, lag=lag, win_size=win_size, win_geom=win_geom, method=method,
+                         memory_budget=kwargs.get("memory_budget"))
 
     return res
 
 
 @xr_wrapper
+@cached_result
+@tile_parallel
 def window_statistic(x, stat="nanmean", win_size=5, **kwargs):
     """
     Calculate the specified statistic with a moveing window of size `win_size`.
@@ -181,12 +437,24 @@ def window_statistic(x, stat="nanmean", win_size=5, **kwargs):
     ----------
     x : array like
         Input array
-    stat : {"nanmean", "nanmax", "nanmin", "nanmedian", "nanstd"}
-        Statistical measure to calculate.
+    stat : {"nanmean", "nanmax", "nanmin", "nanmedian", "nanstd", "nanvar", "nansum", "count",
+            "nanpercentile", "nanquantile"} or list of them
+        Statistical measure to calculate. If a list of statistics is given they are calculated
+        in one pass (sharing padding, halo and moving window sums) and stacked along a new first
+        dimension (:class:`xarray.Dataset` with one variable per statistic for
+        :class:`xarray.DataArray` input). "nanmean", "nanstd", "nanvar", "nansum" and "count"
+        (number of valid values) are calculated from moving window sums and "nanmax" and "nanmin"
+        from running extrema, so their cost does not depend on the window size. "nanmedian",
+        "nanpercentile" and "nanquantile" are calculated with sliding sorted windows.
     win_size : int, optional
         Length of one side of window. Window will be of size window*window.
     kwargs : optional
-        Any parameters a certain stat may need other than the array itself.
+        Any parameters a certain stat may need other than the array itself
+        (e.g. `q` for "nanpercentile" in [0, 100] and "nanquantile" in [0, 1]).
+        `memory_budget` (int or str) limits the memory per task for dask arrays
+        (defaults to the "textory.memory_budget" dask config). `n_jobs` (int, -1 for
+        all cores) or `executor` (:class:`concurrent.futures.Executor`) calculate numpy
+        arrays in strips in parallel, see :func:`~textory.util.tile_parallel`.
 
     Returns
     -------
@@ -200,13 +468,39 @@ def window_statistic(x, stat="nanmean", win_size=5, **kwargs):
     if win_size % 2 == 0:
         raise ValueError("Window size must be odd.")
 
+    memory_budget = kwargs.pop("memory_budget", None)
+    conv_padding = int(win_size // 2)
+
+    in_dtype = x.dtype
+    if isinstance(x, da.core.Array) and not np.issubdtype(x.dtype, np.floating):
+        #the halo outside of the array is NaN, which integers can't hold
+        x = x.astype(np.float64)
+
+    if np.ndim(stat) > 0:
+        pcon = functools.partial(_win_view_stats, win_size=win_size, stats=list(stat), **kwargs)
+
+        if isinstance(x, da.core.Array):
+            res = _halo_map_blocks(pcon, x, depth=conv_padding, boundary=np.nan, new_axes=(len(stat),),
+                                   dtype=x.dtype, bytes_per_element=_stat_bytes(stat, win_size, x.dtype.itemsize),
+                                   memory_budget=memory_budget)
+        else:
+            res = pcon(x)
+
+        return res
+
     #create view_as_windows function with reduced parameters for mapping
     pcon = functools.partial(_win_view_stat, win_size=win_size, stat=stat, **kwargs)
 
     if isinstance(x, da.core.Array):
-        conv_padding = int(win_size // 2)
-        res = x.map_overlap(pcon, depth={0: conv_padding, 1: conv_padding}, boundary={0: np.nan, 1: np.nan})
+        bytes_per_element = _stat_bytes([stat], win_size, x.dtype.itemsize)
+        x = _budget_rechunk(x, depth=conv_padding, bytes_per_element=bytes_per_element,
+                            memory_budget=memory_budget)
+        res = x.map_overlap(pcon, depth=_spatial_axes(x.ndim, conv_padding),
+                            boundary=_spatial_axes(x.ndim, np.nan))
         #trim=False)
+        if stat in EXTREMUM_STATS:
+            #extrema of integers stay integers like for numpy arrays
+            res = res.astype(in_dtype)
     else:
         res = pcon(x)
 
@@ -214,7 +508,9 @@ def window_statistic(x, stat="nanmean", win_size=5, **kwargs):
 
 
 @xr_wrapper
-def tpi(x, win_size=5, win_geom="square", **kwargs):
+@cached_result
+@tile_parallel
+def tpi(x, win_size=5, win_geom="square", method="auto", **kwargs):
     """
     Calculate topographic position index for a given window size.
 
@@ -222,25 +518,58 @@ def tpi(x, win_size=5, win_geom="square", **kwargs):
     ----------
     x : array like
         Input array
-    win_size : int, optional
+    win_size : int or list of int, optional
         Length of one side of window. Window will be of size window*window. Defaults to 5.
+        If a list of window sizes is given the results are stacked along a new first
+        dimension ("win_size" dimension for :class:`xarray.DataArray` input).
     win_geom : {"square", "round"}
         Geometry of the kernel. Defaults to square.
+    method : {"auto", "sat", "fft", "convolve", "direct"}
+        Algorithm for the window sums, see :func:`~textory.util.convolution`.
+        "direct" sums the differences over the windows row by row without the full
+        difference array, see :func:`~textory.util.direct_window_texture`. Defaults to "auto".
+    kwargs : optional
+        `memory_budget` (int or str) limits the memory per task for dask arrays
+        (defaults to the "textory.memory_budget" dask config). `n_jobs` (int, -1 for
+        all cores) or `executor` (:class:`concurrent.futures.Executor`) calculate numpy
+        arrays in strips in parallel, see :func:`~textory.util.tile_parallel`.
 
     Returns
     -------
     array like
         Array with tpi
     """
-    custom_kernel = create_kernel(n=win_size, geom=win_geom)
-    center_ind = win_size // 2
-    custom_kernel[center_ind, center_ind] = 0
+    if win_geom == "square" and method in ["auto", "sat"]:
+        #window sum without the center pixel straight from the summed-area table
+        if np.ndim(win_size) > 0:
+            num_pix = _broadcast_factor([w**2 - 1 for w in win_size], x.ndim + 1, x.dtype)
+        else:
+            num_pix = win_size**2 - 1
+
+        avg = (box_sum(x, win_size=win_size, memory_budget=kwargs.get("memory_budget")) - x) / num_pix
+    elif np.ndim(win_size) > 0:
+        stack = da.stack if isinstance(x, da.core.Array) else np.stack
+        avg = stack([_tpi_mean(x, win_size=w, win_geom=win_geom, method=method,
+                               memory_budget=kwargs.get("memory_budget")) for w in win_size])
+    else:
+        avg = _tpi_mean(x, win_size=win_size, win_geom=win_geom, method=method,
+                        memory_budget=kwargs.get("memory_budget"))
 
-    avg = convolution(x, win_size=win_size, kernel=custom_kernel)
     res = avg - x
 
     return res
 
+
+def _tpi_mean(x, win_size=5, win_geom="square", method="auto", memory_budget=None):
+    """
+    Mean of the window around each element without the element itself.
+    """
+    custom_kernel = create_kernel(n=win_size, geom=win_geom)
+    center_ind = win_size // 2
+    custom_kernel[center_ind, center_ind] = 0
+
+    return convolution(x, win_size=win_size, kernel=custom_kernel, method=method, memory_budget=memory_budget)
+
 #def variogram_diff_old(band1, band2, lag=None, window=None):
     #band2 = np.pad(band2, ((1,1),(1,1)), mode="edge")
 
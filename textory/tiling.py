@@ -0,0 +1,146 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Calculation of textures in strips
+
+Without dask the textures need the whole input and several temporary arrays of
+the same size in memory. :func:`strip_texture` instead reads horizontal strips of
+rows extended by the halo of the texture (``lag + win_size // 2`` rows for the
+variogram family, ``win_size // 2`` otherwise) from the input, calculates the
+texture of each strip and writes it to the output. The input can be anything
+which can be sliced like a numpy array, e.g. a :class:`numpy.memmap`, and the
+output can be a memmap as well, so the peak memory only depends on the size of
+a strip.
+
+.. code-block:: python
+
+    import numpy as np
+    import textory as tx
+
+    x = np.load("scene.npy", mmap_mode="r")
+    tx.tiling.strip_texture("variogram", x, out="variogram.npy", lag=2, win_size=15,
+                            memory_budget="200MB")
+
+The results are the same as for the whole array as the halo covers all
+elements a result depends on.
+"""
+import os
+
+import numpy as np
+
+from . import textures as txt
+from .estimation import _texture_model
+from .util import _memory_budget, _stitch, _strips
+
+#memory per strip if there is neither a memory budget nor a number of rows
+STRIP_MEMORY_BUDGET = 2**28
+
+#parameters of the textures used in the memory model
+MODEL_PARAMS = ["lag", "win_size", "win_geom", "method", "stat", "estimators", "directions"]
+
+
+def _open_input(x):
+    """
+    Open npy files as read-only memmap, other inputs are used as they are.
+    """
+    if isinstance(x, str):
+        return np.load(x, mmap_mode="r")
+
+    return x
+
+
+def _create_output(out, shape, dtype):
+    """
+    Array for a result, `out` is an array, the path of a npy file to create or None.
+    """
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+
+    if isinstance(out, str):
+        return np.lib.format.open_memmap(out, mode="w+", dtype=dtype, shape=shape)
+
+    if out.shape != shape:
+        raise ValueError("Shape of output {} does not match shape of result {}".format(out.shape, shape))
+
+    return out
+
+
+def strip_texture(texture, x, y=None, out=None, strip_rows=None, memory_budget=None, **kwargs):
+    """
+    Calculate a texture strip by strip.
+
+    Parameters
+    ----------
+    texture : str
+        Name of the texture in :mod:`textory.textures`.
+    x : array like or str
+        Input array, e.g. a :class:`numpy.memmap`, or the path of a npy file which
+        is opened as memmap.
+    y : array like or str, optional
+        Second input array of the cross textures.
+    out : array like, str or dict, optional
+        Output array, e.g. a writeable :class:`numpy.memmap`, or the path of a npy file
+        which is created. For textures returning a dictionary (e.g.
+        :func:`~textory.textures.variogram_estimators`) a dictionary of output arrays or
+        the path of a directory where a npy file is created for each result.
+        By default the results are returned as numpy arrays.
+    strip_rows : int, optional
+        Number of rows of the output calculated at once. By default as many as fit
+        into the memory budget.
+    memory_budget : int or str, optional
+        Memory for the calculation of one strip, defaults to the "textory.memory_budget"
+        dask config or 256 MiB.
+    kwargs : optional
+        Parameters of the texture.
+
+    Returns
+    -------
+    array like or dict
+        The output array(s).
+    """
+    fun = getattr(txt, texture)
+    arrays = [_open_input(a) for a in [x, y] if a is not None]
+    rows, cols = arrays[0].shape[-2:]
+
+    model_params = {k: v for k, v in kwargs.items() if k in MODEL_PARAMS}
+    _, depth, terms, _, _ = _texture_model(texture, arrays[0].dtype.itemsize, **model_params)
+    bytes_per_element = sum(terms.values())
+
+    if strip_rows is None:
+        budget = _memory_budget(memory_budget) or STRIP_MEMORY_BUDGET
+        strip_rows = int(budget // (bytes_per_element * cols)) - 2 * depth
+        strip_rows = max(strip_rows, 1)
+
+    res = None
+    for read_start, read_stop, start, stop in _strips(rows, strip_rows, depth):
+        strips = [np.array(a[..., read_start:read_stop, :]) for a in arrays]
+        strip_res = fun(*strips, **kwargs)
+
+        if res is None:
+            res = _outputs(out, strip_res, rows)
+        _stitch(res, strip_res, read_start, start, stop)
+
+    for r in (res.values() if isinstance(res, dict) else [res]):
+        if isinstance(r, np.memmap):
+            r.flush()
+
+    return res
+
+
+def _outputs(out, strip_res, rows):
+    """
+    Output arrays for the results with the shape and dtype of the results of the first strip.
+    """
+    def shape(r):
+        return r.shape[:-2] + (rows, r.shape[-1])
+
+    if not isinstance(strip_res, dict):
+        return _create_output(out, shape(strip_res), strip_res.dtype)
+
+    if isinstance(out, str):
+        os.makedirs(out, exist_ok=True)
+        out = {k: os.path.join(out, "{}.npy".format(k)) for k in strip_res}
+    elif out is None:
+        out = {}
+
+    return {k: _create_output(out.get(k), shape(r), r.dtype) for k, r in strip_res.items()}
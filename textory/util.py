@@ -1,14 +1,35 @@
 #! /usr/bin/python
 # -*- coding: utf-8 -*-
+import atexit
+import collections
+import concurrent.futures
+import copy
 import functools
+import importlib
+import inspect
+import os
+import threading
+import warnings
+from multiprocessing import shared_memory
 import decorator
 import numpy as np
+import dask
 import dask.array as da
 import xarray as xr
 import skimage as ski
 from scipy.ndimage.filters import convolve
+from scipy.signal import oaconvolve
+
+from .backends import backend_name, get_kernel
 #import bottlenack as bn
 
+#smallest window size for which summed-area tables are faster than direct convolution
+SAT_MIN_WIN_SIZE = 5
+#smallest window size for which FFT convolution is faster than direct convolution
+FFT_MIN_WIN_SIZE = 9
+#bytes per element of the working arrays of the window sum methods (besides input and result)
+WORK_BYTES = {"sat": 32, "fft": 48, "convolve": 8}
+
 
 def view(offset_y, offset_x, size_y, size_x, step=1):
     """
@@ -36,7 +57,8 @@ def view(offset_y, offset_x, size_y, size_x, step=1):
 
     Returns
     -------
-    tuple of 2D numpy slices
+    tuple of numpy slices
+        Slices of the last two axes, leading (batch) axes are taken whole.
 
 
     Example
@@ -82,7 +104,7 @@ def view(offset_y, offset_x, size_y, size_x, step=1):
         y_in, y_out = y_out, y_in
 
     # return window view (in) and main view (out)
-    return np.s_[y_in, x_in], np.s_[y_out, x_out]
+    return np.s_[..., y_in, x_in], np.s_[..., y_out, x_out]
 
 
 def num_neighbours(lag=1):
@@ -105,6 +127,42 @@ def num_neighbours(lag=1):
     return neighbours
 
 
+def ring_offsets(lag=1):
+    """
+    Offsets of all neighbours of a pixel at the specified lag.
+
+    The neighbours at lag distance `lag` form the outer ring of the
+    window of size 2 * lag + 1 around the pixel.
+
+    Parameters
+    ----------
+    lag : int
+        Lag distance, defaults to 1.
+
+    Returns
+    -------
+    list of tuple
+        (row, column) offsets from the center pixel.
+    """
+    win = 2 * lag + 1
+    radius = win // 2
+
+    offsets = []
+    r = list(range(win))
+    for y in r:
+        y_off = y - radius
+
+        if y == min(r) or y == max(r):
+            x_r = r
+        else:
+            x_r = [max(r), min(r)]
+
+        for x in x_r:
+            offsets.append((y_off, x - radius))
+
+    return offsets
+
+
 def neighbour_count(shape, kernel):
     """
     Count the number of contributing pixels based on a kernel for
@@ -277,7 +335,7 @@ def nd_cross_variogram(x1, y2, x2, y1):
     return res
 
 
-def neighbour_diff_squared(arr1, arr2=None, lag=1, func="nd_variogram"):
+def neighbour_diff_squared(arr1, arr2=None, lag=1, func="nd_variogram", backend=None):
     """
     Calculates the squared difference between a pixel and its neighbours
     at the specified lag.
@@ -289,10 +347,15 @@ def neighbour_diff_squared(arr1, arr2=None, lag=1, func="nd_variogram"):
     ----------
     arr1 : np.array
     arr2 : np.array, optional
-    lag : int, optional
-        The lag distance for the variogram, defaults to 1.
+    lag : int or list of int, optional
+        The lag distance for the variogram, defaults to 1. If a list of lags
+        is given the differences for all lags are calculated in one sweep over
+        the neighbours and stacked along a new first axis.
     func : {nd_variogram, nd_pseudo_cross_variogram, nd_madogram, nd_rodogram, nd_cross_variogram}
         Calculation method of innermost step of the different variogram methods.
+    backend : str, optional
+        Compute backend of the innermost step, see :mod:`textory.backends`.
+        Defaults to the "textory.backend" dask config or "auto".
 
     Returns
     -------
@@ -300,281 +363,2337 @@ def neighbour_diff_squared(arr1, arr2=None, lag=1, func="nd_variogram"):
         Variogram
 
     """
+    kernel = get_kernel(func, backend)
     method = globals()[func]
 
-    win = 2 * lag + 1
-    radius = win // 2
-    rows, cols = arr1.shape
+    rows, cols = arr1.shape[-2:]
 
     if arr2 is None:
-        arr2 = arr1.copy()
+        arr2 = arr1
+
+    lags = _as_lags(lag)
+    dtype = arr1.dtype if np.issubdtype(arr1.dtype, np.floating) else np.float64
+    out_arr = np.zeros((len(lags),) + arr1.shape, dtype=dtype)
+
+    #scratch arrays of the kernels
+    work = np.empty((2 if func == "nd_cross_variogram" else 1,) + arr1.shape, dtype=dtype)
+
+    offsets = [(i, off) for i, lg in enumerate(lags) for off in ring_offsets(lg)]
+    for i, (y_off, x_off) in offsets:
+        view_in, view_out = view(y_off, x_off, rows, cols)
+        if kernel is None:
+            out_arr[i][view_out] += method(arr1[view_out], arr2[view_in])
+        elif func == "nd_cross_variogram":
+            kernel(out_arr[i][view_out], arr1[view_out], arr2[view_in], arr1[view_in], arr2[view_out],
+                   work[(slice(None),) + view_out])
+        else:
+            kernel(out_arr[i][view_out], arr1[view_out], arr2[view_in], work[(slice(None),) + view_out])
 
-    out_arr = np.zeros_like(arr1)
+    if np.ndim(lag) == 0:
+        out_arr = out_arr[0]
 
-    r = list(range(win))
-    for y in r:
-        y_off = y - radius
+    return out_arr
 
-        if y == min(r) or y == max(r):
-            x_r = r
-        else:
-            x_r = [max(r), min(r)]
 
-        for x in x_r:
-            x_off = x - radius
-            view_in, view_out = view(y_off, x_off, rows, cols)
-            if func == "nd_cross_variogram":
-                out_arr[view_out] += method(arr1[view_out], arr2[view_in], arr1[view_in], arr2[view_out])
-            else:
-                out_arr[view_out] += method(arr1[view_out], arr2[view_in])
+def neighbour_diff_estimators(arr1, arr2=None, lag=1, funcs=("nd_variogram", "nd_madogram", "nd_rodogram"),
+                              backend=None):
+    """
+    Calculates the innermost steps of several variogram estimators at once.
+
+    The difference between a pixel and its neighbour is calculated only once
+    for each neighbour and then fed to all requested estimators. Each estimator
+    gives the same result as :func:`neighbour_diff_squared` with the same `func`.
+
+    Parameters
+    ----------
+    arr1 : np.array
+    arr2 : np.array, optional
+    lag : int or list of int, optional
+        The lag distance for the variogram, defaults to 1.
+    funcs : list of {nd_variogram, nd_madogram, nd_rodogram}
+        Innermost steps to calculate. Defaults to all three.
+    backend : str, optional
+        Compute backend, see :mod:`textory.backends`. All backends share the difference
+        between the estimators with their "nd_estimators" kernel.
+
+    Returns
+    -------
+    np.array
+        Results of the estimators stacked along a new first axis (followed by
+        the lag axis if a list of lags is given) in the order of `funcs`.
+    """
+    unknown = set(funcs) - {"nd_variogram", "nd_madogram", "nd_rodogram"}
+    if unknown:
+        raise ValueError("Estimators {} can not be fused.".format(sorted(unknown)))
+
+    rows, cols = arr1.shape[-2:]
+
+    if arr2 is None:
+        arr2 = arr1
+
+    lags = _as_lags(lag)
+    dtype = arr1.dtype if np.issubdtype(arr1.dtype, np.floating) else np.float64
+    out_arr = np.zeros((len(funcs), len(lags)) + arr1.shape, dtype=dtype)
+    work = np.empty((2,) + arr1.shape, dtype=dtype)
+
+    kernel = get_kernel("nd_estimators", backend) or get_kernel("nd_estimators", "numpy")
+    #rows of the variogram, madogram and rodogram in the output, -1 if not requested
+    index = np.array([list(funcs).index(f) if f in funcs else -1
+                      for f in ["nd_variogram", "nd_madogram", "nd_rodogram"]])
 
-            #out_arr[view_out] += method(arr1[view_out], arr2[view_in])
-            #a1 = arr1[view_out]
-            #a2 = arr2[view_in]
-            #out_arr[view_out] += (a1 - a2)**2
+    offsets = [(i, off) for i, lg in enumerate(lags) for off in ring_offsets(lg)]
+    for i, (y_off, x_off) in offsets:
+        view_in, view_out = view(y_off, x_off, rows, cols)
+        kernel(out_arr[:, i][(slice(None),) + view_out], arr1[view_out], arr2[view_in],
+               work[(slice(None),) + view_out], index)
+
+    if np.ndim(lag) == 0:
+        out_arr = out_arr[:, 0]
 
     return out_arr
 
 
-def _dask_neighbour_diff_squared(x, y=None, lag=1, func="nd_variogram"):
+def direction_offsets(lag=1, directions=(0, 45, 90, 135)):
     """
-    Calculate quared difference between pixel and its
-    neighbours at specified lag for dask arrays
+    Offsets of the neighbours at the specified lag grouped by direction.
+
+    The direction of an offset is its angle in degrees counter-clockwise from
+    the column axis (rows count downwards) modulo 180, so a neighbour and the
+    neighbour on the opposite side have the same direction. Each offset belongs
+    to the nearest of `directions`.
 
     Parameters
     ----------
-    x : np.array
-    y : np.array, optional
-        Defaults to None
-    lag : int, optional
-    func : {nd_variogram, nd_madogram, nd_rodogram, nd_cross_variogram}
-        Calculation method of innermost step of different variogram methods.
+    lag : int
+        Lag distance, defaults to 1.
+    directions : list of float
+        Directions in degrees, defaults to 0, 45, 90 and 135.
 
     Returns
     -------
-    np.array
-        Difference part of variogram calculations
+    list of list of tuple
+        (row, column) offsets for each direction.
     """
-    pvario = functools.partial(neighbour_diff_squared, lag=lag, func=func)
+    offsets = ring_offsets(lag)
+    angles = np.array([np.degrees(np.arctan2(-y_off, x_off)) % 180 for y_off, x_off in offsets])
 
-    if y is None:
-        x = da.overlap.overlap(x, depth={0: lag, 1: lag}, boundary={0: "reflect", 1: "reflect"})
-        y = x
-    else:
-        x = da.overlap.overlap(x, depth={0: lag, 1: lag}, boundary={0: "reflect", 1: "reflect"})
-        y = da.overlap.overlap(y, depth={0: lag, 1: lag}, boundary={0: "reflect", 1: "reflect"})
+    dist = np.abs(angles[:, np.newaxis] - np.asarray(directions, dtype=float)[np.newaxis] % 180)
+    dist = np.minimum(dist, 180 - dist)
+    nearest = np.argmin(dist, axis=1)
 
-    res = da.map_blocks(pvario, x, y)
-    res = da.overlap.trim_internal(res, {0: lag, 1: lag})
+    groups = [[off for off, n in zip(offsets, nearest) if n == d] for d in range(len(directions))]
 
-    return res
+    empty = [directions[d] for d, g in enumerate(groups) if not g]
+    if empty:
+        raise ValueError("No neighbours at lag {} in directions {}.".format(lag, empty))
+
+    return groups
 
 
-def convolution(x, win_size=5, win_geom="square", kernel=None, **kwargs):
+def neighbour_diff_directional(arr1, arr2=None, lag=1, directions=(0, 45, 90, 135), func="nd_variogram",
+                               backend=None):
     """
-    Convolute array with kernel and normalize by count of kernel
-    elements > 0.
+    Calculates the innermost step of a variogram for each direction in one sweep over the neighbours.
+
+    Each neighbour offset is added to the result of its direction (see :func:`direction_offsets`).
+    The results are scaled by the number of neighbours at the lag over the number of
+    neighbours in the direction, so :func:`window_sum` gives the directional textures.
 
     Parameters
     ----------
-    x : array like
-        Input array
-    win_size : int, optional
-        Length of one side of window. Window will be of size window*window.
-        Defaults to 5.
-    geom : {"square", "round"}
-        Geometry of the kernel. Defaults to square.
-    kernel : np.array, optional
-        Custom kernel to use for convolution. If specified `geom` and `win_size`
-        parameter will be ignored.
+    arr1 : np.array
+    arr2 : np.array, optional
+    lag : int or list of int, optional
+        The lag distance for the variogram, defaults to 1.
+    directions : list of float
+        Directions in degrees, defaults to 0, 45, 90 and 135.
+    func : {nd_variogram, nd_madogram, nd_rodogram}
+        Calculation method of innermost step.
+    backend : str, optional
+        Compute backend, see :mod:`textory.backends`.
 
     Returns
     -------
-    array like
-        Array where each element is the variogram of the window around the element
-
+    np.array
+        Results of the directions stacked along a new axis in front of the batch and
+        spatial axes (after the lag axis if a list of lags is given).
     """
-    if kernel is not None:
-        k = create_kernel(kernel=kernel)
-    else:
-        k = create_kernel(n=win_size, geom=win_geom)
+    kernel = get_kernel(func, backend)
 
-    #create convolve function with reduced parameters for map_overlap
-    pcon = functools.partial(convolve, weights=k, mode="constant", cval=0.0)
+    rows, cols = arr1.shape[-2:]
 
-    if isinstance(x, da.core.Array):
-        conv_padding = int(win_size // 2)
-        res = x.map_overlap(pcon, depth={0: conv_padding, 1: conv_padding}, boundary={0: 0.0, 1: 0.0})
-    else:
-        res = pcon(x)
+    if arr2 is None:
+        arr2 = arr1
 
-    kernel_significant_elements = np.where(k > 0, 1, 0)
-    num_pix = np.sum(kernel_significant_elements)
+    lags = _as_lags(lag)
+    dtype = arr1.dtype if np.issubdtype(arr1.dtype, np.floating) else np.float64
+    out_arr = np.zeros((len(lags), len(directions)) + arr1.shape, dtype=dtype)
+    work = np.empty((1,) + arr1.shape, dtype=dtype)
 
-    return res / num_pix
+    for i, lg in enumerate(lags):
+        groups = direction_offsets(lg, directions)
+        for d, group in enumerate(groups):
+            for y_off, x_off in group:
+                view_in, view_out = view(y_off, x_off, rows, cols)
+                kernel(out_arr[i, d][view_out], arr1[view_out], arr2[view_in], work[(slice(None),) + view_out])
+
+            out_arr[i, d] *= num_neighbours(lg) / len(group)
+
+    if np.ndim(lag) == 0:
+        out_arr = out_arr[0]
+
+    return out_arr
 
 
-def window_sum(x, lag=1, win_size=5, win_geom="square", kernel=None):
+def _stacked_estimator_diff(x, lag=1, funcs=("nd_variogram", "nd_madogram", "nd_rodogram"), backend=None):
     """
-    Calculate the window sum for the various textures
+    Differences of :func:`neighbour_diff_estimators` with the estimator axis after the lag axis (if any).
+
+    The lag axis stays the first axis so the result can be passed to :func:`window_sum`.
+    """
+    diff = neighbour_diff_estimators(x, lag=lag, funcs=funcs, backend=backend)
+
+    return np.moveaxis(diff, 0, 1) if np.ndim(lag) > 0 else diff
+
+
+def _dask_neighbour_diff_estimators(x, lag=1, funcs=("nd_variogram", "nd_madogram", "nd_rodogram"),
+                                    memory_budget=None, backend=None):
+    """
+    Calculate the innermost steps of several variogram estimators at once for dask arrays.
+
+    See :func:`neighbour_diff_estimators`.
 
     Parameters
     ----------
-    x : array like
-        Input array
-    lag : int
-        Lag distance for variogram, defaults to 1.
-    win_size : int, optional
-        Length of one side of window. Window will be of size window*window.
-        Defaults to 5.
-    geom : {"square", "round"}
-        Geometry of the kernel. Defaults to square.
-    kernel : np.array, optional
-        Custom kernel to use for convolution. If specified `geom` and `win_size`
-        parameter will be ignored.
+    x : dask.array.Array
+    lag : int or list of int, optional
+    funcs : list of {nd_variogram, nd_madogram, nd_rodogram}
+    memory_budget : int or str, optional
+        Memory budget per task, defaults to the "textory.memory_budget" dask config.
+    backend : str, optional
+        Compute backend, see :mod:`textory.backends`.
 
     Returns
     -------
-    array like
-        Array where each element is the variogram of the window around the element
+    dask.array.Array
+    """
+    pdiff = functools.partial(neighbour_diff_estimators, lag=lag, funcs=funcs, backend=backend_name(backend))
+
+    lags = _as_lags(lag)
+    new_axes = (len(funcs), len(lags)) if np.ndim(lag) > 0 else (len(funcs),)
 
+    dtype = x.dtype if np.issubdtype(x.dtype, np.floating) else np.dtype(np.float64)
+    bytes_per_element = x.dtype.itemsize + dtype.itemsize * (2 + len(funcs) * len(lags))
+
+    res = _halo_map_blocks(pdiff, x, depth=max(lags), boundary="reflect", new_axes=new_axes, dtype=dtype,
+                           bytes_per_element=bytes_per_element, memory_budget=memory_budget)
+
+    return res
+
+
+def _memory_budget(memory_budget=None):
     """
-    res = convolution(x, win_size=win_size, win_geom=win_geom, kernel=kernel)
+    Memory budget per task in bytes from the argument or the "textory.memory_budget" dask config.
 
-    #calculate 1/2N part of variogram
-    neighbours = num_neighbours(lag)
+    Strings like "500MB" are accepted. Returns None if there is no budget.
+    """
+    if memory_budget is None:
+        memory_budget = dask.config.get("textory.memory_budget", None)
 
-    factor = 2 * neighbours
+    if isinstance(memory_budget, str):
+        memory_budget = dask.utils.parse_bytes(memory_budget)
 
-    return res / factor
+    return memory_budget
 
 
-def _win_view_stat(x, win_size=5, stat="nanmean", **kwargs):
+def _budget_rechunk(x, depth=0, bytes_per_element=8, memory_budget=None):
     """
-    Calculates specified basic statistical measure for a moveing window
-    over an array.
+    Rechunk dask array so that a task on a block extended by a halo stays within the memory budget.
+
+    The memory of a task is estimated as `bytes_per_element` times the number of
+    elements of the block extended by `depth` on the spatial axes (times the length
+    of the leading axes). Arrays are only rechunked if their largest block exceeds the
+    budget. Leading (batch) axes are split in single elements first, the spatial chunks
+    are then reduced to the largest square which fits, but never below `depth` as the
+    halo can only be taken from the direct neighbours.
 
     Parameters
     ----------
-    x : np.array
-    win_size : int, optional
-        Window size, defaults to 5.
-    stat : {"nanmean", "nanmax", "nanmin", "nanmedian", "nanstd"}
-        Statistical measure to calculate.
-    kwargs : optional
-        Additional keyword arguments some stat may need.
+    x : dask.array.Array
+    depth : int, optional
+        Size of the halo.
+    bytes_per_element : float, optional
+        Estimated peak memory of the task per element of the extended block.
+    memory_budget : int or str, optional
+        Memory budget per task in bytes, defaults to the "textory.memory_budget" dask config.
+        Without budget the array is returned unchanged.
 
     Returns
     -------
-    np.array
+    dask.array.Array
+    """
+    budget = _memory_budget(memory_budget)
+    if budget is None:
+        return x
+
+    lead = int(np.prod([max(c) for c in x.chunks[:-2]]))
+    element_bytes = lead * bytes_per_element
+
+    rows, cols = max(x.chunks[-2]), max(x.chunks[-1])
+    if (rows + 2 * depth) * (cols + 2 * depth) * element_bytes <= budget:
+        return x
+
+    if lead > 1:
+        #batches are split before the spatial axes as they need no halo
+        x = x.rechunk(tuple((1,) * n for n in x.shape[:-2]) + x.chunks[-2:])
+        element_bytes = bytes_per_element
+        if (rows + 2 * depth) * (cols + 2 * depth) * element_bytes <= budget:
+            return x
+
+    side = int(np.sqrt(budget / element_bytes)) - 2 * depth
+    if side < max(depth, 1):
+        warnings.warn("Memory budget of {} bytes is too small for a halo of {} elements.".format(budget, depth))
+        side = max(depth, 1)
+
+    new_rows = _balanced_chunk(x.shape[-2], min(rows, side))
+    #blocks which are already narrow can use the rest of the budget along the other axis
+    new_cols = min(cols, max(side, int(budget / (element_bytes * (new_rows + 2 * depth))) - 2 * depth))
+    new_cols = _balanced_chunk(x.shape[-1], new_cols)
 
+    return x.rechunk(x.chunks[:-2] + (new_rows, new_cols))
+
+
+def _balanced_chunk(size, max_chunk):
     """
-    #if x.shape == (1, 1):
-        #return x
+    Largest chunk size not above `max_chunk` which splits `size` in chunks of about the same size.
+    """
+    num_chunks = -(-size // max_chunk)
 
-    np_measure = getattr(np, stat)
+    return -(-size // num_chunks)
 
-    measure = functools.partial(np_measure, **kwargs) 
 
-    pad = int(win_size // 2)
-    data = np.pad(x, (pad, pad), mode="constant", constant_values=(np.nan))
+def _halo_map_blocks(func, *arrays, depth=1, boundary="reflect", new_axes=(), dtype=None, edges=False,
+                     bytes_per_element=None, memory_budget=None):
+    """
+    Apply a function to blocks of dask arrays extended by a halo.
 
-    #sh = np.asarray(x).shape
-    #mask = np.zeros_like(x)
-    #mask[pad:sh[0]-pad, pad:sh[1]-pad] = 1
+    Each block is extended by `depth` elements along the last two axes (taken from
+    the neighbouring blocks or created with `boundary` at the edges of the array)
+    before `func` is applied to it. The halo is trimmed from the result of `func`
+    which may prepend new axes to the block.
 
-    #data = np.where(mask==1, x, np.nan)
+    Parameters
+    ----------
+    func : function
+    arrays : dask.array.Array
+        Arrays with the same shape and chunks.
+    depth : int, optional
+        Size of the halo, defaults to 1.
+    boundary : str or scalar, optional
+        How to fill the halo at the array edges, see :func:`dask.array.overlap.overlap`.
+    new_axes : tuple of int, optional
+        Lengths of the axes `func` prepends to the block.
+    dtype : np.dtype, optional
+    edges : bool, optional
+        If `True` `func` gets the keyword argument `edges`, a tuple of booleans
+        telling if the top, bottom, left and right side of the block lie on the
+        edge of the array (so the halo on that side is filled with `boundary`).
+    bytes_per_element : float, optional
+        Estimated peak memory of `func` per element of the extended block. If given
+        the arrays are rechunked to stay within the memory budget (see :func:`_budget_rechunk`).
+    memory_budget : int or str, optional
+        Memory budget per task, defaults to the "textory.memory_budget" dask config.
 
-    #get windowed view of array
-    windowed = ski.util.view_as_windows(data, (win_size, win_size))
+    Returns
+    -------
+    dask.array.Array
+    """
+    ndim = arrays[0].ndim
 
-    #calculate measure over last to axis
-    res = measure(windowed, axis=(2, 3))
+    if bytes_per_element is not None:
+        x = _budget_rechunk(arrays[0], depth=depth, bytes_per_element=bytes_per_element,
+                            memory_budget=memory_budget)
+        if x.chunks != arrays[0].chunks:
+            arrays = [x] + [a.rechunk(x.chunks) for a in arrays[1:]]
+
+    #the halo can only be taken from the direct neighbour so chunks must not be smaller than it
+    if depth > 0 and any(min(c) < depth for c in arrays[0].chunks[-2:]):
+        min_chunks = arrays[0].chunks[:-2] + tuple(da.overlap.ensure_minimum_chunksize(depth, c)
+                                                   for c in arrays[0].chunks[-2:])
+        arrays = [a.rechunk(min_chunks) for a in arrays]
+
+    chunks = tuple((n,) for n in new_axes) + arrays[0].chunks
+
+    if depth > 0:
+        arrays = [da.overlap.overlap(a, depth=_spatial_axes(ndim, depth), boundary=_spatial_axes(ndim, boundary))
+                  for a in arrays]
+
+    ptrim = functools.partial(_trimmed, func, depth=depth, edges=edges)
+
+    if new_axes:
+        res = da.map_blocks(ptrim, *arrays, chunks=chunks, new_axis=list(range(len(new_axes))), dtype=dtype)
+    else:
+        res = da.map_blocks(ptrim, *arrays, chunks=chunks, dtype=dtype)
 
     return res
 
 
-#def xr_wrapper(fun):
-    ##functools wraps keeps docstrings
-    #@functools.wraps(fun)
-    #def wrapped_fun(*args, **kwargs):
-        #if isinstance(args[0], xr.core.dataarray.DataArray):
-            #out = args[0].copy()
-            #if len(args) == 2:
-                #out.data = fun(args[0].data, args[1].data, **kwargs)
-                #out.attrs["name"] = fun.__name__ + "_{}_{}".format(args[0].attrs["name"], args[1].attrs["name"])
-            #else:
-                #out.data = fun(args[0].data, **kwargs)
-                #out.attrs["name"] = fun.__name__ + "_{}".format(args[0].attrs["name"])
+def _trimmed(func, *blocks, depth=1, edges=False, block_info=None):
+    """
+    Apply function to blocks and trim `depth` elements from the last two axes of the result.
+    """
+    if edges:
+        res = func(*blocks, edges=_block_edges(block_info))
+    else:
+        res = func(*blocks)
+    rows, cols = res.shape[-2:]
 
-            #if fun.__name__ == "window_statistic":
-                #out.attrs["statistic"] = kwargs.get("stat")
-                #out.name = out.attrs["name"] + "_{stat}_{win_size}".format(**kwargs)
-            #else:
-                #out.attrs["lag_distance"] = kwargs.get("lag")
-                #out.attrs["window_geometry"] = kwargs.get("win_geom")
-                #out.name = out.attrs["name"] + "_{lag}_{win_size}_{win_geom}".format(**kwargs)
+    return res[..., depth:rows - depth, depth:cols - depth]
 
-            #out.attrs["window_size"] = kwargs.get("win_size")
-        #else:
-            #if len(args) == 2:
-                #out = fun(args[0], args[1], **kwargs)
-            #else:
-                #out = fun(args[0], **kwargs)
 
-        #return out
-    #return wrapped_fun
+def _block_edges(block_info):
+    """
+    Tell which sides (top, bottom, left, right) of a block lie on the edge of the array.
+    """
+    if block_info is None:
+        return (False, False, False, False)
 
-@decorator.decorator
-def xr_wrapper(fun, *args, **kwargs):
-    """Decorator to handle :class:`xarray.DataArray` input.
+    loc = block_info[0]["chunk-location"]
+    num = block_info[0]["num-chunks"]
 
-    Applied to functions which take one or two arrays as input
-    the decorator just applies the function in case of numpy array input.
-    In the case of :class:`xarray.DataArray` input the decorator will
-    copy over the attributes of the first input array, change the "name" attribute
-    to the function which was applied concatenated with the supplied parameters to
-    that function and the name of the input.
+    return (loc[-2] == 0, loc[-2] == num[-2] - 1, loc[-1] == 0, loc[-1] == num[-1] - 1)
 
-    Todo
-    ----
-    - handling of attributes of second input (e.g. combine attributes?!)
-    - refactor np.array case which has double code
+
+def _spatial_axes(ndim, value):
     """
-    import inspect
+    Dictionary assigning value to the last two (spatial) axes of an array with `ndim` dimensions.
+    """
+    return {ndim - 2: value, ndim - 1: value}
 
-    run_sig = inspect.getfullargspec(fun)
-    params = dict(zip(run_sig.args, args))
-    params.pop("x")
 
-    if isinstance(args[0], xr.core.dataarray.DataArray):
-        out = args[0].copy()
-        x_input = args[0]
-        if "name" not in x_input.attrs.keys():
-            x_input.attrs["name"] = "Input array"
-        if "y" in params.keys():
-            y_input = args[1]
-            if "name" not in y_input.attrs.keys():
-                y_input.attrs["name"] = "Input array"
+def _as_lags(lag):
+    """
+    List of lag distances from a single lag or a sequence of lags.
+    """
+    return [int(lg) for lg in np.atleast_1d(lag)]
 
-            params.pop("y")
-            out.data = fun(x_input.data, y_input.data, **params)
-            out.attrs["name"] = fun.__name__ + "_{}_{}".format(x_input.attrs["name"], y_input.attrs["name"])
-        else:
-            out.data = fun(x_input.data, **params)
-            out.attrs["name"] = fun.__name__ + "_{}".format(x_input.attrs["name"])
-
-        if fun.__name__ == "window_statistic":
-            out.attrs["statistic"] = params.get("stat")
-            out.name = out.attrs["name"] + "_{stat}_{win_size}".format(**params)
-        elif fun.__name__ == "tpi":
-            out.name = out.attrs["name"] + "_{win_size}".format(**params)
-        else:
-            out.attrs["lag_distance"] = params.get("lag")
-            out.attrs["window_geometry"] = params.get("win_geom")
-            out.name = out.attrs["name"] + "_{lag}_{win_size}_{win_geom}".format(**params)
 
-        out.attrs["window_size"] = params.get("win_size")
+def _dask_neighbour_diff_squared(x, y=None, lag=1, func="nd_variogram", memory_budget=None, backend=None):
+    """
+    Calculate quared difference between pixel and its
+    neighbours at specified lag for dask arrays
+
+    Parameters
+    ----------
+    x : np.array
+    y : np.array, optional
+        Defaults to None
+    lag : int or list of int, optional
+    func : {nd_variogram, nd_madogram, nd_rodogram, nd_cross_variogram}
+        Calculation method of innermost step of different variogram methods.
+    memory_budget : int or str, optional
+        Memory budget per task, defaults to the "textory.memory_budget" dask config.
+        Chunks are made smaller if a task would need more memory.
+    backend : str, optional
+        Compute backend, see :mod:`textory.backends`.
+
+    Returns
+    -------
+    np.array
+        Difference part of variogram calculations
+    """
+    pvario = functools.partial(neighbour_diff_squared, lag=lag, func=func, backend=backend_name(backend))
+
+    lags = _as_lags(lag)
+    new_axes = (len(lags),) if np.ndim(lag) > 0 else ()
+    arrays = [x] if y is None else [x, y]
+
+    dtype = x.dtype if np.issubdtype(x.dtype, np.floating) else np.dtype(np.float64)
+    bytes_per_element = x.dtype.itemsize * len(arrays) + dtype.itemsize * (1 + len(lags))
+
+    res = _halo_map_blocks(pvario, *arrays, depth=max(lags), boundary="reflect", new_axes=new_axes, dtype=dtype,
+                           bytes_per_element=bytes_per_element, memory_budget=memory_budget)
+
+    return res
+
+
+def integral_image(x):
+    """
+    Calculate the summed-area table (integral image) of an array.
+
+    The table has a leading row and column of zeros so that the sum over
+    any rectangle of `x` can be read from four of its elements. Sums are
+    accumulated in 64 bit to limit rounding errors on large arrays.
+
+    Parameters
+    ----------
+    x : np.array
+
+    Returns
+    -------
+    np.array
+        Summed-area table with one more row and column than `x`.
+    """
+    if np.issubdtype(x.dtype, np.integer):
+        acc_dtype = np.int64
+    else:
+        acc_dtype = np.float64
+
+    rows, cols = x.shape[-2:]
+    sat = np.zeros(x.shape[:-2] + (rows + 1, cols + 1), dtype=acc_dtype)
+    np.cumsum(x, axis=-2, dtype=acc_dtype, out=sat[..., 1:, 1:])
+    np.cumsum(sat[..., 1:, 1:], axis=-1, out=sat[..., 1:, 1:])
+
+    return sat
+
+
+def _window_bounds(size, win_size):
+    """
+    Start and end indices into a summed-area table for windows of size `win_size`
+    centered on each element of an axis of length `size`.
+    """
+    radius = win_size // 2
+    ind = np.arange(size)
+    lower = np.clip(ind - radius, 0, size)
+    upper = np.clip(ind + radius + 1, 0, size)
+
+    return lower, upper
+
+
+def _sat_box_sum(sat, win_size=5):
+    """
+    Read the sums of square windows centered on each element from a summed-area table.
+
+    Elements outside the array count as zero.
+
+    Parameters
+    ----------
+    sat : np.array
+        Summed-area table as returned by :func:`integral_image`.
+    win_size : int, optional
+        Length of one side of window, defaults to 5.
+
+    Returns
+    -------
+    np.array
+    """
+    rows, cols = sat.shape[-2] - 1, sat.shape[-1] - 1
+    y_low, y_up = _window_bounds(rows, win_size)
+    x_low, x_up = _window_bounds(cols, win_size)
+
+    res = np.take(sat, y_up, axis=-2) - np.take(sat, y_low, axis=-2)
+    res = np.take(res, x_up, axis=-1) - np.take(res, x_low, axis=-1)
+
+    return res
+
+
+def _box_sum(x, win_size=5):
+    """
+    Sum over square windows of a numpy array using a summed-area table.
+
+    Gives the same result as convolving with a kernel of ones with zero padding
+    but the cost per element does not depend on the window size. Windows which
+    contain non finite values are set to NaN.
+
+    Parameters
+    ----------
+    x : np.array
+    win_size : int or list of int, optional
+        Length of one side of window, defaults to 5. For a list of window sizes
+        the summed-area table is only built once and the sums for all windows
+        are stacked along a new first axis.
+
+    Returns
+    -------
+    np.array
+    """
+    x = np.asarray(x)
+
+    nonfinite = None
+    if np.issubdtype(x.dtype, np.inexact):
+        finite = np.isfinite(x)
+        if not finite.all():
+            nonfinite = ~finite
+            x = np.where(finite, x, 0)
+
+    sat = integral_image(x)
+    if nonfinite is not None:
+        nonfinite_sat = integral_image(nonfinite)
+
+    res = []
+    for w in _as_win_sizes(win_size):
+        r = _sat_box_sum(sat, win_size=w)
+
+        if nonfinite is not None:
+            nonfinite_count = _sat_box_sum(nonfinite_sat, win_size=w)
+            r[nonfinite_count > 0] = np.nan
+
+        res.append(r.astype(x.dtype, copy=False))
+
+    if np.ndim(win_size) > 0:
+        return np.stack(res)
+
+    return res[0]
+
+
+def _as_win_sizes(win_size):
+    """
+    List of window sizes from a single window size or a sequence of window sizes.
+    """
+    win_sizes = [int(w) for w in np.atleast_1d(win_size)]
+
+    if any(w % 2 == 0 for w in win_sizes):
+        raise ValueError("Window size must be odd.")
+
+    return win_sizes
+
+
+def box_sum(x, win_size=5, memory_budget=None):
+    """
+    Sum over a square moving window.
+
+    The sums are read from a summed-area table so the cost per element
+    is constant whatever the window size. Elements outside the array
+    count as zero, the same as for :func:`convolution`.
+
+    Parameters
+    ----------
+    x : array like
+        Input array
+    win_size : int or list of int, optional
+        Length of one side of window. Window will be of size window*window.
+        Defaults to 5. If a list of window sizes is given, all window sums are
+        read from the same summed-area table and stacked along a new first axis.
+    memory_budget : int or str, optional
+        Memory budget per task for dask arrays, defaults to the "textory.memory_budget"
+        dask config. Chunks are made smaller if a task would need more memory.
+
+    Returns
+    -------
+    array like
+        Array where each element is the sum of the window around the element
+    """
+    win_sizes = _as_win_sizes(win_size)
+
+    pbox = functools.partial(_box_sum, win_size=win_size)
+
+    if isinstance(x, da.core.Array):
+        conv_padding = int(max(win_sizes) // 2)
+        bytes_per_element = x.dtype.itemsize * (1 + len(win_sizes)) + WORK_BYTES["sat"]
+        x = _budget_rechunk(x, depth=conv_padding, bytes_per_element=bytes_per_element,
+                            memory_budget=memory_budget)
+
+        if np.ndim(win_size) > 0:
+            res = _halo_map_blocks(pbox, x, depth=conv_padding, boundary=0.0, new_axes=(len(win_sizes),),
+                                   dtype=x.dtype)
+        else:
+            res = x.map_overlap(pbox, depth=_spatial_axes(x.ndim, conv_padding),
+                                boundary=_spatial_axes(x.ndim, 0.0), dtype=x.dtype)
+    else:
+        res = pbox(x)
+
+    return res
+
+
+def _is_box_kernel(k):
+    """
+    Check if kernel is square and all its elements are one.
+    """
+    return k.shape[0] == k.shape[1] and bool(np.all(k == 1))
+
+
+def _fft_convolve(x, weights):
+    """
+    Convolve numpy array with kernel using overlap-add FFT convolution.
+
+    Gives the same result as :func:`scipy.ndimage.convolve` with zero padding
+    up to floating point precision. Like there, non finite values spread to
+    all elements covered by the non zero elements of the kernel. The transforms
+    are calculated in float64 and the round off of convolving non negative
+    values (e.g. squared differences) with a non negative kernel is clipped at 0.
+
+    Parameters
+    ----------
+    x : np.array
+    weights : np.array
+        Kernel
+
+    Returns
+    -------
+    np.array
+    """
+    x = np.asarray(x)
+
+    #float32 transforms give round off of the order of the largest values in the block
+    calc_dtype = np.result_type(x.dtype, np.float64)
+
+    nonfinite = None
+    if np.issubdtype(x.dtype, np.inexact):
+        finite = np.isfinite(x)
+        if not finite.all():
+            nonfinite = ~finite
+            x = np.where(finite, x, 0)
+
+    k = np.asarray(weights, dtype=calc_dtype).reshape((1,) * (x.ndim - 2) + weights.shape)
+    res = oaconvolve(x.astype(calc_dtype, copy=False), k, mode="same", axes=(-2, -1))
+
+    if np.isrealobj(x) and (np.asarray(weights) >= 0).all() and (x.size == 0 or x.min() >= 0):
+        np.maximum(res, 0, out=res)
+
+    if nonfinite is not None:
+        #as with direct convolution, non finite values spread over the non zero elements of the kernel
+        footprint = (k != 0).astype(calc_dtype)
+        nonfinite_count = oaconvolve(nonfinite.astype(calc_dtype), footprint, mode="same", axes=(-2, -1))
+        res[nonfinite_count > 0.5] = np.nan
+
+    if not np.issubdtype(x.dtype, np.inexact):
+        res = np.round(res)
+
+    return res.astype(x.dtype, copy=False)
+
+
+def convolution(x, win_size=5, win_geom="square", kernel=None, method="auto", memory_budget=None, **kwargs):
+    """
+    Convolute array with kernel and normalize by count of kernel
+    elements > 0.
+
+    Parameters
+    ----------
+    x : array like
+        Input array
+    win_size : int or list of int, optional
+        Length of one side of window. Window will be of size window*window.
+        Defaults to 5. If a list of window sizes is given the results for all
+        windows are stacked along a new first axis. For square windows they are
+        all read from the same summed-area table.
+    geom : {"square", "round"}
+        Geometry of the kernel. Defaults to square.
+    kernel : np.array, optional
+        Custom kernel to use for convolution. If specified `geom` and `win_size`
+        parameter will be ignored.
+    method : {"auto", "sat", "fft", "convolve"}
+        Algorithm for the window sums. "sat" uses a summed-area table (see :func:`box_sum`)
+        and only works for square kernels of ones, "fft" uses overlap-add FFT convolution
+        and "convolve" uses :func:`scipy.ndimage.convolve`. "auto" (default) picks "sat" whenever
+        the kernel allows and is at least `SAT_MIN_WIN_SIZE` wide, "fft" for other kernels
+        at least `FFT_MIN_WIN_SIZE` wide and "convolve" otherwise.
+    memory_budget : int or str, optional
+        Memory budget per task for dask arrays, defaults to the "textory.memory_budget"
+        dask config. Chunks are made smaller if a task would need more memory.
+
+    Returns
+    -------
+    array like
+        Array where each element is the variogram of the window around the element
+
+    """
+    if kernel is None and np.ndim(win_size) > 0:
+        return _multi_window_convolution(x, win_sizes=win_size, win_geom=win_geom, method=method,
+                                         memory_budget=memory_budget)
+
+    if kernel is not None:
+        k = create_kernel(kernel=kernel)
+    else:
+        k = create_kernel(n=win_size, geom=win_geom)
+
+    if method == "auto":
+        if _is_box_kernel(k) and k.shape[0] >= SAT_MIN_WIN_SIZE:
+            method = "sat"
+        elif k.shape[0] >= FFT_MIN_WIN_SIZE:
+            method = "fft"
+        else:
+            method = "convolve"
+
+    if method == "sat":
+        if not _is_box_kernel(k):
+            raise ValueError("Summed-area tables can only be used with square kernels of ones.")
+
+        res = box_sum(x, win_size=k.shape[0], memory_budget=memory_budget)
+    elif method in ["fft", "convolve"]:
+        #create convolve function with reduced parameters for map_overlap
+        if method == "fft":
+            pcon = functools.partial(_fft_convolve, weights=k)
+        else:
+            #leading (stacked) axes are not convolved
+            weights = k.reshape((1,) * (x.ndim - 2) + k.shape)
+            pcon = functools.partial(convolve, weights=weights, mode="constant", cval=0.0)
+
+        if isinstance(x, da.core.Array):
+            #each chunk gets a halo of half the kernel size so the FFT of each chunk
+            #sees the same neighbourhood as a convolution of the whole array
+            conv_padding = int(k.shape[0] // 2)
+            x = _budget_rechunk(x, depth=conv_padding, bytes_per_element=2 * x.dtype.itemsize + WORK_BYTES[method],
+                                memory_budget=memory_budget)
+            res = x.map_overlap(pcon, depth=_spatial_axes(x.ndim, conv_padding),
+                                boundary=_spatial_axes(x.ndim, 0.0), dtype=x.dtype)
+        else:
+            res = pcon(x)
+    else:
+        raise ValueError("Unknown convolution method '{}'.".format(method))
+
+    kernel_significant_elements = np.where(k > 0, 1, 0)
+    num_pix = np.sum(kernel_significant_elements)
+
+    return res / num_pix
+
+
+def _multi_window_convolution(x, win_sizes, win_geom="square", method="auto", memory_budget=None):
+    """
+    Normalized window sums for several window sizes stacked along a new first axis.
+
+    For square windows all sums are read from one summed-area table,
+    for other geometries each window is convolved separately.
+    """
+    win_sizes = _as_win_sizes(win_sizes)
+
+    if win_geom == "square" and method in ["auto", "sat"]:
+        res = box_sum(x, win_size=win_sizes, memory_budget=memory_budget)
+        num_pix = _broadcast_factor([w**2 for w in win_sizes], res.ndim, res.dtype)
+
+        return res / num_pix
+
+    stack = da.stack if isinstance(x, da.core.Array) else np.stack
+
+    return stack([convolution(x, win_size=w, win_geom=win_geom, method=method, memory_budget=memory_budget)
+                  for w in win_sizes])
+
+
+def _broadcast_factor(values, ndim, dtype, axis=0):
+    """
+    Array of factors which broadcasts along `axis` of an array with `ndim` dimensions.
+    """
+    shape = [1] * ndim
+    shape[axis] = -1
+    factor = np.array(values).reshape(shape)
+
+    if np.issubdtype(dtype, np.floating):
+        factor = factor.astype(dtype)
+
+    return factor
+
+
+def window_sum(x, lag=1, win_size=5, win_geom="square", kernel=None, method="auto", memory_budget=None):
+    """
+    Calculate the window sum for the various textures
+
+    Parameters
+    ----------
+    x : array like
+        Input array. If `lag` is a list the differences for each lag are
+        stacked along the first axis.
+    lag : int or list of int
+        Lag distance for variogram, defaults to 1.
+    win_size : int or list of int, optional
+        Length of one side of window. Window will be of size window*window.
+        Defaults to 5. If a list of window sizes is given the results are stacked
+        along a new axis after the lag axis (if any).
+    geom : {"square", "round"}
+        Geometry of the kernel. Defaults to square.
+    kernel : np.array, optional
+        Custom kernel to use for convolution. If specified `geom` and `win_size`
+        parameter will be ignored.
+    method : {"auto", "sat", "fft", "convolve"}
+        Algorithm for the window sums, see :func:`convolution`.
+    memory_budget : int or str, optional
+        Memory budget per task for dask arrays, see :func:`convolution`.
+
+    Returns
+    -------
+    array like
+        Array where each element is the variogram of the window around the element
+
+    """
+    res = convolution(x, win_size=win_size, win_geom=win_geom, kernel=kernel, method=method,
+                      memory_budget=memory_budget)
+
+    multi_win = kernel is None and np.ndim(win_size) > 0
+
+    #calculate 1/2N part of variogram
+    if np.ndim(lag) > 0:
+        lag_axis = 1 if multi_win else 0
+        neighbours = _broadcast_factor([num_neighbours(lg) for lg in _as_lags(lag)], res.ndim, res.dtype,
+                                       axis=lag_axis)
+    else:
+        neighbours = num_neighbours(lag)
+
+    factor = 2 * neighbours
+
+    res = res / factor
+
+    if multi_win and np.ndim(lag) > 0:
+        res = np.moveaxis(res, 0, 1)
+
+    return res
+
+
+def _fused_window_sum(*blocks, diff_func=None, lag=1, win_size=5, win_geom="square", method="auto",
+                      depth=0, edges=(False, False, False, False)):
+    """
+    Calculate the neighbour differences and their window sums for blocks extended by a halo.
+
+    Differences in the halo outside of the array are set to zero, as the window
+    sums of the whole array treat elements outside of the array as zero.
+    """
+    diff = diff_func(*blocks)
+
+    top, bottom, left, right = edges
+    if top:
+        diff[..., :depth, :] = 0
+    if bottom:
+        diff[..., diff.shape[-2] - depth:, :] = 0
+    if left:
+        diff[..., :, :depth] = 0
+    if right:
+        diff[..., :, diff.shape[-1] - depth:] = 0
+
+    return window_sum(diff, lag=lag, win_size=win_size, win_geom=win_geom, method=method)
+
+
+def _window_texture_bytes(itemsize, num_inputs=1, num_fields=1, num_win=1, method="auto", win_geom="square",
+                          win_size=None):
+    """
+    Estimated peak memory per element of calculating differences and their window sums.
+
+    Parameters
+    ----------
+    itemsize : int
+        Bytes per element of the input.
+    num_inputs : int, optional
+        Number of input arrays.
+    num_fields : int, optional
+        Number of difference fields (lags times estimators).
+    num_win : int, optional
+        Number of window sizes.
+    method : {"auto", "sat", "fft", "convolve", "direct"}
+    win_geom : {"square", "round"}
+    win_size : int, optional
+        Largest window size, used to tell which method "auto" selects.
+    """
+    return sum(_window_texture_terms(itemsize, num_inputs, num_fields, num_win, method=method, win_geom=win_geom,
+                                     win_size=win_size).values())
+
+
+def _window_texture_terms(itemsize, num_inputs=1, num_fields=1, num_win=1, method="auto", win_geom="square",
+                          win_size=None):
+    """
+    Components of :func:`_window_texture_bytes` by the arrays they are needed for.
+
+    Returns
+    -------
+    dict
+        Bytes per element of the "inputs", the "difference_field", the "window_sums" (and their
+        normalized copies) and the "scratch" arrays of the window sum method.
+    """
+    terms = {"inputs": itemsize * num_inputs}
+
+    if method == "direct":
+        #only a few rows of differences are kept per task
+        terms["window_sums"] = itemsize * num_fields * num_win
+        return terms
+
+    if method == "auto":
+        method = "sat" if win_geom == "square" else "fft"
+        min_size = SAT_MIN_WIN_SIZE if win_geom == "square" else FFT_MIN_WIN_SIZE
+        if win_size is not None and win_size < min_size:
+            method = "convolve"
+
+    terms["difference_field"] = itemsize * num_fields
+    terms["window_sums"] = itemsize * num_fields * 2 * num_win
+    terms["scratch"] = num_fields * WORK_BYTES[method]
+
+    return terms
+
+
+def _dask_window_texture(diff_func, *arrays, lag=1, win_size=5, win_geom="square", method="auto", diff_axes=(),
+                         memory_budget=None):
+    """
+    Calculate a texture for dask arrays with one halo exchange.
+
+    Instead of extending the blocks once by `lag` for the neighbour differences
+    and again by `win_size` // 2 for the window sums, the blocks are extended once
+    by both and the differences and window sums are calculated in the same task.
+    So the differences never become part of the graph.
+
+    Parameters
+    ----------
+    diff_func : function
+        Function calculating the neighbour differences of numpy blocks, e.g.
+        :func:`neighbour_diff_squared` with reduced parameters.
+    arrays : dask.array.Array
+        Input arrays with the same shape and chunks.
+    lag : int or list of int, optional
+    win_size : int or list of int, optional
+    win_geom : {"square", "round"}
+    method : {"auto", "sat", "fft", "convolve"}
+        See :func:`window_sum`.
+    diff_axes : tuple of int, optional
+        Lengths of the axes `diff_func` inserts after the lag axis (if any).
+    memory_budget : int or str, optional
+        Memory budget per task, defaults to the "textory.memory_budget" dask config.
+        Chunks are made smaller if a task would need more memory.
+
+    Returns
+    -------
+    dask.array.Array
+        Same result as :func:`window_sum` of the differences.
+    """
+    x = arrays[0]
+    lags = _as_lags(lag)
+    win_sizes = _as_win_sizes(win_size)
+
+    depth = max(lags) + int(max(win_sizes) // 2)
+
+    new_axes = ()
+    if np.ndim(lag) > 0:
+        new_axes += (len(lags),)
+    if np.ndim(win_size) > 0:
+        new_axes += (len(win_sizes),)
+    new_axes += tuple(diff_axes)
+
+    dtype = x.dtype if np.issubdtype(x.dtype, np.floating) else np.float64
+
+    num_fields = len(lags) * int(np.prod(diff_axes))
+    bytes_per_element = _window_texture_bytes(x.dtype.itemsize, len(arrays), num_fields, len(win_sizes),
+                                              method=method, win_geom=win_geom, win_size=max(win_sizes))
+
+    pfused = functools.partial(_fused_window_sum, diff_func=diff_func, lag=lag, win_size=win_size,
+                               win_geom=win_geom, method=method, depth=depth)
+
+    res = _halo_map_blocks(pfused, *arrays, depth=depth, boundary="reflect", new_axes=new_axes,
+                           dtype=dtype, edges=True, bytes_per_element=bytes_per_element,
+                           memory_budget=memory_budget)
+
+    return res
+
+
+def _direct_diff_row(t, arr1, arr2, channels, diff, work):
+    """
+    Neighbour differences of row `t` for each channel, written into `diff`.
+
+    A channel is a tuple of the innermost step, its kernel, the neighbour offsets
+    to accumulate and the factor the accumulated row is scaled by.
+    """
+    rows, cols = arr1.shape
+    diff[...] = 0
+
+    for e, (func, kernel, offsets, scale) in enumerate(channels):
+        for y_off, x_off in offsets:
+            s = t + y_off
+            if s < 0 or s >= rows:
+                continue
+
+            (_, _, x_in), (_, _, x_out) = view(0, x_off, 1, cols)
+            if func == "nd_cross_variogram":
+                kernel(diff[e][:, x_out], arr1[t:t + 1, x_out], arr2[s:s + 1, x_in], arr1[s:s + 1, x_in],
+                       arr2[t:t + 1, x_out], work[:, :, x_out])
+            else:
+                kernel(diff[e][:, x_out], arr1[t:t + 1, x_out], arr2[s:s + 1, x_in], work[:, :, x_out])
+
+        if scale != 1:
+            diff[e] *= scale
+
+
+def _row_window_sums(csum, half_width):
+    """
+    Sums over windows of `2 * half_width + 1` elements along the last axis read from cumulative sums
+    with a leading zero. Elements outside the array count as zero.
+    """
+    lower, upper = _window_bounds(csum.shape[-1] - 1, 2 * half_width + 1)
+
+    return csum[..., upper] - csum[..., lower]
+
+
+def _leading_cumsum(x):
+    """
+    Cumulative sum along the last axis with a leading zero.
+    """
+    csum = np.zeros(x.shape[:-1] + (x.shape[-1] + 1,), dtype=x.dtype)
+    np.cumsum(x, axis=-1, out=csum[..., 1:])
+
+    return csum
+
+
+def _direct_texture(arr1, arr2=None, lag=1, win_size=5, win_geom="square", funcs=("nd_variogram",), backend=None,
+                    directions=None):
+    """
+    Window sums of the neighbour differences for one lag and window size without the full difference field.
+
+    With `directions` the first of `funcs` is accumulated for each direction separately
+    and scaled like in :func:`neighbour_diff_directional`.
+
+    The rows are processed from top to bottom. The differences of each row entering the
+    window are kept in a ring buffer of `win_size` rows. For square windows the buffer
+    is added to (and the row leaving the window subtracted from) a running sum over the
+    columns whose horizontal window sums give the result row. For round windows each
+    buffered row keeps its cumulative sum and each kernel row reads its own window width.
+    Windows containing non finite differences are set to NaN like in :func:`box_sum`.
+
+    Returns
+    -------
+    np.array
+        Normalized textures of the innermost steps `funcs` (or the directions) stacked along a new first axis.
+    """
+    rows, cols = arr1.shape
+
+    if arr2 is None:
+        arr2 = arr1
+
+    calc_dtype = arr1.dtype if np.issubdtype(arr1.dtype, np.floating) else np.dtype(np.float64)
+    arr1 = arr1.astype(calc_dtype, copy=False)
+    arr2 = arr2.astype(calc_dtype, copy=False)
+
+    k = create_kernel(n=win_size, geom=win_geom) > 0
+    radius = win_size // 2
+    half_widths = k.sum(axis=1) // 2
+    square = bool(k.all())
+
+    if directions is None:
+        channels = [(f, get_kernel(f, backend), ring_offsets(lag), 1) for f in funcs]
+    else:
+        kernel = get_kernel(funcs[0], backend)
+        channels = [(funcs[0], kernel, group, num_neighbours(lag) / len(group))
+                    for group in direction_offsets(lag, directions)]
+    num = len(channels)
+
+    diff = np.empty((num, 1, cols), dtype=calc_dtype)
+    work = np.empty((2, 1, cols), dtype=calc_dtype)
+
+    #differences (or their cumulative sums for round windows) of the rows in the window
+    ring = np.zeros((num, win_size, cols if square else cols + 1), dtype=np.float64)
+    ring_bad = np.zeros(ring.shape, dtype=np.int64)
+    col_sum = np.zeros((num, cols), dtype=np.float64)
+    col_bad = np.zeros((num, cols), dtype=np.int64)
+
+    res = np.empty((num, rows, cols), dtype=calc_dtype)
+
+    for t in range(rows + radius):
+        slot = t % win_size
+
+        if square:
+            #row t - win_size leaves the window
+            col_sum -= ring[:, slot]
+            col_bad -= ring_bad[:, slot]
+
+        if t < rows:
+            _direct_diff_row(t, arr1, arr2, channels, diff, work)
+            row = diff[:, 0].astype(np.float64)
+            bad = ~np.isfinite(row)
+            row[bad] = 0
+
+            if square:
+                ring[:, slot] = row
+                ring_bad[:, slot] = bad
+                col_sum += row
+                col_bad += bad
+            else:
+                ring[:, slot] = _leading_cumsum(row)
+                ring_bad[:, slot] = _leading_cumsum(bad.astype(np.int64))
+        else:
+            ring[:, slot] = 0
+            ring_bad[:, slot] = 0
+
+        o = t - radius
+        if o < 0:
+            continue
+
+        if square:
+            acc = _row_window_sums(_leading_cumsum(col_sum), radius)
+            acc_bad = _row_window_sums(_leading_cumsum(col_bad), radius)
+        else:
+            acc = np.zeros((num, cols), dtype=np.float64)
+            acc_bad = np.zeros((num, cols), dtype=np.int64)
+            for kr, h in enumerate(half_widths):
+                s = o - radius + kr
+                if s < 0 or s >= rows or not k[kr].any():
+                    continue
+                acc += _row_window_sums(ring[:, s % win_size], h)
+                acc_bad += _row_window_sums(ring_bad[:, s % win_size], h)
+
+        acc[acc_bad > 0] = np.nan
+        res[:, o] = acc
+
+    return res / (k.sum() * 2 * num_neighbours(lag))
+
+
+def _direct_window_texture(arr1, arr2=None, lag=1, win_size=5, win_geom="square", func="nd_variogram",
+                           backend=None, directions=None):
+    """
+    Numpy part of :func:`direct_window_texture`.
+    """
+    funcs = list(func) if isinstance(func, (tuple, list)) else [func]
+
+    if arr2 is None:
+        arr2 = arr1
+
+    #the rows of each 2-D array of a batch are processed one after the other
+    lead = arr1.shape[:-2]
+    batch = [np.stack([np.stack([_direct_texture(arr1[b], arr2[b], lag=lg, win_size=w, win_geom=win_geom,
+                                                 funcs=funcs, backend=backend, directions=directions)
+                                 for w in _as_win_sizes(win_size)])
+                       for lg in _as_lags(lag)])
+             for b in np.ndindex(lead)]
+
+    res = np.stack(batch).reshape(lead + batch[0].shape)
+    #batch axes follow the lag, window size and innermost step axes
+    res = np.moveaxis(res, list(range(len(lead))), list(range(3, 3 + len(lead))))
+
+    if not isinstance(func, (tuple, list)) and directions is None:
+        res = res[:, :, 0]
+    if np.ndim(win_size) == 0:
+        res = res[:, 0]
+    if np.ndim(lag) == 0:
+        res = res[0]
+
+    return res
+
+
+def _fused_direct(*blocks, depth=0, edges=(False, False, False, False), **kwargs):
+    """
+    :func:`_direct_window_texture` for blocks extended by a halo.
+
+    The halo outside of the array is cut off before the calculation, so the blocks
+    at the edges see the same neighbourhood as the whole array, and filled with
+    zeros afterwards (it is trimmed from the result anyway).
+    """
+    top, bottom, left, right = edges
+    rows, cols = blocks[0].shape[-2:]
+    y_slice = slice(depth if top else 0, rows - depth if bottom else rows)
+    x_slice = slice(depth if left else 0, cols - depth if right else cols)
+
+    res = _direct_window_texture(*[b[..., y_slice, x_slice] for b in blocks], **kwargs)
+
+    out = np.zeros(res.shape[:-2] + (rows, cols), dtype=res.dtype)
+    out[..., y_slice, x_slice] = res
+
+    return out
+
+
+def direct_window_texture(x, y=None, lag=1, win_size=5, win_geom="square", func="nd_variogram", backend=None,
+                          memory_budget=None, directions=None):
+    """
+    Calculate a texture of the variogram family without materializing the neighbour differences.
+
+    Gives the same result as :func:`window_sum` of :func:`neighbour_diff_squared` (with
+    `method` "sat" for square and "convolve" for round windows up to floating point
+    precision) but the differences are calculated row by row and summed over the windows
+    with running sums. Besides the inputs and the result only `win_size` rows of differences
+    are kept in memory, at the cost of one pass over the rows for each lag and window size.
+
+    Parameters
+    ----------
+    x : array like
+        Input array
+    y : array like, optional
+        Second input array for the cross textures.
+    lag : int or list of int, optional
+        Lag distance, defaults to 1. Results for a list of lags are stacked along a new first axis.
+    win_size : int or list of int, optional
+        Length of one side of window, defaults to 5. Results for a list of window sizes are
+        stacked along a new axis after the lag axis (if any).
+    win_geom : {"square", "round"}
+        Geometry of the window. Defaults to square.
+    func : str or tuple of str
+        Innermost step (see :func:`neighbour_diff_squared`) or a tuple of them whose results
+        are stacked along a new axis in front of the batch and spatial axes.
+    backend : str, optional
+        Compute backend of the innermost steps, see :mod:`textory.backends`.
+    memory_budget : int or str, optional
+        Memory budget per task for dask arrays, defaults to the "textory.memory_budget" dask config.
+    directions : list of float, optional
+        Accumulate the innermost step `func` (a single one) separately for the neighbours of each
+        direction like :func:`neighbour_diff_directional`. The results are stacked along a new axis
+        in front of the batch and spatial axes.
+
+    Returns
+    -------
+    array like
+    """
+    if directions is not None:
+        if isinstance(func, (tuple, list)):
+            raise ValueError("Directions need a single innermost step, got {}.".format(func))
+        directions = list(directions)
+
+    pdirect = functools.partial(_direct_window_texture, lag=lag, win_size=win_size, win_geom=win_geom,
+                                func=func, backend=backend_name(backend), directions=directions)
+
+    if not isinstance(x, da.core.Array):
+        if y is None:
+            return pdirect(np.asarray(x))
+        return pdirect(np.asarray(x), np.asarray(y))
+
+    lags = _as_lags(lag)
+    win_sizes = _as_win_sizes(win_size)
+    depth = max(lags) + int(max(win_sizes) // 2)
+
+    new_axes = ()
+    if np.ndim(lag) > 0:
+        new_axes += (len(lags),)
+    if np.ndim(win_size) > 0:
+        new_axes += (len(win_sizes),)
+    if directions is not None:
+        new_axes += (len(directions),)
+    elif isinstance(func, (tuple, list)):
+        new_axes += (len(func),)
+
+    arrays = [x] if y is None else [x, y]
+    dtype = x.dtype if np.issubdtype(x.dtype, np.floating) else np.float64
+    bytes_per_element = _window_texture_bytes(x.dtype.itemsize, len(arrays), int(np.prod(new_axes)), 1,
+                                              method="direct")
+
+    pfused = functools.partial(_fused_direct, depth=depth, **pdirect.keywords)
+
+    return _halo_map_blocks(pfused, *arrays, depth=depth, boundary="reflect", new_axes=new_axes, dtype=dtype,
+                            edges=True, bytes_per_element=bytes_per_element, memory_budget=memory_budget)
+
+
+#statistics calculated from moving window sums of the values, their squares and the valid count
+MOMENT_STATS = ["nanmean", "nanstd", "nanvar", "nansum", "count"]
+
+
+def _moving_moments(x, win_size=5, stats=("nanmean",), ddof=0):
+    """
+    Calculate NaN aware moving window statistics from summed-area tables.
+
+    The window sums of the values, their squares and the number of valid (not NaN)
+    values are read from summed-area tables so the cost per element does not depend
+    on the window size. Elements outside the array are treated as NaN.
+
+    Parameters
+    ----------
+    x : np.array
+    win_size : int, optional
+        Window size, defaults to 5.
+    stats : list of {"nanmean", "nanstd", "nanvar", "nansum", "count"}
+        Statistical measures to calculate.
+    ddof : int, optional
+        Delta degrees of freedom for "nanstd" and "nanvar", defaults to 0.
+
+    Returns
+    -------
+    dict
+        Dictionary with statistic names as keys and the results as values.
+    """
+    x = np.asarray(x)
+
+    if np.issubdtype(x.dtype, np.floating):
+        out_dtype = x.dtype
+        valid = ~np.isnan(x)
+    else:
+        out_dtype = np.float64
+        valid = np.ones(x.shape, dtype=bool)
+
+    count = _sat_box_sum(integral_image(valid), win_size=win_size)
+
+    res = {}
+    if "count" in stats:
+        res["count"] = count
+
+    if set(stats) - {"count"}:
+        #shift data by its mean to reduce cancellation in the variance
+        shift = np.nansum(x, dtype=np.float64) / max(np.count_nonzero(valid), 1)
+        data = np.where(valid, x - shift, 0)
+
+        s1 = _sat_box_sum(integral_image(data), win_size=win_size)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = s1 / count
+
+            if "nanmean" in stats:
+                res["nanmean"] = (mean + shift).astype(out_dtype)
+            if "nansum" in stats:
+                res["nansum"] = (s1 + shift * count).astype(out_dtype)
+            if "nanvar" in stats or "nanstd" in stats:
+                s2 = _sat_box_sum(integral_image(np.square(data)), win_size=win_size)
+                var = np.clip(s2 - s1 * mean, 0, None) / (count - ddof)
+                var[count - ddof <= 0] = np.nan
+
+                if "nanvar" in stats:
+                    res["nanvar"] = var.astype(out_dtype)
+                if "nanstd" in stats:
+                    res["nanstd"] = np.sqrt(var).astype(out_dtype)
+
+    return res
+
+
+#statistics calculated with the van Herk/Gil-Werman running extremum algorithm
+EXTREMUM_STATS = ["nanmax", "nanmin"]
+
+
+def _running_extremum_1d(x, win_size, ufunc, fill):
+    """
+    Running maximum or minimum along the last axis (van Herk/Gil-Werman algorithm).
+
+    The padded axis is split into blocks of the window size. The extremum of
+    a window is the extremum of the suffix of the block it starts in and the
+    prefix of the block it ends in, so only about three comparisons per element
+    are needed whatever the window size.
+
+    Parameters
+    ----------
+    x : np.array
+    win_size : int
+        Window size
+    ufunc : {np.maximum, np.minimum}
+    fill : scalar
+        Value for elements outside the array, neutral for `ufunc`.
+
+    Returns
+    -------
+    np.array
+    """
+    radius = win_size // 2
+    size = x.shape[-1]
+
+    num_blocks = -(-(size + 2 * radius) // win_size)
+    padded = np.full(x.shape[:-1] + (num_blocks * win_size,), fill, dtype=x.dtype)
+    padded[..., radius:radius + size] = x
+
+    blocks = padded.reshape(x.shape[:-1] + (num_blocks, win_size))
+    prefix = ufunc.accumulate(blocks, axis=-1).reshape(padded.shape)
+    suffix = ufunc.accumulate(blocks[..., ::-1], axis=-1)[..., ::-1].reshape(padded.shape)
+
+    return ufunc(suffix[..., :size], prefix[..., win_size - 1:win_size - 1 + size])
+
+
+def _running_extremum(x, win_size=5, stat="nanmax"):
+    """
+    NaN aware moving window maximum or minimum.
+
+    The 2D extremum is separated in running extrema along rows and columns
+    (see :func:`_running_extremum_1d`). Elements outside the array are
+    treated as NaN and windows without any valid value are NaN.
+
+    Parameters
+    ----------
+    x : np.array
+    win_size : int, optional
+        Window size, defaults to 5.
+    stat : {"nanmax", "nanmin"}
+        Statistical measure to calculate.
+
+    Returns
+    -------
+    np.array
+    """
+    x = np.asarray(x)
+    ufunc = np.maximum if stat == "nanmax" else np.minimum
+
+    if np.issubdtype(x.dtype, np.floating):
+        fill = -np.inf if stat == "nanmax" else np.inf
+        nan_mask = np.isnan(x)
+        data = np.where(nan_mask, fill, x)
+    else:
+        fill = np.iinfo(x.dtype).min if stat == "nanmax" else np.iinfo(x.dtype).max
+        nan_mask = None
+        data = x
+
+    res = _running_extremum_1d(data, win_size, ufunc, fill)
+    res = np.swapaxes(_running_extremum_1d(np.swapaxes(res, -1, -2), win_size, ufunc, fill), -1, -2)
+
+    if nan_mask is not None and nan_mask.any():
+        count = _sat_box_sum(integral_image(~nan_mask), win_size=win_size)
+        res[count == 0] = np.nan
+
+    return res
+
+
+#statistics calculated with the sliding window quantile engine
+QUANTILE_STATS = ["nanmedian", "nanpercentile", "nanquantile"]
+#maximum number of sorted window elements kept at once by the sliding window quantiles
+QUANTILE_BATCH_SIZE = 2**18
+#largest value range of integer arrays for which quantiles are calculated from histograms
+HISTOGRAM_MAX_BINS = 1024
+
+
+def _lerp(lower, upper, t, dtype):
+    """
+    Linear interpolation between two arrays as used by :func:`numpy.nanpercentile`.
+    """
+    lower = np.asarray(lower, dtype=dtype)
+    upper = np.asarray(upper, dtype=dtype)
+
+    return lower + (upper - lower) * t
+
+
+def _histogram_quantile(x, win_size=5, q=50, num_bins=256, values=None):
+    """
+    Moving window percentile of an array of histogram bins.
+
+    The array is processed row by row. A histogram for each column over the rows
+    of the current window is updated incrementally and the window histograms
+    are read from the cumulative sum of the column histograms. The cost per pixel
+    grows with the number of bins but not with the window size.
+
+    Parameters
+    ----------
+    x : np.array
+        Integer array with the bins of the values in [0, `num_bins`), -1 for NaN.
+    win_size : int, optional
+        Window size, defaults to 5.
+    q : float, optional
+        Percentile in [0, 100], defaults to 50.
+    num_bins : int, optional
+        Number of histogram bins.
+    values : np.array, optional
+        Value of each bin, defaults to the bin.
+
+    Returns
+    -------
+    np.array
+    """
+    rows, cols = x.shape
+    radius = win_size // 2
+
+    if values is None:
+        values = np.arange(num_bins)
+
+    col_ind = np.arange(cols)
+    x_low, x_up = _window_bounds(cols, win_size)
+
+    #NaN (-1) are counted in an extra last bin which is left out of the quantiles
+    col_hist = np.zeros((cols, num_bins + 1), dtype=np.int32)
+    csum = np.zeros((cols + 1, num_bins + 1), dtype=np.int32)
+    res = np.empty(x.shape, dtype=np.float64)
+
+    for row in range(min(radius, rows)):
+        col_hist[col_ind, x[row]] += 1
+
+    for i in range(rows):
+        if i + radius < rows:
+            col_hist[col_ind, x[i + radius]] += 1
+        if i - radius - 1 >= 0:
+            col_hist[col_ind, x[i - radius - 1]] -= 1
+
+        np.cumsum(col_hist, axis=0, out=csum[1:])
+        cum = np.cumsum((csum[x_up] - csum[x_low])[:, :num_bins], axis=1)
+
+        pos = q / 100 * (cum[:, -1] - 1)
+        lower = np.floor(pos)
+        upper = np.ceil(pos)
+
+        #value of rank k is the first bin where the cumulative count exceeds k
+        v_lower = np.minimum(np.sum(cum <= lower[:, None], axis=1), num_bins - 1)
+        v_upper = np.minimum(np.sum(cum <= upper[:, None], axis=1), num_bins - 1)
+
+        res[i] = _lerp(values[v_lower], values[v_upper], pos - lower, np.float64)
+        res[i, cum[:, -1] == 0] = np.nan
+
+    return res
+
+
+def _value_bins(x, max_bins):
+    """
+    Histogram bins (-1 for NaN) and bin values of an array with at most `max_bins` distinct values.
+
+    Integer arrays are binned by their value range, floating point arrays by their
+    distinct values. None if the array has more values than `max_bins`.
+    """
+    if np.issubdtype(x.dtype, np.floating):
+        valid = ~np.isnan(x)
+        values, inverse = np.unique(x[valid], return_inverse=True)
+        if len(values) > max_bins:
+            return None
+        if len(values) == 0:
+            values = np.array([np.nan])
+
+        bins = np.full(x.shape, -1, dtype=np.intp)
+        bins[valid] = inverse
+
+        return bins, values
+
+    offset = int(x.min())
+    num_bins = int(x.max()) - offset + 1
+    if num_bins > max_bins:
+        return None
+
+    return (x - offset).astype(np.intp), np.arange(num_bins) + offset
+
+
+def _moving_quantile(x, win_size=5, q=50):
+    """
+    NaN aware moving window percentile.
+
+    The values are replaced by their rank in the whole array (NaN and the
+    area outside of the array rank last) and a sorted list of the ranks in the
+    window is kept for every row. Moving the windows one column to the right
+    only removes and inserts one window column, so no copy of the window view
+    of the whole array and no sort of every window is needed. The rows are
+    processed in strips of at most `QUANTILE_BATCH_SIZE` window elements.
+
+    Each move updates the sorted windows with memory moves of the order of the window
+    elements, so arrays with at most as many distinct values (integer arrays by their
+    value range, up to `HISTOGRAM_MAX_BINS`) are calculated from incrementally updated
+    histograms instead, whose cost does not grow with the window size
+    (see :func:`_histogram_quantile`).
+
+    Parameters
+    ----------
+    x : np.array
+    win_size : int, optional
+        Window size, defaults to 5.
+    q : float, optional
+        Percentile in [0, 100], defaults to 50 (median).
+
+    Returns
+    -------
+    np.array
+    """
+    x = np.asarray(x)
+
+    if x.ndim > 2:
+        #each 2-D array of a batch is ranked on its own
+        res = [_moving_quantile(b, win_size=win_size, q=q) for b in x.reshape((-1,) + x.shape[-2:])]
+        return np.stack(res).reshape(x.shape)
+
+    rows, cols = x.shape
+    pad = int(win_size // 2)
+    win_elements = win_size**2
+
+    out_dtype = x.dtype if np.issubdtype(x.dtype, np.floating) else np.float64
+
+    binned = _value_bins(x, min(HISTOGRAM_MAX_BINS, win_elements)) if x.size > 0 else None
+    if binned is not None:
+        bins, values = binned
+        res = _histogram_quantile(bins, win_size=win_size, q=q, num_bins=len(values), values=values)
+        return res.astype(out_dtype)
+
+    data = np.pad(x.astype(np.float64), (pad, pad), mode="constant", constant_values=(np.nan))
+
+    #global ranks, NaN are sorted to the end
+    order = np.argsort(data, axis=None, kind="stable")
+    sorted_values = data.ravel()[order]
+    num_ranks = order.size
+    ranks = np.empty(num_ranks, dtype=np.int64)
+    ranks[order] = np.arange(num_ranks)
+    ranks = ranks.reshape(data.shape)
+
+    count = _sat_box_sum(integral_image(~np.isnan(x)), win_size=win_size)
+    pos = q / 100 * (count - 1)
+    lower = np.clip(np.floor(pos), 0, None).astype(np.intp)
+    upper = np.clip(np.ceil(pos), 0, None).astype(np.intp)
+    frac = np.clip(pos - lower, 0, None)
+
+    res = np.empty(x.shape, dtype=out_dtype)
+
+    step = max(1, QUANTILE_BATCH_SIZE // win_elements)
+    for start in range(0, rows, step):
+        stop = min(rows, start + step)
+        num_rows = stop - start
+        row_ind = np.arange(num_rows)
+
+        #offset the ranks of each row so the sorted windows of all rows form one sorted array
+        row_offset = (row_ind * num_ranks)[:, None]
+
+        windowed = ski.util.view_as_windows(ranks[start:stop + 2 * pad], (win_size, win_size))
+        sorted_win = (np.sort(windowed[:, 0].reshape(num_rows, -1), axis=1) + row_offset).ravel()
+
+        for j in range(cols):
+            if j > 0:
+                outgoing = (np.sort(windowed[:, j - 1, :, 0], axis=1) + row_offset).ravel()
+                sorted_win = np.delete(sorted_win, np.searchsorted(sorted_win, outgoing))
+
+                incoming = (np.sort(windowed[:, j, :, -1], axis=1) + row_offset).ravel()
+                sorted_win = np.insert(sorted_win, np.searchsorted(sorted_win, incoming), incoming)
+
+            table = sorted_win.reshape(num_rows, win_elements)
+            v_lower = sorted_values[table[row_ind, lower[start:stop, j]] - row_offset[:, 0]]
+            v_upper = sorted_values[table[row_ind, upper[start:stop, j]] - row_offset[:, 0]]
+
+            res[start:stop, j] = _lerp(v_lower, v_upper, frac[start:stop, j], out_dtype)
+
+    res[count == 0] = np.nan
+
+    return res
+
+
+def _win_view_stat(x, win_size=5, stat="nanmean", **kwargs):
+    """
+    Calculates specified basic statistical measure for a moveing window
+    over an array.
+
+    The statistics in `MOMENT_STATS` are calculated from moving window sums
+    (see :func:`_moving_moments`), the ones in `EXTREMUM_STATS` with running
+    extrema (see :func:`_running_extremum`), the ones in `QUANTILE_STATS` with
+    a sliding window quantile engine (see :func:`_moving_quantile`) and all others
+    with the numpy function of the same name over a windowed view of the array.
+
+    Parameters
+    ----------
+    x : np.array
+    win_size : int, optional
+        Window size, defaults to 5.
+    stat : {"nanmean", "nanmax", "nanmin", "nanmedian", "nanstd", "nanvar", "nansum", "count",
+            "nanpercentile", "nanquantile"}
+        Statistical measure to calculate.
+    kwargs : optional
+        Additional keyword arguments some stat may need (e.g. `q` for "nanpercentile").
+
+    Returns
+    -------
+    np.array
+
+    """
+    #if x.shape == (1, 1):
+        #return x
+
+    if stat in MOMENT_STATS and set(kwargs) <= {"ddof"}:
+        #infinite values need the full reduction to give the same result as numpy
+        if stat == "count" or not np.isinf(x).any():
+            return _moving_moments(x, win_size=win_size, stats=[stat], **kwargs)[stat]
+
+    if stat in EXTREMUM_STATS and not kwargs:
+        return _running_extremum(x, win_size=win_size, stat=stat)
+
+    if stat in QUANTILE_STATS and set(kwargs) <= {"q"}:
+        if stat == "nanmedian":
+            q = 50
+        elif stat == "nanquantile":
+            q = np.asarray(kwargs["q"]) * 100
+        else:
+            q = kwargs["q"]
+
+        if np.ndim(q) == 0:
+            return _moving_quantile(x, win_size=win_size, q=q)
+
+    np_measure = getattr(np, stat)
+
+    measure = functools.partial(np_measure, **kwargs) 
+
+    #sh = np.asarray(x).shape
+    #mask = np.zeros_like(x)
+    #mask[pad:sh[0]-pad, pad:sh[1]-pad] = 1
+
+    #data = np.where(mask==1, x, np.nan)
+
+    #get windowed view of array
+    windowed = _windowed_view(np.asarray(x), win_size)
+
+    #calculate measure over last to axis
+    res = measure(windowed, axis=(-2, -1))
+
+    return res
+
+
+def _windowed_view(x, win_size):
+    """
+    Windowed view of `x` padded with NaN over the last two (spatial) axes.
+
+    Returns
+    -------
+    np.array
+        View of shape ``x.shape + (win_size, win_size)``, leading (batch) axes are kept.
+    """
+    pad = int(win_size // 2)
+    lead = x.ndim - 2
+
+    data = np.pad(x, [(0, 0)] * lead + [(pad, pad)] * 2, mode="constant", constant_values=np.nan)
+    windowed = ski.util.view_as_windows(data, (1,) * lead + (win_size, win_size))
+
+    #drop the window axes of length one of the batch axes
+    return windowed[(slice(None),) * x.ndim + (0,) * lead]
+
+
+def _stat_kwargs(stat, kwargs):
+    """
+    Select the keyword arguments of a statistic from the keyword arguments for several statistics.
+    """
+    if stat in MOMENT_STATS:
+        return {k: v for k, v in kwargs.items() if k == "ddof" and stat in ["nanstd", "nanvar"]}
+    if stat in EXTREMUM_STATS:
+        return {}
+    if stat in QUANTILE_STATS:
+        return {k: v for k, v in kwargs.items() if k == "q" and stat != "nanmedian"}
+
+    return kwargs
+
+
+def _stat_bytes(stats, win_size, itemsize):
+    """
+    Estimated peak memory per element of calculating the window statistics of a block.
+    """
+    return sum(_stat_terms(stats, win_size, itemsize).values())
+
+
+def _stat_terms(stats, win_size, itemsize):
+    """
+    Components of :func:`_stat_bytes` by the arrays they are needed for.
+
+    Returns
+    -------
+    dict
+        Bytes per element of the "inputs", the "results" and the working arrays of the
+        algorithms ("summed_area_tables", "extremum_buffers", "histograms", "windowed_views").
+    """
+    terms = {"inputs": itemsize, "results": itemsize * len(stats)}
+
+    #the summed-area tables of the moments are shared
+    if any(stat in MOMENT_STATS for stat in stats):
+        terms["summed_area_tables"] = 52
+
+    for stat in stats:
+        if stat in MOMENT_STATS:
+            name, nbytes = "summed_area_tables", 8
+        elif stat in EXTREMUM_STATS:
+            name, nbytes = "extremum_buffers", 6 * itemsize
+        elif stat in QUANTILE_STATS:
+            name, nbytes = "histograms", 80
+        else:
+            #numpy reductions over the windowed view copy all windows
+            name, nbytes = "windowed_views", win_size**2 * itemsize
+        terms[name] = terms.get(name, 0) + nbytes
+
+    return terms
+
+
+def _win_view_stats(x, win_size=5, stats=("nanmean",), **kwargs):
+    """
+    Calculates several statistical measures for a moveing window over an array.
+
+    The moving window sums are shared between all statistics in `MOMENT_STATS`,
+    the padded windowed view between all statistics calculated with numpy.
+
+    Parameters
+    ----------
+    x : np.array
+    win_size : int, optional
+        Window size, defaults to 5.
+    stats : list of str
+        Statistical measures to calculate, see :func:`_win_view_stat`.
+    kwargs : optional
+        Additional keyword arguments the stats may need (e.g. `ddof` for "nanstd"
+        or `q` for "nanpercentile"). Each stat only gets the ones it needs.
+
+    Returns
+    -------
+    np.array
+        Results stacked along a new first axis in the order of `stats`.
+    """
+    x = np.asarray(x)
+    out_dtype = x.dtype if np.issubdtype(x.dtype, np.floating) else np.float64
+
+    results = {}
+
+    moment_stats = [s for s in stats if s in MOMENT_STATS]
+    if moment_stats and (set(moment_stats) == {"count"} or not np.isinf(x).any()):
+        ddof = kwargs.get("ddof", 0)
+        results.update(_moving_moments(x, win_size=win_size, stats=moment_stats, ddof=ddof))
+
+    windowed = None
+    for stat in stats:
+        if stat in results:
+            continue
+
+        stat_kwargs = _stat_kwargs(stat, kwargs)
+        if stat in MOMENT_STATS + EXTREMUM_STATS + QUANTILE_STATS:
+            results[stat] = _win_view_stat(x, win_size=win_size, stat=stat, **stat_kwargs)
+        else:
+            if windowed is None:
+                windowed = _windowed_view(x, win_size)
+
+            results[stat] = getattr(np, stat)(windowed, axis=(-2, -1), **stat_kwargs)
+
+    return np.stack([results[stat].astype(out_dtype, copy=False) for stat in stats])
+
+
+#def xr_wrapper(fun):
+    ##functools wraps keeps docstrings
+    #@functools.wraps(fun)
+    #def wrapped_fun(*args, **kwargs):
+        #if isinstance(args[0], xr.core.dataarray.DataArray):
+            #out = args[0].copy()
+            #if len(args) == 2:
+                #out.data = fun(args[0].data, args[1].data, **kwargs)
+                #out.attrs["name"] = fun.__name__ + "_{}_{}".format(args[0].attrs["name"], args[1].attrs["name"])
+            #else:
+                #out.data = fun(args[0].data, **kwargs)
+                #out.attrs["name"] = fun.__name__ + "_{}".format(args[0].attrs["name"])
+
+            #if fun.__name__ == "window_statistic":
+                #out.attrs["statistic"] = kwargs.get("stat")
+                #out.name = out.attrs["name"] + "_{stat}_{win_size}".format(**kwargs)
+            #else:
+                #out.attrs["lag_distance"] = kwargs.get("lag")
+                #out.attrs["window_geometry"] = kwargs.get("win_geom")
+                #out.name = out.attrs["name"] + "_{lag}_{win_size}_{win_geom}".format(**kwargs)
+
+            #out.attrs["window_size"] = kwargs.get("win_size")
+        #else:
+            #if len(args) == 2:
+                #out = fun(args[0], args[1], **kwargs)
+            #else:
+                #out = fun(args[0], **kwargs)
+
+        #return out
+    #return wrapped_fun
+
+#parameters which give a result stacked along a new leading dimension if a list is passed
+STACKED_PARAMS = ["lag", "win_size", "directions"]
+#parameters which give a dataset with one variable per value when given as list
+DATASET_PARAMS = ["stat"]
+
+
+def _result_dataarray(x, res, params):
+    """
+    Create :class:`xarray.DataArray` for a result with the coordinates and attributes of the input.
+
+    List valued parameters in `STACKED_PARAMS` become new leading dimensions
+    of the result with the parameter values as coordinates.
+
+    Parameters
+    ----------
+    x : xarray.DataArray
+        Input of the function
+    res : array like
+        Result of the function
+    params : dict
+        Parameters the function was called with.
+
+    Returns
+    -------
+    xarray.DataArray
+    """
+    new_dims = [p for p in STACKED_PARAMS if np.ndim(params.get(p)) > 0]
+
+    if not new_dims:
+        return x.copy(data=res)
+
+    coords = dict(x.coords)
+    for p in new_dims:
+        coords[p] = list(params[p])
+
+    return xr.DataArray(res, dims=tuple(new_dims) + x.dims, coords=coords, attrs=copy.deepcopy(x.attrs))
+
+
+def _strips(rows, strip_rows, depth):
+    """
+    Rows to read and to write of horizontal strips extended by a halo.
+
+    Yields
+    ------
+    tuple of int
+        First and last (exclusive) row to read, extended by `depth` rows on
+        both sides but not beyond the array, and first and last row to write.
+    """
+    for start in range(0, rows, strip_rows):
+        stop = min(start + strip_rows, rows)
+        yield max(start - depth, 0), min(stop + depth, rows), start, stop
+
+
+def _stitch(res, strip_res, read_start, start, stop):
+    """
+    Write the rows `start` to `stop` of the result of a strip read from `read_start` into the result(s).
+    """
+    results = strip_res.items() if isinstance(strip_res, dict) else [(None, strip_res)]
+    for key, r in results:
+        target = res if key is None else res[key]
+        target[..., start:stop, :] = r[..., start - read_start:stop - read_start, :]
+
+
+def _empty_results(strip_res, rows):
+    """
+    Empty result(s) of `rows` rows with the shape and dtype of the result(s) of a strip.
+    """
+    def empty(r):
+        return np.empty(r.shape[:-2] + (rows, r.shape[-1]), dtype=r.dtype)
+
+    if isinstance(strip_res, dict):
+        return {k: empty(r) for k, r in strip_res.items()}
+
+    return empty(strip_res)
+
+
+def _texture_depth(params):
+    """
+    Halo of a texture, `lag` + `win_size` // 2 (only `win_size` // 2 without lag).
+    """
+    lag = max(_as_lags(params["lag"])) if "lag" in params else 0
+
+    return lag + int(max(_as_win_sizes(params.get("win_size", 1))) // 2)
+
+
+#executors which can be selected by name
+EXECUTORS = {"threads": concurrent.futures.ThreadPoolExecutor,
+             "processes": concurrent.futures.ProcessPoolExecutor}
+#maximum number of pools of the named executors kept for later calls
+MAX_POOLS = 4
+#pools of the named executors by name and number of workers, least recently used first
+_POOLS = collections.OrderedDict()
+_POOLS_LOCK = threading.Lock()
+
+
+def _shared_pool(executor, num_workers):
+    """
+    Pool of a named executor ("threads" or "processes") with `num_workers` workers.
+
+    Pools are created on first use and shared by all later calls, so the workers are
+    started only once. Broken process pools (e.g. after a worker was killed) are replaced.
+    At most `MAX_POOLS` pools are kept, the least recently used one is shut down (after
+    its running tasks) when another one is needed.
+    """
+    key = (executor, num_workers)
+
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None or getattr(pool, "_broken", False):
+            pool = EXECUTORS[executor](max_workers=num_workers)
+            _POOLS[key] = pool
+        _POOLS.move_to_end(key)
+
+        while len(_POOLS) > MAX_POOLS:
+            _, old = _POOLS.popitem(last=False)
+            old.shutdown(wait=False)
+
+    return pool
+
+
+def shutdown_pools(wait=True):
+    """
+    Shut down the shared pools of the named executors of :func:`tile_parallel`.
+
+    Stops the worker threads and processes, later calls start new pools.
+    Registered to run at interpreter exit.
+
+    Parameters
+    ----------
+    wait : bool, optional
+        Wait until the running tasks are finished, defaults to True.
+    """
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+
+    for pool in pools:
+        pool.shutdown(wait=wait)
+
+
+atexit.register(shutdown_pools)
+
+
+def _num_workers(n_jobs=None, executor=None):
+    """
+    Number of workers of an executor or of `n_jobs` (all cores for -1).
+    """
+    if isinstance(executor, concurrent.futures.Executor):
+        return getattr(executor, "_max_workers", None) or os.cpu_count()
+    if n_jobs is None:
+        return os.cpu_count() if executor is not None else 1
+    if n_jobs < 0:
+        return os.cpu_count()
+
+    return n_jobs
+
+
+def _shared_array(shape, dtype):
+    """
+    Array in a new :class:`multiprocessing.shared_memory.SharedMemory` block.
+
+    Returns
+    -------
+    tuple
+        The shared memory block, the array and the description (name, shape, dtype)
+        to attach to the array in other processes.
+    """
+    nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+    shm = shared_memory.SharedMemory(create=True, size=nbytes)
+    arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    return shm, arr, (shm.name, shape, np.dtype(dtype).str)
+
+
+def _attach_shared(desc):
+    """
+    Attach to an array of :func:`_shared_array` by its description.
+    """
+    name, shape, dtype = desc
+    shm = shared_memory.SharedMemory(name=name)
+
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _shared_strip(module, name, args, kwargs, inputs, outputs, read_start, read_stop, start, stop):
+    """
+    Calculate the texture of one strip in a worker process.
+
+    The inputs are read from and the results written to shared memory, only the
+    descriptions of the shared arrays and the parameters are sent to the worker.
+
+    Parameters
+    ----------
+    module, name : str
+        Module and name of the texture.
+    args : list
+        Positional arguments of the texture with None for the inputs.
+    kwargs : dict
+        Keyword arguments of the texture.
+    inputs : dict
+        Positions of the inputs in `args` as keys and descriptions of the shared input arrays as values.
+    outputs : tuple or dict
+        Description of the shared result array or a dictionary of them for textures
+        returning dictionaries.
+    read_start, read_stop, start, stop : int
+        Rows of the strip, see :func:`_strips`.
+    """
+    #the plain texture, the decorators (result cache, xarray wrapper) only apply to the whole call
+    fun = inspect.unwrap(getattr(importlib.import_module(module), name))
+    blocks = []
+    try:
+        args = list(args)
+        for i, desc in inputs.items():
+            shm, arr = _attach_shared(desc)
+            blocks.append(shm)
+            args[i] = arr[..., read_start:read_stop, :]
+
+        strip_res = fun(*args, **kwargs)
+
+        if isinstance(outputs, dict):
+            res = {}
+            for k, desc in outputs.items():
+                shm, res[k] = _attach_shared(desc)
+                blocks.append(shm)
+        else:
+            shm, res = _attach_shared(outputs)
+            blocks.append(shm)
+
+        _stitch(res, strip_res, read_start, start, stop)
+    finally:
+        #views have to be released before the blocks can be closed
+        args = arr = res = strip_res = None
+        for shm in blocks:
+            shm.close()
+
+
+def _strip_args(bound, inputs, read_start=None, read_stop=None):
+    """
+    Positional and keyword arguments of a texture for the strip of the inputs, None for the inputs without strip.
+    """
+    strip_bound = inspect.BoundArguments(bound.signature, dict(bound.arguments))
+    for p in inputs:
+        strip_bound.arguments[p] = None if read_start is None else bound.arguments[p][..., read_start:read_stop, :]
+
+    return strip_bound.args, strip_bound.kwargs
+
+
+def _thread_strips(fun, bound, inputs, strips, pool):
+    """
+    Calculate the strips of a texture on a thread pool.
+    """
+    rows = bound.arguments["x"].shape[-2]
+
+    futures = {}
+    for read_start, read_stop, start, stop in strips:
+        args, kwargs = _strip_args(bound, inputs, read_start, read_stop)
+        futures[pool.submit(fun, *args, **kwargs)] = (read_start, start, stop)
+
+    res = None
+    for future in concurrent.futures.as_completed(futures):
+        strip_res = future.result()
+        if res is None:
+            res = _empty_results(strip_res, rows)
+        _stitch(res, strip_res, *futures[future])
+
+    return res
+
+
+def _process_strips(fun, bound, inputs, strips, pool, depth=0):
+    """
+    Calculate the strips of a texture on a process pool with inputs and results in shared memory.
+    """
+    params = bound.arguments
+    rows, cols = params["x"].shape[-2:]
+    blocks = []
+    try:
+        shared_inputs = {}
+        for p in inputs:
+            shm, arr, desc = _shared_array(params[p].shape, params[p].dtype)
+            arr[...] = params[p]
+            blocks.append(shm)
+            shared_inputs[list(params).index(p)] = desc
+
+        #shape and dtype of the results from a small corner of the inputs
+        size = 2 * depth + 2
+        probe_bound = inspect.BoundArguments(bound.signature, dict(params))
+        for p in inputs:
+            probe_bound.arguments[p] = params[p][..., :min(rows, size), :min(cols, size)]
+        probe = fun(*probe_bound.args, **probe_bound.kwargs)
+        probe = {None: probe} if not isinstance(probe, dict) else probe
+
+        res = {}
+        outputs = {}
+        for k, r in probe.items():
+            shm, res[k], outputs[k] = _shared_array(r.shape[:-2] + (rows, cols), r.dtype)
+            blocks.append(shm)
+        if None in outputs:
+            outputs = outputs[None]
+
+        args, kwargs = _strip_args(bound, inputs)
+        futures = [pool.submit(_shared_strip, fun.__module__, fun.__name__, args, kwargs, shared_inputs, outputs,
+                               *strip) for strip in strips]
+        for future in futures:
+            future.result()
+
+        res = {k: np.array(r) for k, r in res.items()}
+    finally:
+        arr = probe = None
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    return res[None] if None in res else res
+
+
+@decorator.decorator
+def tile_parallel(fun, *args, **kwargs):
+    """Decorator calculating textures of numpy arrays in tiles on a thread or process pool.
+
+    With the keyword argument `n_jobs` (-1 for all cores) or an `executor` numpy inputs
+    are split into horizontal strips, one per worker, extended by the halo of the texture
+    (`lag` + `win_size` // 2 rows). The strips are calculated in parallel and their results
+    are written into the full result. Other inputs (e.g. dask arrays) are passed on unchanged.
+
+    `executor` is "threads" (default), "processes" or a :class:`concurrent.futures.Executor`.
+    As numpy and scipy release the GIL for most of the work threads scale for all textures.
+    For processes the inputs and results are put into shared memory
+    (:mod:`multiprocessing.shared_memory`) so that the workers read and write them
+    without pickling any array data. The pools of "threads" and "processes" are created
+    once per number of workers and reused by all textures (see :func:`_shared_pool`)
+    until :func:`shutdown_pools` is called.
+    """
+    n_jobs = kwargs.pop("n_jobs", None)
+    executor = kwargs.pop("executor", None)
+
+    bound = inspect.signature(fun).bind(*args, **kwargs)
+    bound.apply_defaults()
+    params = bound.arguments
+    inputs = [p for p in ["x", "y"] if p in params and params[p] is not None]
+
+    num_workers = _num_workers(n_jobs, executor)
+    if num_workers < 2 or not all(isinstance(params[p], np.ndarray) for p in inputs):
+        return fun(*bound.args, **bound.kwargs)
+
+    rows = params["x"].shape[-2]
+    depth = _texture_depth(params)
+    strips = list(_strips(rows, max(-(-rows // num_workers), 1), depth))
+
+    if isinstance(executor, concurrent.futures.Executor):
+        pool = executor
+    else:
+        pool = _shared_pool(executor or "threads", num_workers)
+
+    if isinstance(pool, concurrent.futures.ProcessPoolExecutor):
+        return _process_strips(fun, bound, inputs, strips, pool, depth=depth)
+
+    return _thread_strips(fun, bound, inputs, strips, pool)
+
+
+def _format_name_param(value):
+    """
+    Format parameter value for a result name. Lists are joined by "-".
+    """
+    if np.ndim(value) > 0:
+        return "-".join(str(v) for v in value)
+
+    return value
+
+
+def _named_result(x, res, fun_name, input_names, params):
+    """
+    Create :class:`xarray.DataArray` for a result and name it after the function, inputs and parameters.
+
+    Parameters
+    ----------
+    x : xarray.DataArray
+        First input of the function
+    res : array like
+        Result of the function
+    fun_name : str
+        Name of the function (texture) which gave the result.
+    input_names : list of str
+        Names of the inputs.
+    params : dict
+        Parameters the function was called with.
+
+    Returns
+    -------
+    xarray.DataArray
+    """
+    out = _result_dataarray(x, res, params)
+    out.attrs["name"] = "_".join([fun_name] + input_names)
+
+    name_params = {k: _format_name_param(v) for k, v in params.items()}
+    if fun_name == "window_statistic":
+        out.attrs["statistic"] = params.get("stat")
+        if "q" in params and params.get("stat") in ["nanpercentile", "nanquantile"]:
+            #percentiles are named after the statistic and the percentile e.g. nanpercentile90
+            out.attrs["q"] = params["q"]
+            name_params["stat"] = "{}{}".format(name_params["stat"], name_params["q"])
+        out.name = out.attrs["name"] + "_{stat}_{win_size}".format(**name_params)
+    elif fun_name == "tpi":
+        out.name = out.attrs["name"] + "_{win_size}".format(**name_params)
+    else:
+        out.attrs["lag_distance"] = params.get("lag")
+        out.attrs["window_geometry"] = params.get("win_geom")
+        out.attrs["backend"] = backend_name(params.get("backend"))
+        out.name = out.attrs["name"] + "_{lag}_{win_size}_{win_geom}".format(**name_params)
+
+    out.attrs["window_size"] = params.get("win_size")
+
+    return out
+
+
+@decorator.decorator
+def xr_wrapper(fun, *args, **kwargs):
+    """Decorator to handle :class:`xarray.DataArray` input.
+
+    Applied to functions which take one or two arrays as input
+    the decorator just applies the function in case of numpy array input.
+    In the case of :class:`xarray.DataArray` input the decorator will
+    copy over the attributes of the first input array, change the "name" attribute
+    to the function which was applied concatenated with the supplied parameters to
+    that function and the name of the input. List valued parameters like a list of lags
+    become new leading dimensions of the output, a list of statistics gives a
+    :class:`xarray.Dataset` with one variable per statistic. Functions which return
+    a dictionary of textures get a dictionary of named :class:`xarray.DataArray` back.
+
+    Todo
+    ----
+    - handling of attributes of second input (e.g. combine attributes?!)
+    - refactor np.array case which has double code
+    """
+    import inspect
+
+    run_sig = inspect.getfullargspec(fun)
+    params = dict(zip(run_sig.args, args))
+    params.pop("x")
+
+    if isinstance(args[0], xr.core.dataarray.DataArray):
+        x_input = args[0]
+        if "name" not in x_input.attrs.keys():
+            x_input.attrs["name"] = "Input array"
+        if "y" in params.keys():
+            y_input = args[1]
+            if "name" not in y_input.attrs.keys():
+                y_input.attrs["name"] = "Input array"
+
+            params.pop("y")
+            res = fun(x_input.data, y_input.data, **params, **kwargs)
+            input_names = [x_input.attrs["name"], y_input.attrs["name"]]
+        else:
+            res = fun(x_input.data, **params, **kwargs)
+            input_names = [x_input.attrs["name"]]
+
+        name_params = dict(params, **kwargs)
+        split_params = [p for p in DATASET_PARAMS if np.ndim(params.get(p)) > 0]
+        if isinstance(res, dict):
+            #functions which calculate several textures at once name each result after its texture
+            out = {k: _named_result(x_input, v, k, input_names, name_params) for k, v in res.items()}
+        elif split_params:
+            #results stacked along the first axis become variables of a dataset
+            p = split_params[0]
+            variables = [_named_result(x_input, r, fun.__name__, input_names, dict(name_params, **{p: v}))
+                         for v, r in zip(params[p], res)]
+            out = xr.Dataset({v.name: v for v in variables})
+        else:
+            out = _named_result(x_input, res, fun.__name__, input_names, name_params)
     else:
         if "y" in params.keys():
             out = fun(args[0], **params, **kwargs)
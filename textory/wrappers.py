@@ -41,11 +41,203 @@ Calculate textures for xarray Dataset
 The :func:`~textory.wrappers.textures_for_xr_dataset` function works similarly to the
 :func:`~textory.wrappers.textures_for_scene` function above but takes :class:`xarray.Dataset`
 as input and also returns a :class:`xarray.Dataset`.
+
+
+Shared work
+-----------
+
+Both wrappers plan the whole ``textures`` dictionary before calculating anything
+(see :func:`~textory.wrappers.plan_textures`). Variograms, madograms and rodograms of
+the same dataset and lag which are requested for the same window sizes are calculated in one
+pass, so the differences between neighbours are calculated only once and, for square windows,
+all window sizes are read from the same summed-area table. Only the requested combinations of
+estimator, lag and window size are calculated. Cross variograms of the same pair of datasets
+and lag and window statistics of the same dataset and window size are grouped the same way.
+For dask input this gives one fused task per block and group.
+
+For numpy input the differences between neighbours are also kept in a cache while the
+textures are calculated (see :func:`textory.cache.diff_cache`), so groups with the same
+dataset and lag (e.g. round windows of different sizes) calculate them only once. The size
+of the cache is set with the ``diff_cache_bytes`` parameter, ``0`` turns it off. Dask input
+does not use the cache, each texture stays one fused task per block.
+
+For numpy input ``n_jobs`` and ``executor`` ("threads", "processes" or a
+:class:`concurrent.futures.Executor`) are passed on to all textures to calculate them
+in strips in parallel (see :func:`textory.util.tile_parallel`).
 """
+import contextlib
+
 import textory.textures as txt
+from textory.cache import diff_cache
+from textory.util import _named_result
+
+#textures calculated together with textory.textures.variogram_estimators
+ESTIMATOR_TEXTURES = ["variogram", "madogram", "rodogram"]
+#textures of two datasets which accept lists of lags and window sizes
+CROSS_TEXTURES = ["cross_variogram", "pseudo_cross_variogram"]
+
+
+def plan_textures(textures):
+    """
+    Group the requested textures so that work they share is done only once.
+
+    Variograms, madograms and rodograms of the same dataset, lag and window geometry
+    are grouped if they are requested for the same window sizes. For square windows
+    (where all window sizes are read from the same summed-area table) these are all
+    window sizes of the estimator, for round windows each window size is a group of
+    its own. Each group thus calculates only requested combinations of estimator and
+    window size. Cross variograms are grouped by texture, pair of datasets, lag and window
+    geometry and window statistics by dataset and window size. All other textures get a
+    group of their own.
+
+    Parameters
+    ----------
+    textures : dict
+        Dictionary with textures as accepted by :func:`textures_for_scene`.
+
+    Returns
+    -------
+    dict
+        Dictionary with the group keys as keys and dictionaries with the sets
+        of "lags", "win_sizes" and "names" (textures or statistics) and the
+        list of "requests" (tuple of texture and dataset name) of the group as values.
+    """
+    #square window sizes of each estimator, dataset and lag
+    estimator_wins = {}
+    for tex, bands in textures.items():
+        if tex[0] in ESTIMATOR_TEXTURES and tex[3] == "square":
+            for b in bands:
+                estimator_wins.setdefault((tex[0], b, tex[1]), set()).add(tex[2])
+
+    plan = {}
+
+    for tex, bands in textures.items():
+        for b in bands:
+            tex_name = tex[0]
+
+            if tex_name == "window_statistic":
+                _, stat, win_size = tex
+                key = (tex_name, b, win_size)
+                names, lags, win_sizes = [stat], [], [win_size]
+            elif tex_name in ESTIMATOR_TEXTURES:
+                _, lag, win_size, win_geom = tex
+                wins = estimator_wins[(tex_name, b, lag)] if win_geom == "square" else [win_size]
+                key = ("variogram_estimators", b, win_geom, lag, tuple(sorted(wins)))
+                names, lags, win_sizes = [tex_name], [lag], [win_size]
+            elif tex_name in CROSS_TEXTURES:
+                _, lag, win_size, win_geom = tex
+                win_key = None if win_geom == "square" else win_size
+                key = (tex_name, b, win_geom, lag, win_key)
+                names, lags, win_sizes = [tex_name], [lag], [win_size]
+            else:
+                key = (tex, b)
+                names, lags, win_sizes = [tex_name], [], []
+
+            group = plan.setdefault(key, {"names": set(), "lags": set(), "win_sizes": set(), "requests": []})
+            group["names"].update(names)
+            group["lags"].update(lags)
+            group["win_sizes"].update(win_sizes)
+            group["requests"].append((tex, b))
+
+    return plan
+
 
+def _input_name(x):
+    """
+    Name of an input dataset as used in the names of the textures.
+    """
+    return x.attrs.get("name", "Input array")
 
-def textures_for_scene(scn, textures, append=True):
+
+def _calculate_group(data, key, group, **kwargs):
+    """
+    Calculate the textures of a group of :func:`plan_textures`.
+
+    Parameters
+    ----------
+    data : satpy.scene.Scene or xarray.Dataset
+    key : tuple
+        Group key.
+    group : dict
+        Group of the plan.
+    kwargs : optional
+        Passed on to the textures (e.g. `n_jobs` and `executor`).
+
+    Returns
+    -------
+    dict
+        Dictionary with the requests (tuple of texture and dataset name) as
+        keys and the named textures as values.
+    """
+    out = {}
+    lags = sorted(group["lags"])
+    win_sizes = sorted(group["win_sizes"])
+
+    if key[0] == "window_statistic":
+        _, b, win_size = key
+        x = data[b]
+        stats = sorted(group["names"])
+        res = txt.window_statistic(x.data, stat=stats, win_size=win_size, **kwargs)
+
+        for tex, b in group["requests"]:
+            params = {"stat": tex[1], "win_size": win_size}
+            out[(tex, b)] = _named_result(x, res[stats.index(tex[1])], "window_statistic", [_input_name(x)],
+                                          params)
+    elif key[0] == "variogram_estimators":
+        _, b, win_geom = key[:3]
+        x = data[b]
+        estimators = [e for e in ESTIMATOR_TEXTURES if e in group["names"]]
+        res = txt.variogram_estimators(x.data, lag=lags, win_size=win_sizes, win_geom=win_geom,
+                                       estimators=estimators, **kwargs)
+
+        for tex, b in group["requests"]:
+            tex_name, lag, win_size, _ = tex
+            params = {"lag": lag, "win_size": win_size, "win_geom": win_geom}
+            tex_res = res[tex_name][lags.index(lag), win_sizes.index(win_size)]
+            out[(tex, b)] = _named_result(x, tex_res, tex_name, [_input_name(x)], params)
+    elif key[0] in CROSS_TEXTURES:
+        tex_name, (bx, by), win_geom = key[:3]
+        x, y = data[bx], data[by]
+        fun = getattr(txt, tex_name)
+        res = fun(x.data, y.data, lag=lags, win_size=win_sizes, win_geom=win_geom, **kwargs)
+
+        for tex, b in group["requests"]:
+            _, lag, win_size, _ = tex
+            params = {"lag": lag, "win_size": win_size, "win_geom": win_geom}
+            tex_res = res[lags.index(lag), win_sizes.index(win_size)]
+            out[(tex, b)] = _named_result(x, tex_res, tex_name, [_input_name(x), _input_name(y)], params)
+    else:
+        tex, b = key
+        tex_name, lag, win_size, win_geom = tex
+        fun = getattr(txt, tex_name)
+        out[key] = fun(data[b], lag=lag, win_size=win_size, win_geom=win_geom, **kwargs)
+
+    return out
+
+
+def _calculate_textures(data, textures, diff_cache_bytes=2**28, n_jobs=None, executor=None):
+    """
+    Calculate all textures of a textures dictionary with the shared work done once.
+
+    Returns
+    -------
+    list of xarray.DataArray
+        Named textures in the order of the textures dictionary.
+    """
+    if diff_cache_bytes:
+        cache = diff_cache(max_bytes=diff_cache_bytes)
+    else:
+        cache = contextlib.nullcontext()
+
+    results = {}
+    with cache:
+        for key, group in plan_textures(textures).items():
+            results.update(_calculate_group(data, key, group, n_jobs=n_jobs, executor=executor))
+
+    return [results[(tex, b)] for tex, bands in textures.items() for b in bands]
+
+
+def textures_for_scene(scn, textures, append=True, diff_cache_bytes=2**28, n_jobs=None, executor=None):
     """
     Wrapper to calculate multiple textures for datasets in a
     :class:`satpy.scene.Scene`.
@@ -63,6 +255,13 @@ def textures_for_scene(scn, textures, append=True):
         If `False` returns a new :class:`satpy.scene.Scene` with all calculated textures,
         By default returns a new :class:`satpy.scene.Scene` with all input datasets and
         all calculated textures.
+    diff_cache_bytes : int, optional
+        Size of the cache for the differences between neighbours shared by textures
+        of numpy input in bytes, defaults to 256 MiB. `0` turns the cache off.
+    n_jobs : int, optional
+        Number of workers calculating the textures of numpy input in parallel, -1 for all cores.
+    executor : {"threads", "processes"} or concurrent.futures.Executor, optional
+        Pool calculating the textures of numpy input in parallel, defaults to threads.
 
     Returns
     -------
@@ -77,31 +276,17 @@ def textures_for_scene(scn, textures, append=True):
     else:
         out_scn = Scene()
 
-    for tex, bands in textures.items():
-        for b in bands:
-            if tex[0] == "window_statistic":
-                tex_name, stat, win_size = tex
-                fun = getattr(txt, tex_name)
-                tex_res = fun(scn[b], stat=stat, win_size=win_size)
-            else:
-                tex_name, lag, win_size, win_geom = tex
-                fun = getattr(txt, tex_name)
+    for tex_res in _calculate_textures(scn, textures, diff_cache_bytes=diff_cache_bytes, n_jobs=n_jobs,
+                                       executor=executor):
+        for k in strip_attrs:
+            tex_res.attrs.pop(k)
 
-                if tex_name in ["cross_variogram", "pseudo_cross_variogram"]:
-                    x, y = b
-                    tex_res = fun(scn[x], scn[y], lag=lag, win_size=win_size, win_geom=win_geom)
-                else:
-                    tex_res = fun(scn[b], lag=lag, win_size=win_size, win_geom=win_geom)
-
-            for k in strip_attrs:
-                tex_res.attrs.pop(k)
-
-            out_scn[tex_res.name] = tex_res
+        out_scn[tex_res.name] = tex_res
 
     return out_scn
 
 
-def textures_for_xr_dataset(xrds, textures, append=True):
+def textures_for_xr_dataset(xrds, textures, append=True, diff_cache_bytes=2**28, n_jobs=None, executor=None):
     """
     Wrapper to calculate multiple textures for dataarrays in a
     :class:`xarray.Dataset`.
@@ -120,6 +305,13 @@ def textures_for_xr_dataset(xrds, textures, append=True):
         If `False` returns a new :class:`xarray.Dataset` with all calculated textures,
         By default returns a new :class:`xarray.Dataset` with all input datasets and
         all calculated textures.
+    diff_cache_bytes : int, optional
+        Size of the cache for the differences between neighbours shared by textures
+        of numpy input in bytes, defaults to 256 MiB. `0` turns the cache off.
+    n_jobs : int, optional
+        Number of workers calculating the textures of numpy input in parallel, -1 for all cores.
+    executor : {"threads", "processes"} or concurrent.futures.Executor, optional
+        Pool calculating the textures of numpy input in parallel, defaults to threads.
 
 
     Returns
@@ -133,22 +325,8 @@ def textures_for_xr_dataset(xrds, textures, append=True):
         var_names = [name for name, _ in out_ds.data_vars.items()]
         out_ds = out_ds.drop(var_names)
 
-    for tex, bands in textures.items():
-        for b in bands:
-            if tex[0] == "window_statistic":
-                tex_name, stat, win_size = tex
-                fun = getattr(txt, tex_name)
-                tex_res = fun(out_ds[b], stat=stat, win_size=win_size)
-            else:
-                tex_name, lag, win_size, win_geom = tex
-                fun = getattr(txt, tex_name)
-
-                if tex_name in ["cross_variogram", "pseudo_cross_variogram"]:
-                    x, y = b
-                    tex_res = fun(out_ds[x], out_ds[y], lag=lag, win_size=win_size, win_geom=win_geom)
-                else:
-                    tex_res = fun(out_ds[b], lag=lag, win_size=win_size, win_geom=win_geom)
-
-            out_ds[tex_res.name] = tex_res
+    for tex_res in _calculate_textures(xrds, textures, diff_cache_bytes=diff_cache_bytes, n_jobs=n_jobs,
+                                       executor=executor):
+        out_ds[tex_res.name] = tex_res
 
     return out_ds